@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import datetime
+import functools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+SCALES = (10, 1_000, 100_000)
+
+# Largest scale run per suite, beyond it the suite is skipped (e.g. 100k mosaics would take hours):
+MAX_SCALE = {
+    'pairs': None,
+    'search-batch': 10_000,
+    'write': 1_000,
+    'write-cog': 1_000,
+    'write-zarr': 1_000,
+    'database-insert': None,
+    'database-query': None,
+    'export-geoparquet': None,
+}
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  SUITES
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+# Each suite takes the scale and a scratch folder, prepares its inputs and returns run(), which does the
+# measured work once and returns the number of items processed.
+
+
+def pairs(n, folder):
+    from skreddata import search
+    prods = [p['properties'] for p in synthetic.fake_products(n)]
+    t_0, t_1 = synthetic.START, synthetic.START + datetime.timedelta(days=365*5)
+
+    def run():
+        search._pairs_from_products(prods, t_0, t_1)
+        return n
+    return run
+
+
+def search_batch(n, folder):
+    from skreddata import search
+    prods = synthetic.fake_products(300)
+    aois, tois = synthetic.fake_aois(n)
+
+    def run():
+        with synthetic.fake_search(search, prods):
+            search.search_grd_pairs_batch(aois, tois, workers=1)
+        return n
+    return run
+
+
+def _shape(n):
+    # Sample images of 256x256 with 2 tiles of 128x128 per side:
+    return (256, 256), (128, 128)
+
+
+def write(n, folder, output_format='gtiff'):
+    from skreddata import writers, storage
+    shape, tile_shape = _shape(n)
+    tile_pair = [synthetic.fake_tiles(shape, tile_shape, seed=i) for i in range(2)]
+    grid = synthetic.fake_grid(shape)
+
+    def run():
+        with synthetic.fake_raster(writers):
+            for i in range(n):
+                fn = storage.sample_path(folder, f'{i:06d}', 'crs', output_format)
+                os.makedirs(os.path.dirname(fn), exist_ok=True)
+                writers.write_pair(tile_pair, fn, grid, output_format)
+                writers.write_dem(tile_pair[0], fn.replace('_crs', '_dem'), grid, output_format)
+        return n
+    return run
+
+
+def database_insert(n, folder):
+    from skreddata import database
+    items = synthetic.fake_items(n)
+
+    def run():
+        fn = os.path.join(folder, f'insert-{time.perf_counter_ns()}.sqlite')
+        database.open_database(f'sqlite:///{fn}').upsert_many(items)
+        return n
+    return run
+
+
+def database_query(n, folder):
+    from skreddata import database
+    db = database.open_database(f'sqlite:///{os.path.join(folder, "query.sqlite")}')
+    db.upsert_many(synthetic.fake_items(n))
+    region = 'POLYGON ((18 68.5, 19 68.5, 19 69, 18 69, 18 68.5))'
+
+    def run():
+        count = 0
+        count += len(db.get_by_time_range('2020-03-01', '2020-04-01'))
+        count += len(db.get_by_region(region))
+        count += sum(1 for _ in db.iter_labeled(projection={'uuid': 1, 'label': 1}))
+        count += len(db.to_frame(geometry=False))
+        count += db.get_length_labeled()
+        return n
+    return run
+
+
+def export_geoparquet(n, folder):
+    # Label set export for syncing, partitioned by label and UTM zone:
+    from skreddata import database, export
+    db = database.open_database(f'sqlite:///{os.path.join(folder, "export.sqlite")}')
+    db.upsert_many(synthetic.fake_items(n))
+
+    def run():
+        return export.to_geoparquet(db, os.path.join(folder, 'labels.parquet'), partition_by=('label', 'utm_zone'))
+    return run
+
+
+SUITES = {
+    'pairs': pairs,
+    'search-batch': search_batch,
+    'write': write,
+    'write-cog': functools.partial(write, output_format='cog'),
+    'write-zarr': functools.partial(write, output_format='zarr'),
+    'database-insert': database_insert,
+    'database-query': database_query,
+    'export-geoparquet': export_geoparquet,
+}
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  RUN
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def measure(suite, n, repeat=3, memory=True):
+    folder = tempfile.mkdtemp(prefix=f'skreddata-bench-{suite}-')
+    try:
+        run = SUITES[suite](n, folder)
+
+        # Throughput from the best of <repeat> runs, peak Python/NumPy allocations from a separate
+        # traced run (tracing slows the run down):
+        times = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            items = run()
+            times.append(time.perf_counter() - t)
+        result = {
+            'items': items,
+            'seconds': min(times),
+            'items_per_second': items/max(min(times), 1e-9),
+        }
+        if memory:
+            tracemalloc.start()
+            run()
+            result['peak_mb'] = tracemalloc.get_traced_memory()[1]/1024**2
+            tracemalloc.stop()
+        return result
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run_all(suites, scales, repeat=3, memory=True):
+    results = {}
+    for suite in suites:
+        for n in scales:
+            if MAX_SCALE[suite] is not None and n > MAX_SCALE[suite]:
+                print(f'{suite:>16} {n:>8}  skipped (max scale {MAX_SCALE[suite]})')
+                continue
+            try:
+                res = measure(suite, n, repeat=repeat if n < 100_000 else 1, memory=memory)
+            except ImportError as e:
+                print(f'{suite:>16} {n:>8}  skipped ({e})')
+                continue
+            results[f'{suite}/{n}'] = res
+            peak = f'{res["peak_mb"]:10.1f} MB' if 'peak_mb' in res else ''
+            print(f'{suite:>16} {n:>8} {res["items_per_second"]:14.1f} items/s {res["seconds"]:10.3f} s {peak}')
+    return results
+
+
+def compare(results, baselines, tolerance=0.25):
+
+    # Regressions are runs slower (or using more memory) than the baseline by more than <tolerance>:
+    regressions = []
+    for key, res in results.items():
+        base = baselines.get('results', {}).get(key)
+        if base is None:
+            continue
+        speed = res['items_per_second']/base['items_per_second']
+        memory = res['peak_mb']/base['peak_mb'] if res.get('peak_mb') and base.get('peak_mb') else None
+        line = f'{key:>24}  speed x{speed:.2f}' + (f'  memory x{memory:.2f}' if memory is not None else '')
+        if speed < 1 - tolerance or (memory is not None and memory > 1 + tolerance):
+            regressions.append(key)
+            line += '  REGRESSION'
+        print(line)
+    return regressions
+
+
+def machine():
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+if __name__ == '__main__':
+
+    p = argparse.ArgumentParser(description='Benchmark generation, database and storage hot paths on synthetic data. ')
+    p.add_argument('--suites', nargs='+', default=list(SUITES), choices=list(SUITES), help='Suites to run. ')
+    p.add_argument('--scales', nargs='+', type=int, default=list(SCALES), help='Number of items per suite. ')
+    p.add_argument('--repeat', type=int, default=3, help='Timed runs per suite and scale, the best is kept. ')
+    p.add_argument('--no-memory', action='store_true', help='Skip the traced run for peak memory. ')
+    p.add_argument('--baselines', type=str, default=BASELINES, help='Baselines file. ')
+    p.add_argument('--save', action='store_true', help='Store the results as new baselines. ')
+    p.add_argument('--compare', action='store_true', help='Compare with stored baselines, exit with 1 on regressions. ')
+    p.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown/memory growth. ')
+    args = p.parse_args()
+
+    results = run_all(args.suites, args.scales, repeat=args.repeat, memory=not args.no_memory)
+
+    if args.compare:
+        if not os.path.exists(args.baselines):
+            sys.exit(f'No baselines in {args.baselines}, run with --save first')
+        with open(args.baselines) as fp:
+            baselines = json.load(fp)
+        regressions = compare(results, baselines, tolerance=args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regressions: {regressions}')
+            sys.exit(1)
+
+    if args.save:
+        baselines = {'results': {}}
+        if os.path.exists(args.baselines):
+            with open(args.baselines) as fp:
+                baselines = json.load(fp)
+        baselines['results'].update(results)
+        baselines['machine'] = machine()
+        baselines['time'] = datetime.datetime.now().isoformat()
+        with open(args.baselines, 'w') as fp:
+            json.dump(baselines, fp, indent=2, sort_keys=True)
+        print(f'Baselines written to {args.baselines}')
@@ -0,0 +1,169 @@
+import datetime
+import contextlib
+from unittest import mock
+import numpy as np
+
+
+# Synthetic stand-ins for the benchmarks: ASF search results, geocoded tiles and database items. Nothing
+# here touches the network or a Mongo server.
+
+
+START = datetime.datetime(2020, 1, 1, 5, 10)
+BANDS = ('VV', 'VH')
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  ASF SEARCH RESULTS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def _footprint(lon, lat, size=1.0):
+    return {
+        'type': 'Polygon',
+        'coordinates': [[[lon, lat], [lon + size, lat], [lon + size, lat + size], [lon, lat + size], [lon, lat]]]
+    }
+
+
+def fake_products(n, paths=(29, 58, 102, 131, 160), frames=3, seed=0):
+
+    # Search results as returned by ASF: passes every 6 days per relative orbit, <frames> consecutive
+    # frames per pass, in random order:
+    rng = np.random.default_rng(seed)
+    prods = []
+    k = 0
+    while len(prods) < n:
+        for path in paths:
+            t = START + datetime.timedelta(days=6*k, minutes=int(path) % 13)
+            for f in range(frames):
+                s = t + datetime.timedelta(seconds=25*f)
+                prods.append({
+                    'properties': {
+                        'pathNumber': int(path),
+                        'startTime': s.isoformat() + '.000Z',
+                        'stopTime': (s + datetime.timedelta(seconds=26)).isoformat() + '.000Z',
+                        'fileID': f'S1A_{path}_{k:05d}_{f}-GRD_HD',
+                        'fileName': f'S1A_{path}_{k:05d}_{f}.zip',
+                        'url': f'https://example.invalid/S1A_{path}_{k:05d}_{f}.zip',
+                    },
+                    'geometry': _footprint(18.0 + 0.2*(path % 5), 68.5 + 0.3*f),
+                })
+        k += 1
+    prods = prods[:n]
+    return [prods[i] for i in rng.permutation(len(prods))]
+
+
+def fake_aois(n, seed=0):
+    # Small AOIs (WKT) spread over northern Norway, with 30-day times of interest:
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(16, 22, n)
+    lat = rng.uniform(68, 70, n)
+    t_0 = [START + datetime.timedelta(days=int(d)) for d in rng.integers(0, 300, n)]
+    aois = [
+        f'POLYGON (({x} {y}, {x + 0.02} {y}, {x + 0.02} {y + 0.01}, {x} {y + 0.01}, {x} {y}))'
+        for x, y in zip(lon, lat)
+    ]
+    return aois, [[t, t + datetime.timedelta(days=30)] for t in t_0]
+
+
+def _search_polygon(aoi, space_buffer):
+    # Buffered in degrees (about <space_buffer> meters north-south), standing in for gtile's buffer in UTM:
+    import shapely.wkt
+    import shapely.geometry
+    return shapely.geometry.polygon.orient(shapely.wkt.loads(aoi).buffer(space_buffer/111_000))
+
+
+@contextlib.contextmanager
+def fake_search(search, products):
+    # Every ASF search returns <products>, without network or search cache:
+    def asf_search(query, cache=None, fetch_config=None):
+        return products
+    with mock.patch.multiple(search, _asf_search=asf_search, _search_polygon=_search_polygon):
+        yield
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  TILES
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def fake_tiles(shape, tile_shape=(256, 256), bands=BANDS, seed=0):
+
+    # Geocoded tiles covering an image of <shape>, as structured arrays keyed by tile index:
+    rng = np.random.default_rng(seed)
+    dtype = np.dtype([(b, np.float32) for b in bands])
+    tiles = {}
+    for r in range(0, shape[0], tile_shape[0]):
+        for c in range(0, shape[1], tile_shape[1]):
+            tile = np.empty(tile_shape, dtype=dtype)
+            for b in bands:
+                tile[b] = rng.random(tile_shape, dtype=np.float32)
+            tiles[(r//tile_shape[0], c//tile_shape[1])] = tile
+    return tiles
+
+
+def fake_grid(shape):
+    return {'shape': tuple(shape), 'origin': (500_000.0, 7_600_000.0), 'samplespacing': (10.0, 10.0)}
+
+
+def _mosaic_tiles(tiles, mosaicing_kws=None):
+    # Places tiles on the grid, standing in for gtile's resampling mosaic:
+    grid = mosaicing_kws['grid']
+    tile = next(iter(tiles.values()))
+    out = np.zeros(grid['shape'], dtype=tile.dtype)
+    for (i, j), t in tiles.items():
+        r, c = i*t.shape[0], j*t.shape[1]
+        h, w = min(t.shape[0], out.shape[0] - r), min(t.shape[1], out.shape[1] - c)
+        if h > 0 and w > 0:
+            out[r:r + h, c:c + w] = t[:h, :w]
+    return out
+
+
+def _merge_pair(mosaic_pair):
+    # Bands of both dates in one structured array, as <band>_<date>:
+    dtype = np.dtype([(f'{n}_{i}', dr.dtype[n]) for i, dr in enumerate(mosaic_pair) for n in dr.dtype.names])
+    out = np.empty(mosaic_pair[0].shape, dtype=dtype)
+    for i, dr in enumerate(mosaic_pair):
+        for n in dr.dtype.names:
+            out[f'{n}_{i}'] = dr[n]
+    return out
+
+
+def _to_bands(dr):
+    return np.stack([dr[n] for n in dr.dtype.names])
+
+
+def _write_crs(dr, fn):
+    # Multi-band float32 GeoTIFF, as written by fileformats.write_crs:
+    import rasterio
+    import rasterio.transform
+    bands = np.stack([dr[n] for n in dr.dtype.names])
+    with rasterio.open(
+            fn, 'w', driver='GTiff', width=bands.shape[2], height=bands.shape[1], count=bands.shape[0],
+            dtype=bands.dtype, crs='EPSG:32633', transform=rasterio.transform.from_origin(500_000, 7_600_000, 10, 10)) as ds:
+        ds.write(bands)
+        ds.descriptions = dr.dtype.names
+    return fn
+
+
+@contextlib.contextmanager
+def fake_raster(writers):
+    # gdar/gtile raster functions used by the writers (skreddata.writers), on plain structured arrays:
+    with mock.patch.multiple(writers, mosaic_tiles=_mosaic_tiles, merge_pair=_merge_pair, to_bands=_to_bands,
+            write_crs=_write_crs):
+        yield
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  DATABASE ITEMS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def fake_items(n, seed=0):
+    from skreddata import database
+    aois, tois = fake_aois(n, seed)
+    rng = np.random.default_rng(seed)
+    labels = rng.choice([None, 0, 1], n)
+    return [
+        database.Item(uuid=f'{i:010x}', geometry=aoi, t_0=t_0, t_1=t_1, label=label, comment='benchmark')
+        for i, (aoi, (t_0, t_1), label) in enumerate(zip(aois, tois, labels))
+    ]
@@ -0,0 +1,122 @@
+import os
+import json
+import contextlib
+import time
+import sqlite3
+import hashlib
+import datetime as dt
+import dataclasses
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheMiss(KeyError):
+    pass
+
+
+def _canonical(obj):
+    if isinstance(obj, (dt.datetime, dt.date)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def query_key(query):
+    ser = json.dumps(query, sort_keys=True, separators=(',', ':'), default=_canonical)
+    return hashlib.sha256(ser.encode('utf-8')).hexdigest()
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  SEARCH CACHE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+@dataclasses.dataclass(frozen=False)
+class SearchCache:
+    path: str
+    ttl: float = 30*24*3600          # Seconds, None for no expiry
+    max_bytes: int = 512*1024**2     # Total payload size before LRU eviction, None for no limit
+    offline: bool = False            # Never call the remote search, raise CacheMiss instead
+
+    def __post_init__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as con:
+            con.execute('''
+                CREATE TABLE IF NOT EXISTS searches (
+                    key TEXT PRIMARY KEY,
+                    query TEXT,
+                    result TEXT,
+                    size INTEGER,
+                    created REAL,
+                    accessed REAL
+                )''')
+            con.execute('CREATE INDEX IF NOT EXISTS searches_accessed ON searches (accessed)')
+
+    @classmethod
+    def in_folder(cls, folder, **kwargs):
+        return cls(os.path.join(folder, '.cache', 'search.sqlite'), **kwargs)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=60)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def get(self, query):
+        key = query_key(query)
+        with self._connect() as con:
+            row = con.execute('SELECT result, created FROM searches WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            result, created = row
+            if self.ttl is not None and time.time() - created > self.ttl and not self.offline:
+                con.execute('DELETE FROM searches WHERE key = ?', (key,))
+                return None
+            con.execute('UPDATE searches SET accessed = ? WHERE key = ?', (time.time(), key))
+        return json.loads(result)
+
+    def put(self, query, result):
+        key = query_key(query)
+        ser = json.dumps(result, default=_canonical)
+        now = time.time()
+        with self._connect() as con:
+            con.execute(
+                'INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?, ?)',
+                (key, json.dumps(query, sort_keys=True, default=_canonical), ser, len(ser), now, now)
+            )
+            self._evict(con)
+
+    def _evict(self, con):
+        if self.max_bytes is None:
+            return
+        total = con.execute('SELECT COALESCE(SUM(size), 0) FROM searches').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in con.execute('SELECT key, size FROM searches ORDER BY accessed ASC').fetchall():
+            con.execute('DELETE FROM searches WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def search(self, query, search):
+        result = self.get(query)
+        if result is not None:
+            logger.debug(f'Search cache hit: {query_key(query)}')
+            return result
+        if self.offline:
+            raise CacheMiss(f'Search not in cache and running offline: {query}')
+        result = search(query)
+        self.put(query, result)
+        return result
+
+    def clear(self):
+        with self._connect() as con:
+            con.execute('DELETE FROM searches')
+
+    def __len__(self):
+        with self._connect() as con:
+            return con.execute('SELECT COUNT(*) FROM searches').fetchone()[0]
@@ -1 +1 @@
-from . import gen
\ No newline at end of file
+from . import gen, pack, db
\ No newline at end of file
@@ -0,0 +1,166 @@
+import typer
+from typing import Optional, List
+from pathlib import Path
+import logging
+
+
+app = typer.Typer(no_args_is_help=True, name=__name__.split('.')[-1], help='SKREDDATA database queries')
+logger = logging.getLogger(__name__)
+
+
+# Filter options shared by the commands. Only the database module is imported, the geospatial stack
+# is loaded for --region only:
+DATABASE = typer.Option(None, '--database', help='Database URL (mongodb://host:port, sqlite:///path or memory://). Taken from SKREDDATA_DATABASE, or the local MongoDB, if not given. ')
+LABEL = typer.Option(None, help='Only items with this label. ')
+LABELED = typer.Option(None, '--labeled/--unlabeled', help='Only labeled or unlabeled items. ')
+T0 = typer.Option(None, help='Only items ending at or after this time. ')
+T1 = typer.Option(None, help='Only items starting at or before this time. ')
+REGION = typer.Option(None, help='Only items intersecting this region, as WKT or a GeoJSON file. ')
+UUID_PREFIX = typer.Option(None, help='Only items with UUIDs starting with this. ')
+
+
+def _region(region):
+    import os
+    import json
+    if not os.path.exists(region):
+        return region
+
+    # GeoJSON file with a geometry, feature or feature collection (as the union of its features):
+    with open(region) as fp:
+        geojson = json.load(fp)
+    if geojson.get('type') == 'Feature':
+        return geojson['geometry']
+    if geojson.get('type') == 'FeatureCollection':
+        import shapely.geometry
+        import shapely.ops
+        return shapely.ops.unary_union([shapely.geometry.shape(f['geometry']) for f in geojson['features']])
+    return geojson
+
+
+def _open(database_url, label, labeled, t0, t1, region, uuid_prefix):
+    from skreddata import database
+    filter = database.make_filter(
+        label=label,
+        labeled=labeled,
+        t_0=t0,
+        t_1=t1,
+        region=_region(region) if region is not None else None,
+        uuid_prefix=uuid_prefix
+    )
+    db = database.open_database(database_url)
+    if region is not None:
+        db.check_locations()
+    return db, filter
+
+
+@app.command()
+def count(
+          database_url: Optional[str] = DATABASE,
+          label: Optional[int] = LABEL,
+          labeled: Optional[bool] = LABELED,
+          t0: Optional[str] = T0,
+          t1: Optional[str] = T1,
+          region: Optional[str] = REGION,
+          uuid_prefix: Optional[str] = UUID_PREFIX,
+          by_label: Optional[bool] = typer.Option(False, help='Count per label. '),
+     ):
+
+     from skreddata import database
+
+     db, filter = _open(database_url, label, labeled, t0, t1, region, uuid_prefix)
+     if not by_label:
+          typer.echo(db.count(filter))
+          return
+
+     for _label, description in database.LABEL_DESCRIPTION.items():
+          typer.echo(f'{_label}\t{db.count({"$and": [filter, {"label": _label}]})}\t{description}')
+     typer.echo(f'-\t{db.count({"$and": [filter, database.UNLABELED]})}\tUnlabeled')
+
+
+@app.command(name='list')
+def list_(
+          database_url: Optional[str] = DATABASE,
+          label: Optional[int] = LABEL,
+          labeled: Optional[bool] = LABELED,
+          t0: Optional[str] = T0,
+          t1: Optional[str] = T1,
+          region: Optional[str] = REGION,
+          uuid_prefix: Optional[str] = UUID_PREFIX,
+          limit: Optional[int] = typer.Option(100, help='Maximum number of items listed, 0 for all. '),
+          json_lines: Optional[bool] = typer.Option(False, '--json', help='Print items as JSON lines. '),
+     ):
+
+     import json
+     import itertools
+     from skreddata import export
+
+     db, filter = _open(database_url, label, labeled, t0, t1, region, uuid_prefix)
+     projection = {name: 1 for name in export.COLUMNS if json_lines or name != 'geometry'}
+     docs = db.iterate(filter, projection=projection)
+     for doc in itertools.islice(docs, limit or None):
+          if json_lines:
+               typer.echo(json.dumps({name: export._value(doc.get(name)) for name in export.COLUMNS}))
+          else:
+               typer.echo('\t'.join(str(export._value(doc.get(name))) for name in ('uuid', 'label', 't_0', 't_1', 'comment')))
+
+
+@app.command(name='export')
+def export_(
+          target: Path = typer.Argument(..., help='Target file, .jsonl, .geojson, .csv or .parquet (GeoParquet, a folder when partitioned). '),
+          database_url: Optional[str] = DATABASE,
+          label: Optional[int] = LABEL,
+          labeled: Optional[bool] = LABELED,
+          t0: Optional[str] = T0,
+          t1: Optional[str] = T1,
+          region: Optional[str] = REGION,
+          uuid_prefix: Optional[str] = UUID_PREFIX,
+          format: Optional[str] = typer.Option(None, help='Output format (jsonl, geojson, csv or parquet). Taken from the target suffix if not given. '),
+          partition_by: Optional[List[str]] = typer.Option([], help='GeoParquet partitions, label, utm_zone and/or year (repeat the option for several). '),
+     ):
+
+     from skreddata import export
+
+     db, filter = _open(database_url, label, labeled, t0, t1, region, uuid_prefix)
+     n = export.export(db, target, filter=filter, format=format, partition_by=tuple(partition_by))
+     logger.info(f'Exported {n} items to {target}')
+
+
+@app.command()
+def ingest(
+          source: Path = typer.Argument(..., help='GeoParquet export (file or partitioned folder), or a GeoJSON file with the exported columns. '),
+          database_url: Optional[str] = DATABASE,
+     ):
+
+     from skreddata import database, export
+
+     db = database.open_database(database_url)
+     n = export.ingest(db, source)
+     logger.info(f'Upserted {n} items from {source}')
+
+
+@app.command()
+def index(
+          database_url: Optional[str] = DATABASE,
+     ):
+
+     from skreddata import database
+
+     db = database.open_database(database_url)
+     db.create_indexes()
+     logger.info('Created indexes (uuid, label, time and location)')
+
+
+@app.command()
+def migrate(
+          database_url: Optional[str] = DATABASE,
+     ):
+
+     from skreddata import database
+
+     db = database.open_database(database_url)
+     n = db.migrate_locations()
+     logger.info(f'Added locations to {n} items')
+
+
+if __name__ == "__main__":
+    app()
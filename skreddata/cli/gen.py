@@ -10,7 +10,7 @@ logger = logging.getLogger(__name__)
 
 @app.command()
 def from_geojson( 
-          file: Path = typer.Argument(..., help='Input GeoJSON-file. '), 
+          file: Path = typer.Argument(..., help='Input GeoJSON-file, or GeoParquet (file or partitioned folder) as exported by db export. '), 
           target: Path = typer.Argument(..., help='Target folder. '),  
           t0: Optional[str] = typer.Option('t_0', help='Column name representing start times. '), 
           t1: Optional[str] = typer.Option('t_1', help='Column name representing end times. '), 
@@ -21,14 +21,41 @@ def from_geojson(
           shape: Optional[int] = typer.Option(1024, help='Image shape (assumed same in x and y). '),
           print: Optional[bool] = typer.Option(True, help='Print output. '), 
           force: Optional[bool] = typer.Option(False, help='Force processing even if item exists in database. '), 
+          database_url: Optional[str] = typer.Option(None, '--database', help='Database URL (mongodb://host:port, sqlite:///path or memory://). Taken from SKREDDATA_DATABASE, or the local MongoDB, if not given. '), 
+          verify_checksums: Optional[bool] = typer.Option(False, help='Verify checksums of completed stages when resuming, instead of only their sizes. '), 
+          batch_search: Optional[bool] = typer.Option(True, help='Search S1-pairs for all rows with merged queries over clusters of nearby AOIs. '), 
+          search_cache: Optional[bool] = typer.Option(True, help='Cache search results under the target folder. '), 
+          search_cache_ttl: Optional[float] = typer.Option(30, help='Days before cached search results expire. '), 
+          search_cache_size: Optional[int] = typer.Option(512, help='Maximum size of cached search results in MB. '), 
+          offline: Optional[bool] = typer.Option(False, help='Only use cached search results, never query ASF. '), 
+          max_in_flight: Optional[int] = typer.Option(32, help='Maximum number of UUIDs submitted for processing at a time. '), 
+          planning_workers: Optional[int] = typer.Option(8, help='Number of rows planned (searched, checked and turned into graphs) concurrently. '), 
+          insert_batch: Optional[int] = typer.Option(32, help='Number of finished UUIDs written to the database per bulk upsert. '), 
+          tile_cache_size: Optional[int] = typer.Option(None, help='Maximum number of shared tiles kept in memory per process. Default: as many as fit in a quarter of the worker memory. '), 
+          tile_cache_disk: Optional[bool] = typer.Option(False, help='Also keep shared tiles on disk under the target folder. Scenes of tiles on disk when a sample is planned are not downloaded again. '), 
+          crop: Optional[bool] = typer.Option(False, help='Geocode on tiles sized to the image shape, instead of full 2048x2048 tiles. Samples differ slightly from those geocoded on full tiles. '), 
+          output_format: Optional[str] = typer.Option('gtiff', help='Raster output format: gtiff, cog (tiled, compressed cloud-optimized GeoTIFF) or zarr (chunked store). '), 
+          stack: Optional[bool] = typer.Option(False, help='Write one time-series stack (Zarr cube of all dates) per AOI and orbit path, with pairs as views on it, instead of one file per pair. '), 
+          snap_grids: Optional[bool] = typer.Option(False, help='Snap sample grids to a lattice shared by all samples in the same UTM zone, so nearby samples are pixel aligned. '), 
+          cluster_extent: Optional[int] = typer.Option(0, help='Group nearby samples (implies --snap-grids) into clusters spanning at most this many meters, mosaicked once and cut into samples. Cluster mosaics are kept under <target>/.clusters until all samples are done. 0 disables clustering. '), 
+          async_fetch: Optional[bool] = typer.Option(False, help='Search and download with the async client (Earthdata token from $EARTHDATA_TOKEN), downloads start as samples are planned. '), 
+          fetch_per_host: Optional[int] = typer.Option(4, help='Maximum number of concurrent connections per host with --async-fetch. '), 
+          metrics_file: Optional[str] = typer.Option(None, '--metrics', help='JSON lines file for per-stage metrics (time, memory, bytes, cache hits per UUID). Default: <target>/metrics.jsonl. '), 
+          performance_report: Optional[str] = typer.Option(None, help='Dask performance report (HTML) written when a distributed client is active. Default: <target>/dask-report.html. '), 
+          profile: Optional[str] = typer.Option('threads', help='Execution profile: threads (active client or threaded scheduler), processes (local cluster with an I/O worker and one process per core for geocoding and mosaicking, sized from the tile shape) or distributed (scheduler at --scheduler). '), 
+          scheduler: Optional[str] = typer.Option(None, help='Scheduler address of the distributed profile. '), 
+          cpu_workers: Optional[int] = typer.Option(None, help='CPU worker processes of the processes profile. Default: as many cores as fit in memory. '), 
+          io_threads: Optional[int] = typer.Option(32, help='Threads of the I/O worker of the processes profile. '), 
+          memory: Optional[float] = typer.Option(None, help='Memory in GB available to the processes profile. Default: physical memory. '), 
      ):
           
      import os
+     import shutil
+     import itertools
+     import contextlib
+     import concurrent.futures
      from gdar import coordinates, meta
-     from skreddata import generate, database
-     import geopandas as gpd
-     import dask
-     from dask import distributed
+     from skreddata import generate, database, cache, stream, tilecache, fetch, metrics, profiles, export, tiling, manifest
      from rich.pretty import pprint
      
      if epsg is not None: 
@@ -42,39 +69,201 @@ def from_geojson(
      else: 
           refsys = None
      
-     df = gpd.read_file(file)
-     db = database.Database()
+     df = export.read_frame(file)
+     db = database.open_database(database_url)
      os.makedirs(target, exist_ok=True)
-     output = {}
-     for i in range(len(df)): 
-          
-          row = df.iloc[i]
-          
-          # Check database for UUID if given: 
-          if not force and uuid is not None and db.get_by_uuid(row[uuid]) is not None:
-               logger.info(f'UUID exists in database, skipping UUID={row[uuid]}')
-               continue 
-          
-          # Generate data: 
-          res = generate.main(
-               aoi=row.geometry, 
-               toi=[row[t0], row[t1]], 
-               folder=target, 
-               refsys=refsys, 
-               shape=(shape, shape), 
-               uuid=str(row[uuid]) if uuid is not None else None, 
-               label=row[label] if label is not None else None, 
-               comment=row[comment] if comment is not None else None, 
-               force=force
+     
+     # Search cache: 
+     if search_cache or offline: 
+          _cache = cache.SearchCache.in_folder(
+               target, 
+               ttl=search_cache_ttl*24*3600 if search_cache_ttl is not None else None, 
+               max_bytes=search_cache_size*1024**2 if search_cache_size is not None else None, 
+               offline=offline
           )
+     else: 
+          _cache = None
+     
+     # Workers of the execution profile, started before planning as tasks are annotated for the resources 
+     # they hold. Memory is sized from the largest mosaic (cluster or sample) and geocoding tile: 
+     tile_shape = tiling.cropped_tile_shape((shape, shape)) if crop else tiling.TILE_SHAPE
+     mosaic_shape = (shape + cluster_extent//10, )*2 if cluster_extent and not stack else (shape, shape)
+     profile_client = profiles.start(
+          profile, 
+          tile_shape, 
+          mosaic_shape, 
+          address=scheduler, 
+          cores=cpu_workers, 
+          memory=int(memory*1024**3) if memory is not None else None, 
+          io_threads=io_threads
+     )
+     
+     # Metrics of this run, also written by the workers of a distributed client: 
+     metrics_file = os.path.join(target, 'metrics.jsonl') if metrics_file is None else metrics_file
+     run = metrics.configure(metrics_file)
+     client = stream._active_client() if profile_client is None else profile_client
+     if client is not None: 
+          client.run(metrics.configure, metrics_file, run)
+          report = os.path.join(target, 'dask-report.html') if performance_report is None else performance_report
+     
+     # Tiles shared between samples, cached in a share of each worker's memory unless sized explicitly: 
+     tile_cache = tilecache.Config(
+          max_items=profiles.tile_cache_items(tile_shape, profiles.worker_memory(client)) if tile_cache_size is None else tile_cache_size, 
+          folder=os.path.join(target, '.cache', 'tiles') if tile_cache_disk else None
+     )
+     logger.info(f'Tile cache: {tile_cache}')
+     
+     # Async search and download client, downloads are kept under the target folder: 
+     if async_fetch: 
+          fetch_config = fetch.Config(per_host=fetch_per_host)
+          download_folder = os.path.join(target, '.cache', 'downloads')
+     else: 
+          fetch_config = None
+          download_folder = None
+     
+     # Rows to process, as records (row access through df.iloc is slow for large inputs): 
+     df = df.assign(_wkt=df.geometry.to_wkt())
+     rows = df.to_dict('records')
+     
+     # Check database for UUIDs if given, in bulk. Rows are skipped before searching only if done (complete 
+     # manifest), others are resumed from their manifests. Stacks and multi-pair samples have UUIDs of their 
+     # own, and are checked when planned: 
+     if not force and uuid is not None and not stack: 
+          uuids = [str(row[uuid]) for row in rows]
+          existing = set()
+          for i in range(0, len(uuids), 10_000): 
+               existing.update(doc['uuid'] for doc in db.iterate({'uuid': {'$in': uuids[i:i + 10_000]}}, projection={'uuid': 1}))
+          verify = 'checksum' if verify_checksums else 'size'
+          done = {_uuid for _uuid in existing if manifest.complete(target, _uuid, verify=verify)}
+          for _uuid in done: 
+               logger.info(f'UUID exists in database, skipping UUID={_uuid}')
+          rows = [row for row, _uuid in zip(rows, uuids) if _uuid not in done]
+     
+     # Search pairs for all rows at once: 
+     if batch_search: 
+          pairs = generate.search_grd_pairs_batch(
+               [row['_wkt'] for row in rows], 
+               [[row[t0], row[t1]] for row in rows], 
+               cache=_cache, 
+               workers=planning_workers, 
+               fetch_config=fetch_config
+          )
+     else: 
+          pairs = [None]*len(rows)
+     
+     # Clusters of nearby samples sharing one mosaic: 
+     if cluster_extent: 
+          clusters = generate.plan_clusters([row['_wkt'] for row in rows], refsys=refsys, shape=(shape, shape), max_extent=cluster_extent)
+          logger.info(f'{sum(c is not None for c in clusters)} of {len(rows)} samples in {len({c["key"] for c in clusters if c is not None})} clusters')
+     else: 
+          clusters = [None]*len(rows)
+     
+     # Graph for one row: 
+     def plan(row, _pairs, _cluster): 
+          with metrics.measure('plan', str(row[uuid]) if uuid is not None else None): 
+               return generate.main(
+                    aoi=row['geometry'], 
+                    toi=[row[t0], row[t1]], 
+                    folder=target, 
+                    refsys=refsys, 
+                    shape=(shape, shape), 
+                    uuid=str(row[uuid]) if uuid is not None else None, 
+                    label=row[label] if label is not None else None, 
+                    comment=row[comment] if comment is not None else None, 
+                    force=force, 
+                    pairs=_pairs, 
+                    search_cache=_cache, 
+                    tile_cache=tile_cache, 
+                    crop=crop, 
+                    output_format=output_format, 
+                    insert=False, 
+                    database_url=database_url, 
+                    verify='checksum' if verify_checksums else 'size', 
+                    download_folder=download_folder, 
+                    fetch_config=fetch_config, 
+                    stack=stack, 
+                    snap=snap_grids, 
+                    cluster=_cluster
+               )
+     
+     # Rows are planned concurrently (searches, database and manifest checks are I/O bound), a bounded 
+     # number ahead of the streaming executor, and each graph is handed over as soon as it is planned: 
+     def tasks(): 
+          remaining = iter(zip(rows, pairs, clusters))
+          with concurrent.futures.ThreadPoolExecutor(planning_workers) as pool: 
+               
+               def submit(n): 
+                    return {pool.submit(plan, *args) for args in itertools.islice(remaining, n)}
+               
+               pending = submit(2*planning_workers)
+               while pending: 
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    pending |= submit(len(done))
+                    for future in done: 
+                         try: 
+                              res = future.result()
+                         except Exception: 
+                              logger.exception('Failed planning row')
+                              unplanned.append(future)
+                              continue
+                         yield from res.items()
+     
+     # Finished UUIDs are committed to the database in bulk, as soon as a batch of them have their files: 
+     output = {}
+     failed = []
+     unplanned = []
+     finished = []
+     
+     def insert(items): 
+          from pymongo.errors import BulkWriteError
+          with metrics.measure('insert', items=len(items)): 
+               try: 
+                    db.upsert_many(items)
+               except BulkWriteError as e: 
+                    
+                    # Writes are unordered, so only the items reported (by index) are missing: 
+                    uuids = [items[error['index']].uuid for error in e.details.get('writeErrors', [])]
+                    logger.error(f'Failed inserting {len(uuids)} of {len(items)} items in database: {uuids}')
+                    failed.extend(uuids)
+     
+     # Task stream and scheduler activity of a distributed run are also kept in a dask performance report: 
+     if client is not None: 
+          from dask import distributed
+          reporting = distributed.performance_report(filename=report)
+     else: 
+          reporting = contextlib.nullcontext()
+     
+     # Workers of the profile are stopped however the run ends: 
+     try: 
+          with reporting: 
+               for key, res, error in stream.compute_streaming(tasks(), max_in_flight=max_in_flight, client=client): 
+                    if error is not None: 
+                         failed.append(key)
+                         continue
+                    logger.info(f'Finished UUID={key}')
+                    output[key] = res
+                    finished.extend(res['database_items'] if 'database_items' in res else [res['database_item']])
+                    if len(finished) >= insert_batch: 
+                         insert(finished)
+                         finished = []
           
-          output.update(res)
+          if finished: 
+               insert(finished)
+     finally: 
+          profiles.stop(profile_client)
+     
+     # Cluster mosaics are scratch files, kept for resuming until every sample has been cut from them: 
+     if cluster_extent and not failed and not unplanned: 
+          shutil.rmtree(os.path.join(target, '.clusters'), ignore_errors=True)
      
-     #cluster = distributed.LocalCluster()
-     #with distributed.Client(cluster):
-     #with dask.config.set(scheduler='threads'):
+     if failed: 
+          logger.warning(f'Failed processing {len(failed)} UUIDs: {failed}')
      
-     output = dask.compute(output)[0] 
+     # Per-stage summary of the run: 
+     summary = metrics.summarize(metrics.load(metrics_file, run))
+     logger.info(f'Metrics summary (run {run}, records in {metrics_file}): {summary}')
+     if summary: 
+          pprint(summary)
      
      if print: 
           pprint(output)
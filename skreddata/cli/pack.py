@@ -0,0 +1,31 @@
+import typer
+from typing import Optional
+from pathlib import Path
+import logging
+
+
+app = typer.Typer(no_args_is_help=True, name=__name__.split('.')[-1], help='SKREDDATA dataset packing')
+logger = logging.getLogger(__name__)
+
+
+@app.command()
+def hdf5( 
+          folder: Path = typer.Argument(..., help='Folder with generated samples. '), 
+          target: Path = typer.Argument(..., help='Target HDF5-file. '), 
+          labeled: Optional[bool] = typer.Option(False, help='Only pack labeled samples. '), 
+          database_url: Optional[str] = typer.Option(None, '--database', help='Database URL (mongodb://host:port, sqlite:///path or memory://). Taken from SKREDDATA_DATABASE, or the local MongoDB, if not given. '), 
+          compression: Optional[str] = typer.Option(None, help='HDF5 compression (e.g. gzip or lzf). Uncompressed layers are contiguous and can be memory mapped. '), 
+     ):
+     
+     from skreddata import database, pack
+     
+     db = database.open_database(database_url)
+     items = db.get_all_labeled() if labeled else db.get_all()
+     pack.pack(items, folder, target, compression=compression)
+     
+     with pack.PackedDataset(target) as ds: 
+          logger.info(f'Packed {len(ds)} samples into {target}')
+
+
+if __name__ == "__main__":
+    app()
@@ -1,15 +1,25 @@
 import dataclasses
-import shapely.geometry
-import shapely.wkt
-from dateutil import parser
 import datetime as dt
-from pymongo import MongoClient
-from bson.objectid import ObjectId
 import json
-import hashlib
+import os
+import re
+import numbers
+import sqlite3
+import functools
+import threading
+import logging
+import urllib.parse
 
 
-_DUMMY_STORE = {}
+# shapely, pymongo and dateutil are imported where used, so that queries by label, time and UUID
+# (e.g. the db commands of the CLI) start without the geospatial stack or a MongoDB driver.
+
+
+logger = logging.getLogger(__name__)
+
+
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
 
 
 LABEL_DESCRIPTION = {
@@ -21,10 +31,28 @@ LABEL_DESCRIPTION = {
 
 
 def _as_datetime(time):
-    return time if isinstance(time, dt.datetime) else parser.parse(time)
+    if isinstance(time, dt.datetime):
+        return time
+    
+    # Fast path for ISO 8601, with dateutil as fallback for anything else:
+    try:
+        return dt.datetime.fromisoformat(time[:-1] + '+00:00' if time.endswith('Z') else time)
+    except (TypeError, ValueError, AttributeError):
+        from dateutil import parser
+        return parser.parse(time)
+
 
+def _as_geojson(geometry):
+    import shapely.geometry
+    import shapely.wkt
+    if isinstance(geometry, dict):
+        return geometry
+    if isinstance(geometry, str):
+        geometry = shapely.wkt.loads(geometry)
+    return json.loads(json.dumps(shapely.geometry.mapping(geometry)))
 
-@dataclasses.dataclass(frozen=True)
+
+@dataclasses.dataclass(frozen=True, slots=True)
 class Item:
     uuid: str
     geometry: str
@@ -36,70 +64,157 @@ class Item:
     certainty: int = None
     source: str = None
     json: str = None
+    location: dict = None
     _id: str = None
 
     def __post_init__(self):
-        # Type casting:
-        if isinstance(self.geometry, shapely.geometry.base.BaseGeometry):
-            super().__setattr__('geometry', shapely.wkt.dumps(self.geometry))
+        # Type casting (WKT strings, the common case, without importing shapely):
+        if self.geometry is not None and not isinstance(self.geometry, (str, dict)):
+            import shapely.geometry
+            import shapely.wkt
+            if isinstance(self.geometry, shapely.geometry.base.BaseGeometry):
+                object.__setattr__(self, 'geometry', shapely.wkt.dumps(self.geometry))
 
         # Normalize time stamps unix time:
-        super().__setattr__('t_0', _as_datetime(self.t_0))
-        super().__setattr__('t_1', _as_datetime(self.t_1))
+        object.__setattr__(self, 't_0', _as_datetime(self.t_0))
+        object.__setattr__(self, 't_1', _as_datetime(self.t_1))
+
+        # Labels as plain integers (e.g. numpy integers from data frames):
+        for name in ('label', 'certainty'):
+            value = getattr(self, name)
+            if isinstance(value, numbers.Integral) and not isinstance(value, int):
+                object.__setattr__(self, name, int(value))
 
         # Dump json to string:
         if self.json is not None and not isinstance(self.json, str):
-            super().__setattr__('json', json.dumps(self.json))
+            object.__setattr__(self, 'json', json.dumps(self.json))
             
-        super().__setattr__('_id', str(self._id))
+        object.__setattr__(self, '_id', str(self._id))
     
     def asdict(self): 
-        return dataclasses.asdict(self)
+        return {name: getattr(self, name) for name in _ITEM_FIELDS}
 
+    def shape(self):
+        import shapely.wkt
+        return shapely.wkt.loads(self.geometry)
 
-@dataclasses.dataclass(frozen=False)
-class Database:
-    host: str = 'localhost'
-    port: int = 27017
-    database: str = 'skreddata'
-    collection: str = 'avl-v20230607'
 
-    def __post_init__(self):
-        client = MongoClient(self.host, self.port)
-        self.db = client[self.database]
-        self.collection = self.db[self.collection]
-        
-    def find(self, *args, **kwargs): 
-        items = []
-        cursor = self.collection.find(*args, **kwargs)
-        for item in cursor:
-            items.append(Item(**item))
-        return items
+_ITEM_FIELDS = tuple(f.name for f in dataclasses.fields(Item))
+
+
+def items_from_documents(docs):
     
-    def find_one(self, *args, **kwargs): 
-        item = self.collection.find_one(*args, **kwargs)
-        if item is not None: 
-            item = Item(**item)
-        return item
+    # Bulk conversion of cursor batches. Documents as stored (datetimes, WKT and JSON strings) are 
+    # set directly, anything else goes through the normalizing constructor: 
+    items = []
+    for doc in docs:
+        if isinstance(doc.get('t_0'), dt.datetime) and isinstance(doc.get('t_1'), dt.datetime) and \
+                isinstance(doc.get('geometry'), str) and isinstance(doc.get('json'), (str, type(None))):
+            item = object.__new__(Item)
+            for name in _ITEM_FIELDS:
+                object.__setattr__(item, name, doc.get(name))
+            object.__setattr__(item, '_id', str(item._id))
+        else:
+            item = Item(**doc)
+        items.append(item)
+    return items
+
+
+def get_client(host, port):
+    # One client (with its connection pool) per process and server, shared by all Database instances. 
+    # Keyed by PID as well since clients must not be shared across forks: 
+    key = (os.getpid(), host, port)
+    with _CLIENTS_LOCK:
+        if key not in _CLIENTS:
+            from pymongo import MongoClient
+            _CLIENTS[key] = MongoClient(host, port)
+        return _CLIENTS[key]
+
+
+def _as_document(item):
+    assert isinstance(item, (dict, Item))
+    item = Item(**item).asdict() if isinstance(item, dict) else item.asdict()
+    item.pop('_id')
+    
+    # GeoJSON copy of the geometry for spatial indexing, made when written rather than per Item: 
+    if item['location'] is None:
+        item['location'] = _as_geojson(item['geometry'])
+    return item
 
-    def insert(self, item):
-        assert isinstance(item, (dict, Item))
-        item = Item(**item).asdict() if isinstance(item, dict) else item.asdict()
-        item.pop('_id')
-        self.collection.insert_one(item)
 
-    def replace(self, item):
-        assert isinstance(item, (dict, Item))
-        item = Item(**item).asdict() if isinstance(item, dict) else item.asdict()
-        item.pop('_id')
-        self.collection.replace_one({'uuid': item['uuid']}, item)
+LABELED = {'label': {'$exists': True, '$ne': None}}
+UNLABELED = {'$or': [{'label': {'$exists': False}}, {'label': None}]}
+
+
+def _intersects(region):
+    return {'location': {'$geoIntersects': {'$geometry': _as_geojson(region)}}}
 
-    def remove_by_uuid(self, uuid):
-        self.collection.delete_one({'uuid': uuid})
+
+def _overlaps(t_0, t_1):
+    return {'$and': [{'t_0': {'$lte': _as_datetime(t_1)}}, {'t_1': {'$gte': _as_datetime(t_0)}}]}
+
+
+def make_filter(label=None, labeled=None, t_0=None, t_1=None, region=None, uuid_prefix=None):
+
+    # Filter where all given conditions hold. Items overlapping [t_0, t_1] are selected, either end
+    # may be left open. <region> as WKT, GeoJSON or shapely geometry:
+    clauses = []
+    if label is not None:
+        clauses.append({'label': label})
+    if labeled is not None:
+        clauses.append(LABELED if labeled else UNLABELED)
+    if t_0 is not None:
+        clauses.append({'t_1': {'$gte': _as_datetime(t_0)}})
+    if t_1 is not None:
+        clauses.append({'t_0': {'$lte': _as_datetime(t_1)}})
+    if region is not None:
+        clauses.append(_intersects(region))
+    if uuid_prefix is not None:
+        clauses.append({'uuid': {'$regex': '^' + re.escape(uuid_prefix)}})
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  QUERIES
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+class _Queries:
+    # Query API shared by the backends, built on their find, find_one, iter_batches and count:
+
+    def iterate(self, filter=None, projection=None, batch_size=1_000, raw=False): 
+        # Streams the cursor instead of building a list. Projected documents are incomplete items, 
+        # so they are always returned as raw documents: 
+        raw = raw or projection is not None
+        for batch in self.iter_batches(filter, projection, batch_size=batch_size): 
+            yield from batch if raw else items_from_documents(batch)
+
+    def to_frame(self, filter=None, projection=None, geometry=True, batch_size=1_000): 
+        import pandas as pd
+        
+        # Columns built in one pass over the cursor, without per-document Item parsing: 
+        columns = {}
+        n = 0
+        for batch in self.iter_batches(filter, projection, batch_size=batch_size): 
+            for doc in batch: 
+                doc.pop('_id', None)
+                for key in doc: 
+                    if key not in columns: 
+                        columns[key] = [None]*n
+                for key, values in columns.items(): 
+                    values.append(doc.get(key))
+                n += 1
+        df = pd.DataFrame(columns)
+        
+        if geometry and 'geometry' in df: 
+            import geopandas as gpd
+            df = gpd.GeoDataFrame(df.drop(columns=['geometry']), geometry=gpd.GeoSeries.from_wkt(df['geometry']), crs='epsg:4326')
+        return df
 
     def get_by_uuid(self, uuid):
-        item = self.collection.find_one({'uuid': uuid})
-        return None if item is None else Item(**item)
+        return self.find_one({'uuid': uuid})
 
     def get_by_label(self, label):
         return self.find({'label': label})
@@ -108,9 +223,33 @@ class Database:
         time = _as_datetime(time)
         return self.find({'$and': [{'t_0': {'$lte': time}}, {'t_1': {'$gte': time}}]})
 
+    def get_by_time_range(self, t_0, t_1):
+        return self.find(_overlaps(t_0, t_1))
+
+    def check_locations(self):
+        # Region queries miss items without locations (inserted before they were stored), checked once:
+        if getattr(self, '_unlocated', None) is None:
+            self._unlocated = self.count_unlocated()
+            if self._unlocated:
+                logger.warning(f'{self._unlocated} items have no location and are missed by region queries, '
+                    'add them with `skreddata db migrate`')
+        return self._unlocated
+
+    def get_by_region(self, region):
+        self.check_locations()
+        return self.find(_intersects(region))
+
+    def get_by_region_and_time(self, region, t_0, t_1):
+        self.check_locations()
+        return self.find({'$and': [_intersects(region), _overlaps(t_0, t_1)]})
+
     def get_by_uuid_contains(self, part):
         return self.find({'uuid': {'$regex': part}})
 
+    def get_by_uuid_prefix(self, prefix):
+        # Anchored, so it is answered by the uuid index:
+        return self.find({'uuid': {'$regex': '^' + re.escape(prefix)}})
+
     def get_by_comment_contains(self, part):
         return self.find({'comment': {'$regex': part}})
 
@@ -118,45 +257,423 @@ class Database:
         return self.find()
 
     def get_all_unlabeled(self):
-        return self.find({'$or': [{'label': {'$exists': False}}, {'label': None}]})
+        return self.find(UNLABELED)
 
     def get_all_labeled(self):
-        return self.find({'label': {'$exists': True, '$ne': None}})
+        return self.find(LABELED)
+
+    def iter_all(self, **kwargs):
+        return self.iterate({}, **kwargs)
+
+    def iter_labeled(self, **kwargs):
+        return self.iterate(LABELED, **kwargs)
 
     def get_length(self):
-        return self.collection.count_documents({})
+        return self.count({})
 
     def get_length_unlabeled(self):
-        return self.collection.count_documents({'$or': [{'label': {'$exists': False}}, {'label': None}]})
+        return self.count(UNLABELED)
 
     def get_length_labeled(self):
-        return self.collection.count_documents({'label': {'$exists': True, '$ne': None}})
+        return self.count(LABELED)
 
     def get_length_with_label(self, label):
-        return self.collection.count_documents({'label': label})
+        return self.count({'label': label})
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  MONGODB
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
 
 
 @dataclasses.dataclass(frozen=False)
-class DummyDatabase:
-    
-    collection = _DUMMY_STORE
-    
-    def _hash_from_item(itm):
-        return hashlib.sha256(json.dumps(itm).encode("utf-8")).hexdigest()
+class Database(_Queries):
+    host: str = 'localhost'
+    port: int = 27017
+    database: str = 'skreddata'
+    collection: str = 'avl-v20230607'
+
+    def __post_init__(self):
+        client = get_client(self.host, self.port)
+        self.db = client[self.database]
+        self.collection = self.db[self.collection]
+        
+    def find(self, *args, **kwargs): 
+        return items_from_documents(self.collection.find(*args, **kwargs))
+
+    def iter_batches(self, filter=None, projection=None, batch_size=1_000): 
+        batch = []
+        for doc in self.collection.find(filter or {}, projection, batch_size=batch_size): 
+            batch.append(doc)
+            if len(batch) >= batch_size: 
+                yield batch
+                batch = []
+        if batch: 
+            yield batch
+
+    def find_one(self, *args, **kwargs): 
+        item = self.collection.find_one(*args, **kwargs)
+        if item is not None: 
+            item = items_from_documents([item])[0]
+        return item
+
+    def count(self, filter=None):
+        return self.collection.count_documents(filter or {})
 
     def insert(self, item):
-        assert isinstance(item, (dict, Item))
-        item = Item(**item).asdict() if isinstance(item, dict) else item.asdict()
-        self.collection[item['uuid']] = item
+        self.collection.insert_one(_as_document(item))
 
-    def get_by_uuid(self, uuid):
-        if uuid in self.collection: 
-            return self.collection[uuid]
+    def insert_many(self, items):
+        items = [_as_document(item) for item in items]
+        if items:
+            self.collection.insert_many(items, ordered=False)
 
-    def get_all(self):
-        return list(self.collection.values())
+    def replace(self, item):
+        item = _as_document(item)
+        self.collection.replace_one({'uuid': item['uuid']}, item)
 
-    def get_length(self):
-        return len(self.collection)
-    
-    
\ No newline at end of file
+    def upsert(self, item):
+        item = _as_document(item)
+        self.collection.replace_one({'uuid': item['uuid']}, item, upsert=True)
+
+    def upsert_many(self, items):
+        from pymongo import ReplaceOne
+        requests = [ReplaceOne({'uuid': item['uuid']}, item, upsert=True) for item in map(_as_document, items)]
+        if requests:
+            self.collection.bulk_write(requests, ordered=False)
+
+    def create_indexes(self):
+        from pymongo import ASCENDING, GEOSPHERE
+        self.collection.create_index([('uuid', ASCENDING)], unique=True)
+        self.collection.create_index([('label', ASCENDING)])
+        self.collection.create_index([('t_0', ASCENDING), ('t_1', ASCENDING)])
+        self.collection.create_index([('location', GEOSPHERE)])
+
+    def migrate_locations(self):
+        # Add GeoJSON locations to items inserted before they were stored:
+        n = 0
+        for doc in self.collection.find({'location': {'$exists': False}}, {'uuid': 1, 'geometry': 1}):
+            self.collection.update_one({'_id': doc['_id']}, {'$set': {'location': _as_geojson(doc['geometry'])}})
+            n += 1
+        self._unlocated = None
+        return n
+
+    def count_unlocated(self):
+        return self.collection.count_documents({'location': {'$exists': False}})
+
+    def remove_by_uuid(self, uuid):
+        self.collection.delete_one({'uuid': uuid})
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  SQLITE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+_SQL_COLUMNS = tuple(name for name in _ITEM_FIELDS if name != '_id')
+_SQL_TIMES = ('t_0', 't_1')
+_SQL_OPERATORS = {'$lt': '<', '$lte': '<=', '$gt': '>', '$gte': '>='}
+
+
+def _sql_time(time):
+    time = _as_datetime(time)
+    if time.tzinfo is not None:
+        time = time.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return time.isoformat(timespec='microseconds')
+
+
+def _sql_value(field, value):
+    if value is None:
+        return None
+    if field in _SQL_TIMES:
+        return _sql_time(value)
+    if field == 'location':
+        return json.dumps(value)
+    if isinstance(value, numbers.Integral) and not isinstance(value, int):
+        return int(value)
+    return value
+
+
+def _sql_columns(projection):
+    # MongoDB projections include ({'uuid': 1}) or exclude ({'json': 0}) fields, _id aside:
+    fields = {name: value for name, value in projection.items() if name != '_id'}
+    if any(fields.values()):
+        return [name for name in _SQL_COLUMNS if fields.get(name)]
+    return [name for name in _SQL_COLUMNS if fields.get(name, True)]
+
+
+@functools.lru_cache(maxsize=64)
+def _prepared_region(wkt):
+    import shapely.prepared
+    import shapely.wkt
+    return shapely.prepared.prep(shapely.wkt.loads(wkt))
+
+
+def _sql_intersects(geometry, region_wkt):
+    import shapely.wkt
+    return geometry is not None and _prepared_region(region_wkt).intersects(shapely.wkt.loads(geometry))
+
+
+def _sql_regexp(pattern, value):
+    return value is not None and re.search(pattern, value) is not None
+
+
+def _sql_bounds(geometry):
+    import shapely.wkt
+    minx, miny, maxx, maxy = shapely.wkt.loads(geometry).bounds
+    return minx, maxx, miny, maxy
+
+
+@dataclasses.dataclass(frozen=False)
+class LocalDatabase(_Queries):
+    path: str = 'skreddata.sqlite'
+    collection: str = 'avl-v20230607'
+
+    def __post_init__(self):
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._con = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._con.row_factory = sqlite3.Row
+        self._con.create_function('REGEXP', 2, _sql_regexp, deterministic=True)
+        self._con.create_function('INTERSECTS', 2, _sql_intersects, deterministic=True)
+        self._table = '"' + self.collection.replace('"', '""') + '"'
+        self._rtree = '"' + (self.collection + '_rtree').replace('"', '""') + '"'
+        self.create_indexes()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._con.execute(sql, params)
+
+    def _write(self, statements):
+        # All statements in one transaction: 
+        with self._lock:
+            self._con.execute('BEGIN')
+            try:
+                for sql, params in statements:
+                    self._con.execute(sql, params)
+                self._con.execute('COMMIT')
+            except Exception:
+                self._con.execute('ROLLBACK')
+                raise
+
+    def create_indexes(self):
+        t, r = self._table, self._rtree
+        columns = ', '.join(f'{name} {"INTEGER" if name in ("label", "certainty") else "TEXT"}' for name in _SQL_COLUMNS if name != 'uuid')
+        self._execute(f'CREATE TABLE IF NOT EXISTS {t} (uuid TEXT NOT NULL UNIQUE, {columns})')
+        self._execute(f'CREATE INDEX IF NOT EXISTS "{self.collection}_label" ON {t} (label)')
+        self._execute(f'CREATE INDEX IF NOT EXISTS "{self.collection}_time" ON {t} (t_0, t_1)')
+        self._execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {r} USING rtree(id, minx, maxx, miny, maxy)')
+
+    def migrate_locations(self):
+        # Locations and spatial index entries for rows written without them:
+        rows = self._execute(f'SELECT rowid, geometry FROM {self._table} WHERE rowid NOT IN (SELECT id FROM {self._rtree})').fetchall()
+        self._write([
+            statement for row in rows for statement in (
+                (f'UPDATE {self._table} SET location = ? WHERE rowid = ?', (json.dumps(_as_geojson(row['geometry'])), row['rowid'])),
+                (f'INSERT OR REPLACE INTO {self._rtree} VALUES (?, ?, ?, ?, ?)', (row['rowid'], *_sql_bounds(row['geometry']))),
+            )
+        ])
+        self._unlocated = None
+        return len(rows)
+
+    def count_unlocated(self):
+        return self._execute(f'SELECT COUNT(*) FROM {self._table} WHERE rowid NOT IN (SELECT id FROM {self._rtree})').fetchone()[0]
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+    #  FILTERS
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+    def _where(self, filter):
+
+        # Translates the subset of MongoDB filters used by the query API:
+        if not filter:
+            return '1', []
+        clauses, params = [], []
+        for key, value in filter.items():
+            if key in ('$and', '$or'):
+                parts = [self._where(f) for f in value]
+                clauses.append('(' + f' {key[1:].upper()} '.join(sql for sql, _ in parts) + ')')
+                params += [p for _, _params in parts for p in _params]
+            elif key == 'location':
+                import shapely.geometry
+                region = shapely.geometry.shape(value['$geoIntersects']['$geometry'])
+                minx, miny, maxx, maxy = region.bounds
+                clauses.append(
+                    f'(rowid IN (SELECT id FROM {self._rtree} WHERE minx <= ? AND maxx >= ? AND miny <= ? AND maxy >= ?) '
+                    'AND INTERSECTS(geometry, ?))'
+                )
+                params += [maxx, minx, maxy, miny, region.wkt]
+            elif key in _SQL_COLUMNS:
+                sql, _params = self._where_field(key, value)
+                clauses.append(sql)
+                params += _params
+            else:
+                raise Exception(f'Unsupported filter key for local database: {key}')
+        return ' AND '.join(clauses), params
+
+    def _where_field(self, field, value):
+        if not isinstance(value, dict):
+            return (f'{field} IS NULL', []) if value is None else (f'{field} = ?', [_sql_value(field, value)])
+        clauses, params = [], []
+        for op, arg in value.items():
+            if op == '$exists':
+                clauses.append(f'{field} IS {"NOT " if arg else ""}NULL')
+            elif op == '$ne':
+                if arg is None:
+                    clauses.append(f'{field} IS NOT NULL')
+                else:
+                    clauses.append(f'({field} IS NULL OR {field} != ?)')
+                    params.append(_sql_value(field, arg))
+            elif op == '$eq':
+                sql, _params = self._where_field(field, arg)
+                clauses.append(sql)
+                params += _params
+            elif op in _SQL_OPERATORS:
+                clauses.append(f'{field} {_SQL_OPERATORS[op]} ?')
+                params.append(_sql_value(field, arg))
+            elif op == '$in':
+                clauses.append(f'{field} IN ({", ".join("?"*len(arg))})' if arg else '0')
+                params += [_sql_value(field, a) for a in arg]
+            elif op == '$regex':
+                clauses.append(f'{field} REGEXP ?')
+                params.append(arg)
+            else:
+                raise Exception(f'Unsupported filter operator for local database: {op}')
+        return '(' + ' AND '.join(clauses) + ')', params
+
+    def _select(self, filter, projection=None, limit=None):
+        columns = _sql_columns(projection) if projection else _SQL_COLUMNS
+        where, params = self._where(filter)
+        sql = f'SELECT {", ".join(["rowid AS _id", *columns])} FROM {self._table} WHERE {where}'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        return sql, params
+
+    @staticmethod
+    def _document(row):
+        doc = dict(row)
+        for name in _SQL_TIMES:
+            if doc.get(name) is not None:
+                doc[name] = dt.datetime.fromisoformat(doc[name])
+        if doc.get('location') is not None:
+            doc['location'] = json.loads(doc['location'])
+        return doc
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+    #  READ
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+    def find(self, filter=None, projection=None):
+        return items_from_documents(self._document(row) for row in self._execute(*self._select(filter, projection)))
+
+    def find_one(self, filter=None, projection=None):
+        row = self._execute(*self._select(filter, projection, limit=1)).fetchone()
+        return None if row is None else items_from_documents([self._document(row)])[0]
+
+    def iter_batches(self, filter=None, projection=None, batch_size=1_000):
+        # A separate cursor, so that other queries can run while iterating: 
+        with self._lock:
+            cursor = self._con.cursor()
+            cursor.execute(*self._select(filter, projection))
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            docs = [self._document(row) for row in rows]
+            if projection is not None and not projection.get('_id', True):
+                for doc in docs:
+                    doc.pop('_id')
+            yield docs
+
+    def count(self, filter=None):
+        where, params = self._where(filter)
+        return self._execute(f'SELECT COUNT(*) FROM {self._table} WHERE {where}', params).fetchone()[0]
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+    #  WRITE
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+    def _upsert_statements(self, doc, mode):
+        values = [_sql_value(name, doc[name]) for name in _SQL_COLUMNS]
+        names = ', '.join(_SQL_COLUMNS)
+        if mode == 'insert':
+            sql = f'INSERT INTO {self._table} ({names}) VALUES ({", ".join("?"*len(values))})'
+        elif mode == 'upsert':
+            updates = ', '.join(f'{name} = excluded.{name}' for name in _SQL_COLUMNS if name != 'uuid')
+            sql = f'INSERT INTO {self._table} ({names}) VALUES ({", ".join("?"*len(values))}) ON CONFLICT(uuid) DO UPDATE SET {updates}'
+        else:
+            sql = f'UPDATE {self._table} SET {", ".join(f"{name} = ?" for name in _SQL_COLUMNS)} WHERE uuid = ?'
+            values = values + [doc['uuid']]
+        return [
+            (sql, values),
+            (f'INSERT OR REPLACE INTO {self._rtree} SELECT rowid, ?, ?, ?, ? FROM {self._table} WHERE uuid = ?', (*_sql_bounds(doc['geometry']), doc['uuid'])),
+        ]
+
+    def insert(self, item):
+        self._write(self._upsert_statements(_as_document(item), 'insert'))
+
+    def insert_many(self, items):
+        self._write([s for item in items for s in self._upsert_statements(_as_document(item), 'insert')])
+
+    def replace(self, item):
+        self._write(self._upsert_statements(_as_document(item), 'replace'))
+
+    def upsert(self, item):
+        self._write(self._upsert_statements(_as_document(item), 'upsert'))
+
+    def upsert_many(self, items):
+        self._write([s for item in items for s in self._upsert_statements(_as_document(item), 'upsert')])
+
+    def remove_by_uuid(self, uuid):
+        self._write([
+            (f'DELETE FROM {self._rtree} WHERE id IN (SELECT rowid FROM {self._table} WHERE uuid = ?)', (uuid,)),
+            (f'DELETE FROM {self._table} WHERE uuid = ?', (uuid,)),
+        ])
+
+
+@dataclasses.dataclass(frozen=False)
+class DummyDatabase(LocalDatabase):
+    # In-memory database, e.g. for tests. Each instance has its own store:
+    path: str = ':memory:'
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  CONFIGURATION
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+DATABASE_ENV = 'SKREDDATA_DATABASE'
+DEFAULT_URL = 'mongodb://localhost:27017'
+
+_MEMORY = {}
+_MEMORY_LOCK = threading.Lock()
+
+
+def _memory_database(**query):
+    # One in-memory database per process and collection, so that all opened memory:// URLs (e.g. in
+    # generate.add_to_database and the CLI) see the same items:
+    key = (os.getpid(), tuple(sorted(query.items())))
+    with _MEMORY_LOCK:
+        if key not in _MEMORY:
+            _MEMORY[key] = DummyDatabase(**query)
+        return _MEMORY[key]
+
+
+def open_database(url=None):
+
+    # mongodb://host:port[/database[/collection]], sqlite:///path/to/file.sqlite[?collection=name] or
+    # memory://. Taken from the SKREDDATA_DATABASE environment variable if not given:
+    url = url or os.environ.get(DATABASE_ENV) or DEFAULT_URL
+    parsed = urllib.parse.urlparse(url)
+    query = dict(urllib.parse.parse_qsl(parsed.query))
+    if parsed.scheme == 'mongodb':
+        kws = dict(zip(('database', 'collection'), [p for p in parsed.path.split('/') if p]))
+        return Database(host=parsed.hostname or 'localhost', port=parsed.port or 27017, **kws)
+    elif parsed.scheme == 'sqlite':
+        # As in SQLAlchemy, sqlite:///relative/path and sqlite:////absolute/path:
+        return LocalDatabase(path=parsed.path[1:], **query)
+    elif parsed.scheme == 'memory':
+        return _memory_database(**query)
+    raise Exception(f'Unsupported database URL: {url}')
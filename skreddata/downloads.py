@@ -0,0 +1,77 @@
+import os
+import functools
+import logging
+import dask
+
+from skreddata import fetch, metrics, profiles
+
+
+logger = logging.getLogger(__name__)
+
+
+# Downloads of S1-scenes as tasks of the generation graphs. gtile (ASF downloads without the async
+# client) is imported where used, so graphs can be planned and tested without it.
+
+
+def product_id(prod):
+    for key in ('fileID', 'sceneName', 'fileName'):
+        if prod.get(key) is not None:
+            return prod[key]
+    return dask.base.tokenize(prod)
+
+
+def download_path(prod, download_folder):
+    return os.path.join(download_folder, prod['fileName'])
+
+
+def _download(prod, download_folder, fetch_config=None):
+
+    # Submitted to the process-wide fetch loop, so downloads of all tasks overlap and resume:
+    fn = download_path(prod, download_folder)
+    if os.path.exists(fn):
+        return fn
+    return fetch.get_background(fetch_config).download(prod['url'], fn).result()
+
+
+def _download_product(downloader, prod, pid):
+    with metrics.measure('download', product=pid) as record:
+        fn = downloader(prod)
+        metrics.input_bytes(record, [fn])
+    return fn
+
+
+def _log_failure(pid, future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f'Prefetching product {pid} failed: {future.exception()!r}')
+
+
+def prefetch_products(prods, download_folder, fetch_config=None):
+
+    # Start downloading <prods> not on disk in the background, without waiting. Failures are logged
+    # (the download tasks retry them), and the futures are returned:
+    background = fetch.get_background(fetch_config)
+    futures = {}
+    for prod in prods:
+        pid = product_id(prod)
+        fn = download_path(prod, download_folder)
+        if pid in futures or os.path.exists(fn):
+            continue
+        futures[pid] = background.download(prod['url'], fn)
+        futures[pid].add_done_callback(functools.partial(_log_failure, pid))
+    return list(futures.values())
+
+
+def _downloads(group, download_folder=None, fetch_config=None):
+
+    # Download S1-scenes (delayed), keyed by product so each scene is one task in the graph.
+    # With <download_folder> given, scenes are fetched by the async client instead:
+    if download_folder is None:
+        from gtile.sat import asf
+        downloader = asf.cached_downloader()
+    else:
+        downloader = functools.partial(_download, download_folder=download_folder, fetch_config=fetch_config)
+    with profiles.annotate('network'):
+        return [
+            dask.delayed(_download_product, pure=True)(downloader, itm, product_id(itm), dask_key_name=f'download-{product_id(itm)}')
+            for itm in group
+        ]
@@ -0,0 +1,271 @@
+import os
+import csv
+import json
+import shutil
+import datetime as dt
+import numpy as np
+
+
+# Streaming exports of database items, a cursor batch at a time. Geometries are taken from the stored
+# GeoJSON locations where present, so only items without one need shapely. GeoParquet is written
+# from Arrow batches, optionally partitioned (hive-style) by label, UTM zone or year, and read back
+# for ingest and sample generation.
+
+
+FORMATS = ('jsonl', 'geojson', 'csv', 'parquet')
+SUFFIXES = {'.jsonl': 'jsonl', '.json': 'jsonl', '.geojson': 'geojson', '.csv': 'csv', '.parquet': 'parquet'}
+COLUMNS = ('uuid', 'label', 't_0', 't_1', 'comment', 'type', 'certainty', 'source', 'json', 'geometry')
+PARTITIONS = ('label', 'utm_zone', 'year')
+
+
+def format_from_path(fn):
+    suffix = os.path.splitext(str(fn))[1].lower()
+    if suffix not in SUFFIXES:
+        raise Exception(f'Unknown export format for {fn}, expected one of {sorted(SUFFIXES)}')
+    return SUFFIXES[suffix]
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, dt.datetime) else value
+
+
+def _properties(doc):
+    return {name: _value(doc.get(name)) for name in COLUMNS if name != 'geometry'}
+
+
+def _location(doc):
+    if doc.get('location') is not None:
+        return doc['location']
+    from skreddata import database
+    return database._as_geojson(doc['geometry'])
+
+
+def _replace(tmp, fn):
+    # Moves a finished export (file or folder) into place, replacing any earlier one:
+    if os.path.isdir(fn):
+        old = f'{fn}.{os.getpid()}.old'
+        os.rename(fn, old)
+        os.rename(tmp, fn)
+        shutil.rmtree(old)
+    else:
+        os.replace(tmp, fn)
+
+
+def _remove(fn):
+    if os.path.isdir(fn):
+        shutil.rmtree(fn)
+    elif os.path.exists(fn):
+        os.remove(fn)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  WRITERS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def _write_jsonl(batches, fp):
+    n = 0
+    for batch in batches:
+        fp.writelines(json.dumps({name: _value(doc.get(name)) for name in COLUMNS}) + '\n' for doc in batch)
+        n += len(batch)
+    return n
+
+
+def _write_geojson(batches, fp):
+    # One FeatureCollection, written feature by feature:
+    n = 0
+    fp.write('{"type": "FeatureCollection", "features": [\n')
+    for batch in batches:
+        for doc in batch:
+            feature = {'type': 'Feature', 'properties': _properties(doc), 'geometry': _location(doc)}
+            fp.write((',\n' if n else '') + json.dumps(feature))
+            n += 1
+    fp.write('\n]}\n')
+    return n
+
+
+def _write_csv(batches, fp):
+    writer = csv.writer(fp)
+    writer.writerow(COLUMNS)
+    n = 0
+    for batch in batches:
+        writer.writerows([_value(doc.get(name)) for name in COLUMNS] for doc in batch)
+        n += len(batch)
+    return n
+
+
+WRITERS = {'jsonl': _write_jsonl, 'geojson': _write_geojson, 'csv': _write_csv}
+
+
+def export(db, fn, filter=None, format=None, batch_size=1_000, partition_by=()):
+
+    # Items matching <filter> written to <fn>, in the format given by its suffix if not given. Written
+    # to a temporary file first, so an interrupted export leaves no partial file. Returns the count:
+    format = format_from_path(fn) if format is None else format
+    if format == 'parquet':
+        return to_geoparquet(db, fn, filter=filter, partition_by=partition_by, batch_size=max(batch_size, 10_000))
+    if format not in WRITERS:
+        raise Exception(f'Unknown export format: {format}, expected one of {FORMATS}')
+    if partition_by:
+        raise Exception(f'Partitioned exports are written as parquet, not {format}')
+    os.makedirs(os.path.dirname(os.path.abspath(fn)), exist_ok=True)
+    tmp = f'{fn}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'w', newline='' if format == 'csv' else None) as fp:
+            n = WRITERS[format](db.iter_batches(filter, batch_size=batch_size), fp)
+        os.replace(tmp, fn)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return n
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  GEOPARQUET
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+# Stored fields only, the GeoJSON location is rebuilt from the geometry when needed:
+PROJECTION = dict({name: 1 for name in COLUMNS}, _id=0)
+
+# GeoParquet 1.0 metadata, WKB in lon/lat (OGC:CRS84, the default when no crs is given):
+GEO_METADATA = {
+    'version': '1.0.0',
+    'primary_column': 'geometry',
+    'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': []}}
+}
+
+
+def arrow_schema():
+    import pyarrow as pa
+    strings = ('uuid', 'comment', 'type', 'source', 'json')
+    types = {'label': pa.int64(), 'certainty': pa.int64(), 't_0': pa.timestamp('us'), 't_1': pa.timestamp('us'), 'geometry': pa.binary()}
+    fields = [(name, pa.string() if name in strings else types[name]) for name in COLUMNS]
+    fields += [('utm_zone', pa.string()), ('year', pa.int32())]
+    return pa.schema(fields, metadata={b'geo': json.dumps(GEO_METADATA).encode('utf-8')})
+
+
+def utm_zones(lon, lat):
+    # Standard 6 degree zones with hemisphere, e.g. 33N (without the Norway/Svalbard exceptions):
+    zones = (np.floor((np.asarray(lon) + 180)/6).astype(int) % 60) + 1
+    return [f'{z:02d}{"N" if y >= 0 else "S"}' for z, y in zip(zones, lat)]
+
+
+def record_batch(docs, schema=None):
+    import pyarrow as pa
+    import shapely
+
+    # Documents to Arrow columns, with geometries parsed and converted to WKB in bulk:
+    schema = arrow_schema() if schema is None else schema
+    geometry = shapely.from_wkt([doc['geometry'] for doc in docs])
+    centroids = shapely.centroid(geometry)
+    columns = {name: [doc.get(name) for doc in docs] for name in COLUMNS if name != 'geometry'}
+    columns['geometry'] = shapely.to_wkb(geometry)
+    columns['utm_zone'] = utm_zones(shapely.get_x(centroids), shapely.get_y(centroids))
+    columns['year'] = [None if t is None else t.year for t in columns['t_0']]
+    return pa.RecordBatch.from_arrays([pa.array(columns[f.name], f.type) for f in schema], schema=schema)
+
+
+def to_geoparquet(db, target, filter=None, partition_by=(), batch_size=10_000, compression='zstd'):
+
+    # One file, or a folder of files per partition (e.g. label=1/utm_zone=33N/part-0.parquet) with
+    # <partition_by> from PARTITIONS. Cursor batches are converted and written as they arrive, and
+    # the export replaces <target> when done. Returns the number of items:
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as ds
+    for name in partition_by:
+        if name not in PARTITIONS:
+            raise Exception(f'Unknown partition: {name}, expected some of {PARTITIONS}')
+
+    schema = arrow_schema()
+    n = [0]
+
+    def batches():
+        for docs in db.iter_batches(filter, projection=PROJECTION, batch_size=batch_size):
+            n[0] += len(docs)
+            yield record_batch(docs, schema)
+
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    tmp = f'{target}.{os.getpid()}.tmp'
+    _remove(tmp)
+    try:
+        if partition_by:
+            os.makedirs(tmp)
+            ds.write_dataset(
+                batches(), tmp, schema=schema, format='parquet', partitioning=list(partition_by),
+                partitioning_flavor='hive', basename_template='part-{i}.parquet',
+                file_options=ds.ParquetFileFormat().make_write_options(compression=compression)
+            )
+        else:
+            with pq.ParquetWriter(tmp, schema, compression=compression) as writer:
+                for batch in batches():
+                    writer.write_batch(batch)
+        _replace(tmp, target)
+    finally:
+        _remove(tmp)
+    return n[0]
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  INGEST
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def _is_parquet(path):
+    return os.path.isdir(path) or os.path.splitext(str(path))[1].lower() == '.parquet'
+
+
+def read_frame(path):
+    import pandas as pd
+    import geopandas as gpd
+
+    # GeoDataFrame of items from a GeoParquet export (file or partitioned folder), or any file
+    # geopandas reads (e.g. GeoJSON). Partition values are columns again, missing values are None:
+    if not _is_parquet(path):
+        return gpd.read_file(path)
+    import pyarrow.dataset as ds
+    table = ds.dataset(str(path), format='parquet', partitioning='hive').to_table()
+    if table.schema.metadata is None or b'geo' not in table.schema.metadata:
+        raise Exception(f'No GeoParquet metadata in {path}')
+    column = json.loads(table.schema.metadata[b'geo'])['primary_column']
+    geometry = gpd.GeoSeries.from_wkb(table[column].to_numpy(zero_copy_only=False), crs='epsg:4326')
+    df = table.drop_columns([column]).to_pandas()
+    for name in ('label', 'certainty'):
+        if name in df:
+            df[name] = df[name].astype('Int64')
+    df = df.astype({name: object for name in df.columns if not pd.api.types.is_datetime64_any_dtype(df[name])})
+    df = df.where(df.notna(), None)
+    return gpd.GeoDataFrame(df, geometry=geometry)
+
+
+def items_from_frame(df):
+    import shapely
+    import pandas as pd
+    from skreddata import database
+
+    # Items of the columns in COLUMNS, geometries as WKT. GeoJSON locations are made in bulk here,
+    # instead of one by one when written:
+    wkt = shapely.to_wkt(df.geometry.values, rounding_precision=-1)
+    locations = [json.loads(geojson) for geojson in shapely.to_geojson(df.geometry.values)]
+    columns = {}
+    for name in COLUMNS:
+        if name == 'geometry' or name not in df:
+            continue
+        values = df[name]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            if values.dt.tz is not None:
+                values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+            values = pd.Series(list(values.dt.to_pydatetime()), index=df.index, dtype=object)
+        columns[name] = values.astype(object).where(values.notna(), None).tolist()
+    return [
+        database.Item(geometry=geometry, location=location, **{name: values[i] for name, values in columns.items()})
+        for i, (geometry, location) in enumerate(zip(wkt, locations))
+    ]
+
+
+def ingest(db, path, batch_size=10_000):
+    # Items of an export upserted into <db> (by UUID), in bulk. Returns the number of items:
+    items = items_from_frame(read_frame(path))
+    for i in range(0, len(items), batch_size):
+        db.upsert_many(items[i:i + batch_size])
+    return len(items)
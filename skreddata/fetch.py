@@ -0,0 +1,263 @@
+import os
+import time
+import random
+import fcntl
+import asyncio
+import datetime
+import threading
+import dataclasses
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+SEARCH_URL = 'https://api.daac.asf.alaska.edu/services/search/param'
+TOKEN_ENV = 'EARTHDATA_TOKEN'
+RETRY_STATUS = (408, 429, 500, 502, 503, 504)
+
+_BACKGROUND = {}
+_BACKGROUND_LOCK = threading.Lock()
+
+
+@dataclasses.dataclass(frozen=True)
+class Config:
+    per_host: int = 4               # Open connections (and so requests in flight) per host
+    total: int = 32                 # Open connections over all hosts
+    retries: int = 5
+    backoff: float = 1.0            # Seconds before the first retry, doubled for each following one
+    max_backoff: float = 60.0
+    connect_timeout: float = 60.0   # Seconds to connect
+    read_timeout: float = 300.0     # Seconds without data while reading, there is no limit on whole bodies
+    chunk_size: int = 2**20
+    search_url: str = SEARCH_URL
+    token: str = None               # Earthdata bearer token, read from $EARTHDATA_TOKEN if not given
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _check(response):
+    if response.status in RETRY_STATUS:
+        raise RetryableError(f'HTTP {response.status} from {response.url}', _retry_after(response))
+    response.raise_for_status()
+
+
+def _search_params(query):
+    params = {'output': 'geojson'}
+    for key, value in query.items():
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            value = value.isoformat()
+        params[key] = str(value)
+    return params
+
+
+def _total_size(response, offset):
+    # Full size of the file from Content-Range (partial responses) or Content-Length:
+    content_range = response.headers.get('Content-Range')
+    if content_range is not None and '/' in content_range and not content_range.endswith('*'):
+        return int(content_range.rsplit('/', 1)[1])
+    if response.content_length is not None:
+        return offset + response.content_length
+    return None
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  ASYNC CLIENT
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+class Fetcher:
+
+    def __init__(self, config=None):
+        self.config = Config() if config is None else config
+        self.bytes = 0
+        self.retries = 0
+        self._session = None
+
+    async def __aenter__(self):
+        import aiohttp
+
+        # One session, so connections are kept alive and reused between requests to the same host:
+        token = self.config.token or os.environ.get(TOKEN_ENV)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.config.total, limit_per_host=self.config.per_host),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.config.connect_timeout, sock_read=self.config.read_timeout),
+            headers={'Authorization': f'Bearer {token}'} if token else None,
+            raise_for_status=False
+        )
+        return self
+
+    async def __aexit__(self, *args):
+        await self._session.close()
+        self._session = None
+
+    async def _retry(self, request, description, progress=None):
+        import aiohttp
+
+        # Exponential backoff with jitter on connection errors, timeouts, truncated bodies and
+        # throttling/server errors. Other HTTP errors are raised directly. With <progress> (e.g. bytes
+        # downloaded so far), attempts that made progress start the count over, so that large files on
+        # slow links are resumed until complete:
+        attempt = 0
+        while True:
+            before = progress() if progress is not None else None
+            try:
+                return await request()
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError, RetryableError) as e:
+                if progress is not None and progress() > before:
+                    attempt = 0
+                if attempt == self.config.retries:
+                    raise
+                delay = min(self.config.max_backoff, self.config.backoff*2**attempt)*random.uniform(0.5, 1.0)
+                delay = max(delay, getattr(e, 'retry_after', None) or 0)
+                attempt += 1
+                self.retries += 1
+                logger.info(f'Retrying {description} in {delay:.1f}s ({attempt}/{self.config.retries}): {e!r}')
+                await asyncio.sleep(delay)
+
+    async def get_json(self, url, params=None):
+
+        async def request():
+            async with self._session.get(url, params=params) as response:
+                _check(response)
+                return await response.json(content_type=None)
+
+        return await self._retry(request, url)
+
+    async def search(self, query):
+
+        # Same result layout as searches through asf_search, so results can share the search cache:
+        res = await self.get_json(self.config.search_url, _search_params(query))
+        return [{'properties': f['properties'], 'geometry': f.get('geometry')} for f in res.get('features', [])]
+
+    async def download(self, url, fn):
+
+        # Written to <fn>.part, and resumed from where it stopped with a range request after
+        # interruptions (also between runs). Moved in place once complete:
+        if os.path.exists(fn):
+            return fn
+        os.makedirs(os.path.dirname(os.path.abspath(fn)), exist_ok=True)
+        with open(f'{fn}.lock', 'w') as lock:
+
+            # Other processes (e.g. workers sharing the download folder) may be fetching the same file:
+            while True:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(1.0)
+            try:
+                if not os.path.exists(fn):
+                    await self._download(url, fn)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return fn
+
+    async def _download(self, url, fn):
+        part = f'{fn}.part'
+
+        async def request():
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else None
+            async with self._session.get(url, headers=headers) as response:
+
+                # Range not satisfiable, the partial file already holds everything:
+                if offset and response.status == 416:
+                    return
+                _check(response)
+                if response.status != 206:
+                    offset = 0
+                total = _total_size(response, offset)
+                with open(part, 'ab' if offset else 'wb') as fp:
+                    async for block in response.content.iter_chunked(self.config.chunk_size):
+                        fp.write(block)
+                        self.bytes += len(block)
+
+            if total is not None and os.path.getsize(part) < total:
+                raise RetryableError(f'Incomplete download of {url}: {os.path.getsize(part)} of {total} bytes')
+
+        def progress():
+            return os.path.getsize(part) if os.path.exists(part) else 0
+
+        await self._retry(request, url, progress=progress)
+        os.replace(part, fn)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  BLOCKING INTERFACE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def search_many(queries, config=None):
+    async def run():
+        async with Fetcher(config) as fetcher:
+            return await asyncio.gather(*(fetcher.search(q) for q in queries))
+    return asyncio.run(run())
+
+
+def download_many(downloads, config=None):
+
+    # <downloads> is a list of (url, fn):
+    async def run():
+        async with Fetcher(config) as fetcher:
+            start = time.perf_counter()
+            res = await asyncio.gather(*(fetcher.download(url, fn) for url, fn in downloads))
+            logger.info(f'Downloaded {fetcher.bytes/1024**2:.1f} MB in {time.perf_counter() - start:.1f}s')
+            return res
+    return asyncio.run(run())
+
+
+class Background:
+
+    # An event loop in a daemon thread, shared by all tasks of a process. Requests are submitted from
+    # any thread and return concurrent futures, so I/O for many tasks overlaps on one loop instead of
+    # occupying a worker thread each:
+    def __init__(self, config=None):
+        self.config = Config() if config is None else config
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='skreddata-fetch', daemon=True)
+        self._thread.start()
+        self._fetcher = self._submit(Fetcher(self.config).__aenter__()).result()
+        self._downloads = {}
+        self._lock = threading.Lock()
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def search(self, query):
+        return self._submit(self._fetcher.search(query))
+
+    def download(self, url, fn):
+
+        # Concurrent requests for the same file share one download:
+        with self._lock:
+            future = self._downloads.get(fn)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self._downloads[fn] = self._submit(self._fetcher.download(url, fn))
+        return future
+
+    def close(self):
+        self._submit(self._fetcher.__aexit__()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def get_background(config=None):
+    # The loop thread does not survive a fork, so there is one per process:
+    config = Config() if config is None else config
+    key = (os.getpid(), config)
+    with _BACKGROUND_LOCK:
+        if key not in _BACKGROUND:
+            _BACKGROUND[key] = Background(config)
+        return _BACKGROUND[key]
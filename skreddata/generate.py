@@ -1,5 +1,4 @@
 
-import itertools
 import numpy as np
 import datetime
 import shapely
@@ -8,36 +7,53 @@ import os
 import dask
 import json
 import hashlib
+import collections
 import argparse
 import geopandas as gpd
-import dask
-from dask import distributed
 import logging
 
-from gdar import rastertools, meta, fileformats, raster, coordinates
+from gdar import meta, coordinates
 from gtile.core import shapetools, decorators, tileset
-from gtile.core.rastertools import mosaic_tiles
-from gtile.sat import asf, elevation, sentinel1
+from gtile.sat import elevation, sentinel1
 
-from skreddata import database
+from skreddata import database, tilecache, storage, manifest, metrics, profiles, search, writers
+from skreddata.search import _parse_toi
+from skreddata.tiling import TILE_SHAPE, cropped_tile_shape
+from skreddata.downloads import product_id, prefetch_products, _downloads
 
 
 logger = logging.getLogger(__name__)
 
 
+GRID_SSP = np.array([10, 10])
+
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
-#  WRITE INPUT GEOJSON
+#  ADD TO DATABASE
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
 
 
 @dask.delayed
-def add_to_database(item):
-    db = database.Database()
-    logger.info(f'Inserting item in database:\ndatabase: {db}\nitem: {item}')
-    db.insert(item)
+def add_to_database(item, files=None, insert=True, database_url=None):
+    if insert: 
+        db = database.open_database(database_url)
+        logger.info(f'Inserting item in database:\ndatabase: {db}\nitem: {item}')
+        db.upsert(item)
     return item
 
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  RECORD STAGE IN MANIFEST
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+@dask.delayed
+def record_stage(fn, folder, uuid, stage): 
+    with metrics.measure('manifest', uuid, recorded=stage) as record: 
+        metrics.input_bytes(record, [fn])
+        return manifest.record(folder, uuid, stage, fn)
+
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
 #  WRITE INPUT GEOJSON
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
@@ -60,7 +76,9 @@ def write_input_geojson(uuid, folder, aoi, t_0, t_1):
         )
     
     fn = os.path.join(folder, uuid, f'{uuid}_input.geojson')
-    df.to_file(fn, driver='GeoJSON')
+    tmp = os.path.join(folder, uuid, f'{uuid}_input.part.geojson')
+    df.to_file(tmp, driver='GeoJSON')
+    os.replace(tmp, fn)
     
     return fn
 
@@ -75,8 +93,9 @@ def write_pair_json(uuid, folder, pair):
 
     fn = os.path.join(folder, uuid, f'{uuid}_products.json')
     os.makedirs(os.path.dirname(fn), exist_ok=True)
-    with open(fn, 'w') as fp:
+    with open(f'{fn}.part', 'w') as fp:
         json.dump(pair, fp)
+    os.replace(f'{fn}.part', fn)
     
     return fn
 
@@ -86,103 +105,203 @@ def write_pair_json(uuid, folder, pair):
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
 
 
-def write_rcs_and_dem(uuid, folder, pair, grid, tile_set):
+def _dem_tiles(tile_set, grid, tile_key=None, tile_cache=None): 
+    
+    # DEM tiles, shared with other samples on the same tile-set if <tile_key> is given: 
+    dem_tiles = elevation.MergedDEM(tile_set=tile_set).get_tiles(aoi=grid)
+    if tile_key is not None: 
+        dem_tiles = tilecache.shared_tiles('dem', tile_key, dem_tiles, config=tile_cache)
+    return dem_tiles
+
+
+def _geocoded_tiles(group, grid, tile_set, dem_tiles, tile_key=None, tile_cache=None, download_folder=None, fetch_config=None, 
+        memory=None): 
     
+    # Geocoded tiles of one acquisition (group of adjacent products), shared by (products, tile index) 
+    # between pairs, stacks and samples. Geocoding is annotated as cpu work of <memory> bytes per tile. 
+    # Downloads (network work, one task per product) and shared DEM tiles stay in the outer graph. 
+    # Downloads are left out when all tiles are cached as planned (in this process or on the disk tier), 
+    # tiles cached elsewhere had their scenes downloaded already, so their download tasks return at once. 
+    # Scenes needed by the tiles start downloading (async fetch) as they are planned: 
+    gec_source = sentinel1.GeocodedS1Grd(tile_set=tile_set)
+    files = _downloads(group, download_folder, fetch_config)
+    with profiles.annotate('cpu', memory): 
+        tiles = gec_source.get_tiles(aoi=grid, files=files, dem={'files': list(dem_tiles.values())})
+        needed = True
+        if tile_key is not None: 
+            namespace = (tile_key, [product_id(itm) for itm in group])
+            needed = not tilecache.cached('gec', namespace, tiles, config=tile_cache)
+            inputs = files + list(dem_tiles.values()) if needed else list(dem_tiles.values())
+            tiles = tilecache.shared_tiles('gec', namespace, tiles, config=tile_cache, inputs=inputs)
+    if needed and download_folder is not None: 
+        prefetch_products(group, download_folder, fetch_config)
+    return tiles
+
+
+def cluster_path(folder, key, name): 
+    return os.path.join(folder, '.clusters', f'{key}_{name}.tif')
+
+
+def write_rcs_and_dem(uuid, folder, pair, grid, tile_set, tile_key=None, tile_cache=None, output_format='gtiff', 
+        completed=None, download_folder=None, fetch_config=None, cluster=None, resources=None):
+    
+    # Files of stages already completed (see manifest) are returned as they are: 
+    completed = {} if completed is None else completed
     output = []
     
-    # Prepare DEM: 
-    dem_source = elevation.MergedDEM(tile_set=tile_set)
-    dem_tiles = dem_source.get_tiles(aoi=grid)
+    # Task memory (profiles.Resources) of geocoding and mosaicking, for resource annotated profiles: 
+    resources = profiles.Resources(geocode=None, mosaic=None) if resources is None else resources
     
-    # Download S1-scenes (delayed): 
-    downloader = dask.delayed(asf.cached_downloader())
-    pair = [[downloader(itm) for itm in group] for group in pair]
+    # With a <cluster> ({'key', 'grid', 'bounds'}), mosaics are made once on the cluster grid (under 
+    # <folder>/.clusters), and the sample is cut from them at its bounds: 
+    mosaic_grid = grid if cluster is None else cluster['grid']
     
-    # S1-mosaic: 
-    gec_source = sentinel1.GeocodedS1Grd(tile_set=tile_set)    
-    kws = {}
-    kws['dem'] = {'files': list(dem_tiles.values())}
+    # Prepare DEM: 
+    dem_tiles = _dem_tiles(tile_set, mosaic_grid, tile_key, tile_cache)
     
-    fn = os.path.join(folder, uuid, f'{uuid}_crs.tif')
-    os.makedirs(os.path.dirname(fn), exist_ok=True)
-    tile_pair = [gec_source.get_tiles(aoi=grid, files=files, **kws) for files in pair]
-    output.append(_pair_to_file(tile_pair, fn, grid))
+    # S1-mosaic: 
+    if 'crs' in completed: 
+        output.append(completed['crs'])
+    else: 
+        fn = storage.sample_path(folder, uuid, 'crs', output_format)
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        
+        # Mosaics of a cluster already written by other samples are cut as they are, without tiles: 
+        if cluster is not None: 
+            ids = [[product_id(p) for p in group] for group in pair]
+            src = cluster_path(folder, cluster['key'], f'crs_{dask.base.tokenize(ids)}')
+        if cluster is None or not os.path.exists(src): 
+            tile_pair = [
+                _geocoded_tiles(group, mosaic_grid, tile_set, dem_tiles, tile_key, tile_cache, download_folder, fetch_config, 
+                    memory=resources.geocode) 
+                for group in pair
+            ]
+        with profiles.annotate('cpu', resources.mosaic): 
+            if cluster is None: 
+                out = _pair_to_file(tile_pair, fn, grid, output_format, uuid=uuid)
+            else: 
+                mosaic = src if os.path.exists(src) else \
+                    tilecache.shared_file('cluster-crs', src, writers.write_pair, tile_pair, src, mosaic_grid, uuid=cluster['key'])
+                out = _cut_to_file(mosaic, fn, cluster['bounds'], output_format, uuid=uuid)
+        output.append(record_stage(out, folder, uuid, 'crs'))
 
     # DEM-mosaic: 
-    fn = os.path.join(folder, uuid, f'{uuid}_dem.tif')
-    output.append(_dem_to_file(dem_tiles, fn, grid))
+    if 'dem' in completed: 
+        output.append(completed['dem'])
+    else: 
+        fn = storage.sample_path(folder, uuid, 'dem', output_format)
+        with profiles.annotate('cpu', resources.mosaic): 
+            if cluster is None: 
+                out = _dem_to_file(dem_tiles, fn, grid, output_format, uuid=uuid)
+            else: 
+                src = cluster_path(folder, cluster['key'], 'dem')
+                mosaic = src if os.path.exists(src) else \
+                    tilecache.shared_file('cluster-dem', src, writers.write_dem, dem_tiles, src, mosaic_grid, uuid=cluster['key'])
+                out = _cut_to_file(mosaic, fn, cluster['bounds'], output_format, uuid=uuid)
+        output.append(record_stage(out, folder, uuid, 'dem'))
     
     return output
 
 
-@dask.delayed
-def _pair_to_file(tile_pair, fn, grid): 
-    mosaic_pair = [mosaic_tiles(tiles, mosaicing_kws={'grid':grid}) for tiles in tile_pair]
-    col = {}
-    for i, dr in enumerate(mosaic_pair): 
-        for j, n in enumerate(dr.dtype.names):
-            key = f'{n}_{i}' 
-            col[key] = rastertools.select(dr, j)
-    combined = rastertools.merge(raster.Collection(col))
-    fileformats.write_crs(combined, fn)
-    return fn
+_pair_to_file = dask.delayed(writers.write_pair)
 
 
 @dask.delayed
-def _dem_to_file(tiles, fn, grid): 
-    fileformats.write_crs(mosaic_tiles(tiles, mosaicing_kws={'grid':grid}), fn)
-    return fn
+def _cut_to_file(src, fn, bounds, output_format='gtiff', uuid=None): 
+    with metrics.measure('cut', uuid, format=output_format) as record: 
+        return metrics.output_bytes(record, storage.cut(src, fn, bounds, format=output_format))
+
+
+_dem_to_file = dask.delayed(writers.write_dem)
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
-#  SEARCH S1-PAIRS
+#  WRITE TIME-SERIES STACKS
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
 
 
-@decorators.input_as_copy
-def search_grd_pairs(aoi, t_0, t_1, space_buffer=7_500, exact_times=False): 
+def _acquisition_time(group): 
+    return min(p['startTime'] for p in group)
 
-    if not isinstance(t_0, datetime.datetime):
-        t_0 = parser.parse(t_0)
-    if not isinstance(t_1, datetime.datetime):
-        t_1 = parser.parse(t_1)
 
-    poly = shapely.wkt.loads(shapetools.misc_to_wkt(aoi))
-    poly = shapetools.buffer_in_closest_utm(poly, space_buffer)
-    poly = shapely.geometry.polygon.orient(poly)
-    wkt = shapely.wkt.dumps(poly, rounding_precision=12)
-
-    query = {
-        "processingLevel": "GRD_HD",
-        "intersectsWith": wkt,
-        "start": t_0 - datetime.timedelta(days=12),
-        "end": t_1 + datetime.timedelta(days=12)
+def stacks_from_pairs(pairs): 
+    
+    # Unique acquisitions per orbit path in time order, with the pairs as (i, j) indices into them and 
+    # their position <n> in <pairs>: 
+    stacks = {}
+    for n, pair in enumerate(pairs): 
+        stack = stacks.setdefault(pair[0][0]['pathNumber'], {'dates': {}, 'pairs': []})
+        for group in pair: 
+            stack['dates'].setdefault(tuple(product_id(p) for p in group), group)
+        stack['pairs'].append((n, [tuple(product_id(p) for p in group) for group in pair]))
+    
+    for stack in stacks.values(): 
+        keys = sorted(stack['dates'], key=lambda k: _acquisition_time(stack['dates'][k]))
+        index = {k: i for i, k in enumerate(keys)}
+        stack['dates'] = [stack['dates'][k] for k in keys]
+        stack['pairs'] = [(n, [index[k] for k in pair]) for n, pair in stack['pairs']]
+    return stacks
+
+
+def write_stack_and_dem(uuid, folder, stack, grid, tile_set, tile_key=None, tile_cache=None, completed=None, 
+        output_format='gtiff', download_folder=None, fetch_config=None, resources=None): 
+    
+    # Each acquisition is geocoded and mosaicked once onto <grid>, and the dates are written into a 
+    # single cube. Pairs are read from it as views (see storage.read_pair_view): 
+    completed = {} if completed is None else completed
+    output = []
+    resources = profiles.Resources(geocode=None, mosaic=None) if resources is None else resources
+    dem_tiles = _dem_tiles(tile_set, grid, tile_key, tile_cache)
+    
+    # DEM first, the cube takes its raster attributes (CRS, transform) from it: 
+    if 'dem' in completed: 
+        dem = completed['dem']
+    else: 
+        fn = storage.sample_path(folder, uuid, 'dem', output_format)
+        with profiles.annotate('cpu', resources.mosaic): 
+            dem = record_stage(_dem_to_file(dem_tiles, fn, grid, output_format, uuid=uuid), folder, uuid, 'dem')
+    
+    if 'stack' in completed: 
+        output.append(completed['stack'])
+    else: 
+        fn = storage.stack_path(folder, uuid)
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        storage.clear_stack(fn)
+        date_tiles = [
+            _geocoded_tiles(group, grid, tile_set, dem_tiles, tile_key, tile_cache, download_folder, fetch_config, 
+                memory=resources.geocode) 
+            for group in stack['dates']
+        ]
+        with profiles.annotate('cpu', resources.mosaic): 
+            dates = [_date_to_stack(tiles, fn, i, len(date_tiles), grid, uuid=uuid) for i, tiles in enumerate(date_tiles)]
+        attrs = {
+            'dates': [_acquisition_time(group) for group in stack['dates']], 
+            'products': [[product_id(p) for p in group] for group in stack['dates']], 
+            'pairs': [pair for _, pair in stack['pairs']], 
         }
+        output.append(record_stage(_finish_stack(dates, fn, attrs, dem, uuid=uuid), folder, uuid, 'stack'))
+    
+    output.append(dem)
+    return output
+
+
+_date_to_stack = dask.delayed(writers.write_date)
+
+
+@dask.delayed
+def _finish_stack(dates, fn, attrs, dem, uuid=None): 
+    with metrics.measure('stack-write', uuid, dates=len(dates)) as record: 
+        return metrics.output_bytes(record, storage.finish_stack(fn, attrs=attrs, like=dem))
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  SEARCH S1-PAIRS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
 
-    res = asf.search(query)
-
-    prods = sorted([r.properties for r in res], key=lambda x: x['pathNumber'])
-    pairs = []
-    for _, _prods in itertools.groupby(prods, lambda x: x['pathNumber']):
-        _prods = sorted(_prods, key=lambda x: x['startTime'])
-        adj_prods = rastertools.group_adjacent(list(_prods), 
-            duration_getter=lambda x: [np.datetime64(x['startTime']), np.datetime64(x['stopTime'])])
-        for a, b in zip(adj_prods[:-1], adj_prods[1:]): 
-            _t0 = np.min([parser.parse(p['startTime'].rstrip('Z')) for p in a])
-            _t1 = np.min([parser.parse(p['startTime'].rstrip('Z')) for p in b])
-            if exact_times:
-                if np.abs(_t0 - t_0) < datetime.timedelta(minutes=10) and \
-                    np.abs(_t1 - t_1) < datetime.timedelta(minutes=10): 
-                    pairs.append([a,b])
-            else: 
-                if _t1 < t_0: 
-                    pass
-                elif _t0 > t_1:
-                    pass
-                else:  
-                    pairs.append([a,b])
 
-    return pairs
+# Searching and pairing live in skreddata.search (no gdar needed), inputs are copied here as before: 
+search_grd_pairs = decorators.input_as_copy(search.search_grd_pairs)
+search_grd_pairs_batch = decorators.input_as_copy(search.search_grd_pairs_batch)
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
@@ -190,30 +309,172 @@ def search_grd_pairs(aoi, t_0, t_1, space_buffer=7_500, exact_times=False):
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
 
 
+def _target_refsys(aoi_shp, refsys=None): 
+    if refsys is None: 
+        refsys_wkt = shapetools.utm_from_shape(aoi_shp)[0]
+        refsys = meta.Meta_refsys({'type':'crs', 'wkt':refsys_wkt})
+    return refsys
+
+
+def _grid_origin(aoi_shp, refsys, shape, snap=False): 
+    
+    # Grid centred on the AOI. Snapped, the origin lies on a lattice of the sample spacing shared by all 
+    # AOIs in the projection (UTM zone), so grids of nearby AOIs (and the tile-set) are pixel aligned: 
+    centroid_geod = np.array(aoi_shp.centroid.coords[0])[::-1]  # GDAR-convention (lat, lon)
+    centroid_coord = refsys.get_functionality('coord_from_geod')(centroid_geod)
+    origin = centroid_coord - GRID_SSP*np.array(shape)//2
+    if snap: 
+        origin = np.floor(origin/GRID_SSP)*GRID_SSP
+    return origin
+
+
+def _make_grid(origin, shape, refsys): 
+    return meta.Meta_grid({
+        'origin': np.asarray(origin),
+        'shape': np.asarray(shape),
+        'offset': np.array([0, 0]),
+        'samplespacing': GRID_SSP,
+        'refsys': refsys
+    })
+
+
+def _grid_bounds(origin, shape): 
+    # (left, bottom, right, top) of a grid with (northing, easting) origin at its lower left corner: 
+    return (origin[1], origin[0], origin[1] + shape[1]*GRID_SSP[1], origin[0] + shape[0]*GRID_SSP[0])
+
+
+def plan_clusters(aois, refsys=None, shape=(1024, 1024), max_extent=20_000): 
+    
+    # Nearby AOIs in the same projection, grouped greedily into clusters whose snapped, common grid spans 
+    # at most <max_extent> meters. Returns a cluster per AOI ({'key', 'origin', 'shape'}), or None for 
+    # AOIs alone in their cluster: 
+    specs = collections.defaultdict(list)
+    for i, aoi in enumerate(aois): 
+        aoi_shp = shapely.wkt.loads(shapetools.misc_to_wkt(aoi))
+        _refsys = _target_refsys(aoi_shp, refsys)
+        bounds = _grid_bounds(_grid_origin(aoi_shp, _refsys, shape, snap=True), shape)
+        specs[dask.base.tokenize(_refsys[...])].append((i, _refsys, bounds))
+    
+    plans = [None]*len(aois)
+    for projection, members in specs.items(): 
+        clusters = []
+        for i, _refsys, bounds in members: 
+            for cluster in clusters: 
+                merged = (
+                    min(bounds[0], cluster['bounds'][0]), min(bounds[1], cluster['bounds'][1]), 
+                    max(bounds[2], cluster['bounds'][2]), max(bounds[3], cluster['bounds'][3])
+                )
+                if max(merged[2] - merged[0], merged[3] - merged[1]) <= max_extent: 
+                    cluster['bounds'] = merged
+                    cluster['members'].append(i)
+                    break
+            else: 
+                clusters.append({'bounds': bounds, 'members': [i]})
+        
+        for cluster in clusters: 
+            if len(cluster['members']) < 2: 
+                continue
+            left, bottom, right, top = cluster['bounds']
+            plan = {
+                'key': dask.base.tokenize(projection, cluster['bounds'])[:16], 
+                'origin': (float(bottom), float(left)), 
+                'shape': (int(round((top - bottom)/GRID_SSP[0])), int(round((right - left)/GRID_SSP[1]))), 
+            }
+            for i in cluster['members']: 
+                plans[i] = plan
+    
+    return plans
+
+
+def _pair_uuid(uuid, n, n_pairs): 
+    return str(uuid) + f'_{n:02d}' if n_pairs > 1 else str(uuid)
+
+
+def _completed_stages(db, folder, uuid, force=False, verify='size', stages=manifest.STAGES, item_uuids=None): 
+    
+    # Completed stages to resume from, or None if the sample is done. Items in the database without a 
+    # manifest were made before manifests were written, and are taken as complete: 
+    item_uuids = [uuid] if item_uuids is None else item_uuids
+    existing = [doc['uuid'] for doc in db.iterate({'uuid': {'$in': item_uuids}}, projection={'uuid': 1})]
+    if force: 
+        for _uuid in existing: 
+            logger.info(f'UUID exists in database but forced processing, removing UUID={_uuid}')
+            db.remove_by_uuid(_uuid)
+        manifest.clear(folder, uuid)
+        return {}
+    
+    if len(existing) == len(item_uuids) and manifest.complete(folder, uuid, stages=stages, verify=verify): 
+        logger.info(f'UUID exists in database, skipping UUID={uuid}')
+        return None
+    completed = manifest.completed_stages(folder, uuid, verify=verify)
+    if completed: 
+        logger.info(f'Resuming UUID={uuid}, completed stages: {list(completed)}')
+    return completed
+
+
+def _main_stacks(aoi, aoi_wkt, t_0, t_1, folder, uuid, pairs, grid, tile_set, tile_key, db, label=None, comment=None, 
+        force=False, tile_cache=None, output_format='gtiff', insert=True, database_url=None, verify='size', 
+        download_folder=None, fetch_config=None, resources=None): 
+    
+    # One sample per orbit path, holding the cube of all its dates. Each pair is still a database item 
+    # (with the UUID it has in pair mode), pointing to its dates in the stack: 
+    output = {}
+    for path, stack in stacks_from_pairs(pairs).items(): 
+        
+        _uuid = f'{uuid}_p{int(path):03d}'
+        item_uuids = [_pair_uuid(uuid, n, len(pairs)) for n, _ in stack['pairs']]
+        completed = _completed_stages(db, folder, _uuid, force=force, verify=verify, stages=manifest.STACK_STAGES, 
+            item_uuids=item_uuids)
+        if completed is None: 
+            continue
+        
+        output_files = []
+        if 'products' in completed: 
+            output_files += [completed['products']]
+        else: 
+            output_files += [record_stage(write_pair_json(_uuid, folder, stack), folder, _uuid, 'products')]
+        if 'input' in completed: 
+            output_files += [completed['input']]
+        else: 
+            output_files += [record_stage(write_input_geojson(_uuid, folder, aoi, t_0, t_1), folder, _uuid, 'input')]
+        output_files += write_stack_and_dem(_uuid, folder, stack, grid, tile_set, tile_key=tile_key, tile_cache=tile_cache, 
+            completed=completed, output_format=output_format, download_folder=download_folder, fetch_config=fetch_config, 
+            resources=resources)
+        
+        items = [
+            database.Item(
+                uuid=item_uuid, 
+                geometry=aoi_wkt, 
+                t_0=t_0, 
+                t_1=t_1, 
+                label=label, 
+                comment=comment, 
+                json={'stack': _uuid, 'dates': dates}
+            )
+            for item_uuid, (_, dates) in zip(item_uuids, stack['pairs'])
+        ]
+        output[_uuid] = {
+            'files': output_files, 
+            'database_items': [add_to_database(itm, output_files, insert=insert, database_url=database_url) for itm in items]
+        }
+    
+    return output
+
+
 @decorators.input_as_copy
-def main(aoi, toi, folder, refsys=None, shape=None, uuid=None, comment=None, label=None, force=False): 
+def main(aoi, toi, folder, refsys=None, shape=None, uuid=None, comment=None, label=None, force=False, pairs=None, search_cache=None, 
+        tile_cache=None, crop=False, output_format='gtiff', insert=True, 
+        database_url=None, verify='size', download_folder=None, fetch_config=None, stack=False, snap=False, cluster=None): 
     
     # AOI: 
     aoi_wkt = shapetools.misc_to_wkt(aoi)
     aoi_shp = shapely.wkt.loads(aoi_wkt)
     
     # Time interval: 
-    if np.isscalar(toi): 
-        t_0 = toi
-        t_1 = toi
-    elif len(toi) == 1: 
-        t_0 = toi[0]
-        t_1 = toi[0]
-    elif len(toi) == 2: 
-        t_0 = toi[0]
-        t_1 = toi[1]
-    else: 
-        raise Exception('<toi> must be scalar or list of length 1 or 2')
+    t_0, t_1 = _parse_toi(toi)
     
     # Target refsys: 
-    if refsys is None: 
-        refsys_wkt = shapetools.utm_from_shape(aoi_shp)[0]
-        refsys = meta.Meta_refsys({'type':'crs', 'wkt':refsys_wkt})
+    refsys = _target_refsys(aoi_shp, refsys)
     
     # Image shape: 
     if shape is None: 
@@ -224,58 +485,78 @@ def main(aoi, toi, folder, refsys=None, shape=None, uuid=None, comment=None, lab
         ser = json.dumps((aoi_wkt, str(t_0), str(t_1), refsys[...], shape)).encode("utf-8")
         uuid = hashlib.sha256(ser).hexdigest()[:10]
 
-    # Target grid: 
-    centroid_geod = np.array(aoi_shp.centroid.coords[0])[::-1]  # GDAR-convention (lat, lon)
-    centroid_coord = refsys.get_functionality('coord_from_geod')(centroid_geod)
-    grid_shape = np.array(shape)
-    grid_ssp = np.array([10, 10])
-    grid = meta.Meta_grid({
-        'origin': centroid_coord - grid_ssp*grid_shape//2,
-        'shape': grid_shape,
-        'offset': np.array([0, 0]),
-        'samplespacing': grid_ssp,
-        'refsys': refsys
-    })
+    # Target grid, snapped to the shared lattice for clustered samples: 
+    snap = snap or cluster is not None
+    origin = _grid_origin(aoi_shp, refsys, shape, snap=snap)
+    grid = _make_grid(origin, shape, refsys)
+    grid_ssp = GRID_SSP
+    
+    # Cluster grid the sample is cut from: 
+    mosaic_shape = shape
+    if cluster is not None and not stack: 
+        mosaic_shape = cluster['shape']
+        cluster = {
+            'key': cluster['key'], 
+            'grid': _make_grid(cluster['origin'], cluster['shape'], refsys), 
+            'bounds': _grid_bounds(origin, shape)
+        }
+    else: 
+        cluster = None
     
     # Tile-set: 
+    tile_shape = cropped_tile_shape(shape) if crop else TILE_SHAPE
     tile_set = tileset.QuadTileSet(
-        tile_shape=(2048, 2048), 
+        tile_shape=tile_shape, 
         refsys=refsys, 
         origin='centered-y', 
         sample_spacing=grid_ssp
     )
+    tile_key = dask.base.tokenize(refsys[...], tile_shape, 'centered-y', grid_ssp)
+    
+    # Memory of geocoding and mosaicking tasks, for resource annotated profiles: 
+    resources = profiles.Resources.for_shapes(tile_shape, mosaic_shape)
     
     # Database: 
-    db = database.Database()
+    db = database.open_database(database_url)
+    
+    # Search pairs, unless already given (e.g. from a batched search): 
+    if pairs is None: 
+        pairs = search_grd_pairs(aoi_wkt, t_0, t_1, cache=search_cache, fetch_config=fetch_config)
     
-    # Search pairs: 
-    pairs = search_grd_pairs(aoi_wkt, t_0, t_1)
+    # Stack mode, one time-series cube per orbit path: 
+    if stack: 
+        return _main_stacks(aoi, aoi_wkt, t_0, t_1, folder, uuid, pairs, grid, tile_set, tile_key, db, label=label, 
+            comment=comment, force=force, tile_cache=tile_cache, output_format=output_format, insert=insert, 
+            database_url=database_url, verify=verify, download_folder=download_folder, fetch_config=fetch_config, 
+            resources=resources)
     
     # Process each pair: 
     output = {}
     for n, pair in enumerate(pairs): 
         
-        _uuid = str(uuid) + f'_{n:02d}' if len(pairs) > 1 else str(uuid)
-        
-        # Check database for UUID: 
-        if db.get_by_uuid(_uuid) is not None:
-            if force: 
-                logger.info(f'UUID exists in database but forced processing, removing UUID={_uuid}')
-                db.remove_by_uuid(_uuid)
-            else: 
-                logger.info(f'UUID exists in database, skipping UUID={_uuid}')
-                continue  
+        _uuid = _pair_uuid(uuid, n, len(pairs))
+        completed = _completed_stages(db, folder, _uuid, force=force, verify=verify)
+        if completed is None: 
+            continue
         
         output_files = []
         
         # Write products JSON: 
-        output_files += [write_pair_json(_uuid, folder, pair)]
+        if 'products' in completed: 
+            output_files += [completed['products']]
+        else: 
+            output_files += [record_stage(write_pair_json(_uuid, folder, pair), folder, _uuid, 'products')]
         
         # Write input GEOJSON
-        output_files += [write_input_geojson(_uuid, folder, aoi, t_0, t_1)]
+        if 'input' in completed: 
+            output_files += [completed['input']]
+        else: 
+            output_files += [record_stage(write_input_geojson(_uuid, folder, aoi, t_0, t_1), folder, _uuid, 'input')]
         
         # Write RCS and DEM: 
-        output_files += write_rcs_and_dem(_uuid, folder, pair, grid, tile_set)
+        output_files += write_rcs_and_dem(_uuid, folder, pair, grid, tile_set, tile_key=tile_key, tile_cache=tile_cache, 
+            output_format=output_format, completed=completed, download_folder=download_folder, fetch_config=fetch_config, 
+            cluster=cluster, resources=resources)
         
         # Make database item: 
         itm = database.Item(
@@ -290,7 +571,7 @@ def main(aoi, toi, folder, refsys=None, shape=None, uuid=None, comment=None, lab
         # Add to outputs: 
         output[_uuid] = {
             'files': output_files, 
-            'database_item': add_to_database(itm)
+            'database_item': add_to_database(itm, output_files, insert=insert, database_url=database_url)
         }
         
     return output
@@ -305,6 +586,10 @@ if __name__ == '__main__':
     p.add_argument('--shape', nargs='+', type=int, help='Shape as two integers. ', required=False)
     p.add_argument('--epsg', type=int, help='Target EPSG.', required=False)
     p.add_argument('--uuid', type=str, help='Universal unique identifier. If not set, it will be derived from the input arguments.', required=False)
+    p.add_argument('--crop', action='store_true', help='Geocode on tiles sized to the image shape. ')
+    p.add_argument('--stack', action='store_true', help='Write one time-series stack per orbit path instead of one file per pair. ')
+    p.add_argument('--profile', type=str, default='processes', choices=profiles.PROFILES, help='Execution profile (see profiles.start). ')
+    p.add_argument('--scheduler', type=str, help='Scheduler address of the distributed profile. ', required=False)
     args = p.parse_args()
     
     if args.epsg is not None: 
@@ -318,16 +603,25 @@ if __name__ == '__main__':
     else: 
         refsys = None
         
-    outputs = main(args.area_of_interest, args.time_of_interest, args.target, refsys=refsys, shape=args.shape, uuid=args.uuid)
- 
-    """
-    with dask.config.set(scheduler='synchronous'):
-        outputs = dask.compute(outputs)[0]
-    """
-    
-    cluster = distributed.LocalCluster()
-    with distributed.Client(cluster):
+    # Workers are started before planning, as tasks are annotated for the resources they hold: 
+    shape = (1024, 1024) if args.shape is None else tuple(args.shape)
+    tile_shape = cropped_tile_shape(shape) if args.crop else TILE_SHAPE
+    client = profiles.start(args.profile, tile_shape, shape, address=args.scheduler)
+    try: 
+        
+        # Tile caches sized to a share of the worker memory: 
+        tile_cache = tilecache.Config(max_items=profiles.tile_cache_items(tile_shape, profiles.worker_memory(client)))
+        outputs = main(args.area_of_interest, args.time_of_interest, args.target, refsys=refsys, shape=args.shape, uuid=args.uuid, 
+            tile_cache=tile_cache, crop=args.crop, stack=args.stack)
+        
+        """
+        with dask.config.set(scheduler='synchronous'):
+            outputs = dask.compute(outputs)[0]
+        """
+        
         outputs = dask.compute(outputs)[0] 
+    finally: 
+        profiles.stop(client)
     
     print(outputs)
     
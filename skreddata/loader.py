@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import logging
+import itertools
+import collections
+import dataclasses
+import concurrent.futures
+import numpy as np
+
+from skreddata import storage
+
+
+logger = logging.getLogger(__name__)
+
+
+LAYERS = ('crs', 'dem')
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  SAMPLES
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+@dataclasses.dataclass(frozen=True)
+class FileSample:
+    uuid: str
+    label: int
+    files: dict
+
+    def shape(self):
+        return storage.read_shape(next(iter(self.files.values())))[1:]
+
+    def read(self, window=None):
+        return {name: storage.read_window(fn, window) for name, fn in self.files.items()}
+
+
+@dataclasses.dataclass(frozen=True)
+class PackedSample:
+    uuid: str
+    label: int
+    dataset: object
+    index: int
+
+    def shape(self):
+        return next(iter(self.dataset.layers.values())).shape[2:]
+
+    def read(self, window=None):
+        return self.dataset.read(self.index, window)
+
+
+@dataclasses.dataclass(frozen=True)
+class StackSample:
+    # A pair read as a view on the time-series stack of its AOI and orbit path:
+    uuid: str
+    label: int
+    stack: str
+    dates: tuple
+    dem: str
+
+    def shape(self):
+        return storage.read_shape(self.dem)[1:]
+
+    def read(self, window=None):
+        return {'crs': storage.read_pair_view(self.stack, *self.dates, window), 'dem': storage.read_window(self.dem, window)}
+
+
+def _stack_sample(doc, folder):
+    ref = json.loads(doc['json']) if isinstance(doc.get('json'), str) else None
+    if not ref or 'stack' not in ref:
+        return None
+    stack = storage.stack_path(folder, ref['stack'])
+    dem = storage.find_sample_path(folder, ref['stack'], 'dem')
+    if not os.path.exists(stack) or dem is None:
+        return None
+    return StackSample(doc['uuid'], doc.get('label'), stack, tuple(ref['dates']), dem)
+
+
+def samples_from_database(db, folder, labeled=True, layers=LAYERS):
+    projection = {'uuid': 1, 'label': 1, 'json': 1}
+    docs = db.iter_labeled(projection=projection) if labeled else db.iter_all(projection=projection)
+    samples = []
+    for doc in docs:
+        sample = _stack_sample(doc, folder)
+        if sample is not None:
+            samples.append(sample)
+            continue
+        files = {name: storage.find_sample_path(folder, doc['uuid'], name) for name in layers}
+        if any(fn is None for fn in files.values()):
+            logger.debug(f'Missing files, skipping UUID={doc["uuid"]}')
+            continue
+        samples.append(FileSample(doc['uuid'], doc.get('label'), files))
+    return samples
+
+
+def samples_from_pack(dataset, labeled=True):
+    from skreddata.pack import NO_LABEL
+    return [
+        PackedSample(uuid, None if label == NO_LABEL else int(label), dataset, i)
+        for i, (uuid, label) in enumerate(zip(dataset.uuid, dataset.label))
+        if not labeled or label != NO_LABEL
+    ]
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  THROUGHPUT
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+@dataclasses.dataclass(frozen=False)
+class Stats:
+    samples: int = 0
+    batches: int = 0
+    bytes: int = 0
+    read_seconds: float = 0.0       # Summed over reader threads (I/O and decode)
+    collate_seconds: float = 0.0    # Stacking samples into batches
+    wait_seconds: float = 0.0       # Consumer blocked on reads not yet done
+    wall_seconds: float = 0.0
+
+    def summary(self):
+        wall = max(self.wall_seconds, 1e-9)
+        return {
+            'samples': self.samples,
+            'batches': self.batches,
+            'samples_per_second': self.samples/wall,
+            'mb_per_second': self.bytes/wall/1024**2,
+            'read_ms_per_sample': 1000*self.read_seconds/max(self.samples, 1),
+            'collate_seconds': self.collate_seconds,
+            'wait_seconds': self.wait_seconds,
+
+            # Close to 1 when reading is the bottleneck, close to 0 when the consumer is:
+            'wait_fraction': self.wait_seconds/wall,
+        }
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  LOADER
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+class Loader:
+
+    def __init__(self, samples, batch_size=16, crop=None, shuffle=False, seed=None, workers=8, prefetch=4, drop_last=False):
+        self.samples = list(samples)
+        self.batch_size = batch_size
+        self.crop = None if crop is None else tuple(np.broadcast_to(crop, 2))
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.workers = workers
+        self.prefetch = prefetch
+        self.drop_last = drop_last
+        self.stats = Stats()
+
+    @classmethod
+    def from_database(cls, db, folder, labeled=True, **kwargs):
+        return cls(samples_from_database(db, folder, labeled=labeled), **kwargs)
+
+    @classmethod
+    def from_pack(cls, dataset, labeled=True, **kwargs):
+        return cls(samples_from_pack(dataset, labeled=labeled), **kwargs)
+
+    def __len__(self):
+        n, rest = divmod(len(self.samples), self.batch_size)
+        return n if self.drop_last or rest == 0 else n + 1
+
+    def _window(self, sample, seed):
+        if self.crop is None:
+            return None
+        shape = tuple(sample.shape())
+        if any(c > s for s, c in zip(shape, self.crop)):
+            raise Exception(f'Crop {self.crop} is larger than sample UUID={sample.uuid} of shape {shape}')
+        rng = np.random.default_rng(seed)
+        r0, c0 = [int(rng.integers(0, s - c + 1)) for s, c in zip(shape, self.crop)]
+        return (r0, r0 + self.crop[0]), (c0, c0 + self.crop[1])
+
+    def _read(self, sample, seed):
+        t = time.perf_counter()
+        data = sample.read(self._window(sample, seed))
+        return data, time.perf_counter() - t
+
+    def _collate(self, samples, reads):
+        t = time.perf_counter()
+        batch = {name: np.stack([data[name] for data, _ in reads]) for name in reads[0][0]}
+        batch['label'] = np.array([-1 if s.label is None else s.label for s in samples])
+        batch['uuid'] = [s.uuid for s in samples]
+        self.stats.collate_seconds += time.perf_counter() - t
+        self.stats.read_seconds += sum(dt for _, dt in reads)
+        self.stats.bytes += sum(arr.nbytes for data, _ in reads for arr in data.values())
+        self.stats.samples += len(samples)
+        self.stats.batches += 1
+        return batch
+
+    def __iter__(self):
+        order = self.rng.permutation(len(self.samples)) if self.shuffle else np.arange(len(self.samples))
+        seeds = self.rng.integers(0, 2**32, len(order))
+        batches = [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches = batches[:-1]
+
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+
+            # Keep <prefetch> batches of reads in flight ahead of the consumer:
+            def submit(indices):
+                return indices, [pool.submit(self._read, self.samples[i], seeds[i]) for i in indices]
+
+            pending = collections.deque(submit(b) for b in itertools.islice(batches, self.prefetch))
+            remaining = iter(batches[self.prefetch:])
+            try:
+                while pending:
+                    indices, futures = pending.popleft()
+                    t = time.perf_counter()
+                    reads = [f.result() for f in futures]
+                    self.stats.wait_seconds += time.perf_counter() - t
+                    for b in itertools.islice(remaining, 1):
+                        pending.append(submit(b))
+                    batch = self._collate([self.samples[i] for i in indices], reads)
+                    self.stats.wall_seconds = time.perf_counter() - start
+                    yield batch
+            finally:
+
+                # On early exit (break, error or close), reads not started are dropped, and only those
+                # running are waited for:
+                for _, futures in pending:
+                    for f in futures:
+                        f.cancel()
+
+        logger.info(f'Loader throughput: {self.stats.summary()}')
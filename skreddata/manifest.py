@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+import contextlib
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+STAGES = ('products', 'input', 'crs', 'dem')
+STACK_STAGES = ('products', 'input', 'stack', 'dem')
+VERIFY = ('size', 'checksum')
+
+
+def manifest_path(folder, uuid):
+    return os.path.join(folder, uuid, f'{uuid}_manifest.json')
+
+
+def _files(fn):
+    # A directory store (e.g. Zarr) is checksummed over its files in a fixed order:
+    if not os.path.isdir(fn):
+        return [fn]
+    return sorted(os.path.join(root, f) for root, _, files in os.walk(fn) for f in files)
+
+
+def checksum(fn, block_size=2**20):
+    h = hashlib.sha256()
+    for _fn in _files(fn):
+        h.update(os.path.relpath(_fn, fn).encode('utf-8'))
+        with open(_fn, 'rb') as fp:
+            for block in iter(lambda: fp.read(block_size), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
+def size(fn):
+    return sum(os.path.getsize(_fn) for _fn in _files(fn))
+
+
+@contextlib.contextmanager
+def _locked(folder, uuid):
+    # Stages of one sample finish concurrently on different workers:
+    fn = manifest_path(folder, uuid)
+    os.makedirs(os.path.dirname(fn), exist_ok=True)
+    with open(f'{fn}.lock', 'w') as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield fn
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def load(folder, uuid):
+    fn = manifest_path(folder, uuid)
+    if not os.path.exists(fn):
+        return None
+    with open(fn) as fp:
+        return json.load(fp)
+
+
+def _dump(manifest, fn):
+    tmp = f'{fn}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as fp:
+        json.dump(manifest, fp, indent=2)
+    os.replace(tmp, fn)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  RECORD
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def record(folder, uuid, stage, fn):
+    entry = {
+        'file': os.path.relpath(fn, os.path.join(folder, uuid)),
+        'sha256': checksum(fn),
+        'size': size(fn),
+        'time': time.time(),
+    }
+    with _locked(folder, uuid) as manifest_fn:
+        manifest = load(folder, uuid) or {'uuid': uuid, 'stages': {}}
+        manifest['stages'][stage] = entry
+        _dump(manifest, manifest_fn)
+    logger.debug(f'Recorded stage {stage} for UUID={uuid}')
+    return fn
+
+
+def clear(folder, uuid):
+    with _locked(folder, uuid) as manifest_fn:
+        if os.path.exists(manifest_fn):
+            os.remove(manifest_fn)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  VERIFY
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def completed_stages(folder, uuid, verify='size'):
+
+    # Stages whose recorded output still exists and matches, as {stage: file}. With verify='size' only
+    # sizes are compared, with 'checksum' the outputs are re-hashed:
+    if verify not in VERIFY:
+        raise Exception(f'<verify> must be one of {VERIFY}, got {verify}')
+    manifest = load(folder, uuid)
+    if manifest is None:
+        return {}
+
+    completed = {}
+    for stage, entry in manifest['stages'].items():
+        fn = os.path.join(folder, uuid, entry['file'])
+        if not os.path.exists(fn) or size(fn) != entry['size']:
+            logger.info(f'Stage {stage} output missing or changed for UUID={uuid}')
+            continue
+        if verify == 'checksum' and checksum(fn) != entry['sha256']:
+            logger.info(f'Stage {stage} checksum mismatch for UUID={uuid}')
+            continue
+        completed[stage] = fn
+    return completed
+
+
+def complete(folder, uuid, stages=STAGES, verify='size'):
+
+    # Whether a sample in the database is done: all <stages> completed, or no manifest at all (made
+    # before manifests were written):
+    if load(folder, uuid) is None:
+        return True
+    completed = completed_stages(folder, uuid, verify=verify)
+    return all(stage in completed for stage in stages)
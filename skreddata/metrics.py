@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import uuid as _uuid
+import resource
+import threading
+import contextlib
+import collections
+import logging
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+METRICS_ENV = 'SKREDDATA_METRICS'
+RUN_ENV = 'SKREDDATA_METRICS_RUN'
+
+_LOCK = threading.Lock()
+
+
+def _peak_rss_mb():
+    # Peak resident memory of the process so far (kB on Linux):
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def _size(fn):
+    from skreddata import manifest
+    try:
+        return manifest.size(fn)
+    except (OSError, TypeError):
+        return None
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  CONFIGURATION
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def configure(path, run=None):
+
+    # Set through the environment, so worker processes started from here write to the same file. For
+    # an existing distributed cluster, run this on the workers too (client.run(configure, path, run)):
+    run = _uuid.uuid4().hex[:12] if run is None else run
+    if path is None:
+        os.environ.pop(METRICS_ENV, None)
+        os.environ.pop(RUN_ENV, None)
+        return run
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    os.environ[METRICS_ENV] = path
+    os.environ[RUN_ENV] = run
+    return run
+
+
+def enabled():
+    return os.environ.get(METRICS_ENV) is not None
+
+
+def emit(record):
+    path = os.environ.get(METRICS_ENV)
+    if path is None:
+        return
+    record = {'run': os.environ.get(RUN_ENV), 'pid': os.getpid(), 'time': time.time(), **record}
+    line = json.dumps(record, default=str) + '\n'
+
+    # Single appends of one line, so processes sharing the file do not interleave records:
+    with _LOCK:
+        with open(path, 'a') as fp:
+            fp.write(line)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  MEASURE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+@contextlib.contextmanager
+def measure(stage, uuid=None, **fields):
+
+    # Wall and CPU time (of the calling thread, i.e. the task) and peak memory of one stage. Fields
+    # set on the yielded record (bytes_in, bytes_out, cache_hit, ...) are emitted with it:
+    record = {'stage': stage, 'uuid': uuid, **fields}
+    if not enabled():
+        yield record
+        return
+
+    wall, cpu, rss = time.perf_counter(), time.thread_time(), _peak_rss_mb()
+    record['ok'] = False
+    try:
+        yield record
+        record['ok'] = True
+    finally:
+        record['wall_s'] = time.perf_counter() - wall
+        record['cpu_s'] = time.thread_time() - cpu
+        record['peak_rss_mb'] = _peak_rss_mb()
+        record['peak_rss_growth_mb'] = record['peak_rss_mb'] - rss
+        emit(record)
+
+
+def output_bytes(record, fn):
+    if enabled():
+        record['bytes_out'] = _size(fn)
+    return fn
+
+
+def input_bytes(record, fns):
+    if enabled():
+        record['bytes_in'] = sum(_size(fn) or 0 for fn in fns if isinstance(fn, (str, os.PathLike)))
+    return fns
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  SUMMARY
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def load(path, run=None):
+    if not os.path.exists(path):
+        return []
+    with open(path) as fp:
+        records = [json.loads(line) for line in fp if line.strip()]
+    return [r for r in records if run is None or r.get('run') == run]
+
+
+def summarize(records):
+
+    # Totals per stage, with percentiles of wall time and cache hit rates where stages report them:
+    stages = collections.defaultdict(list)
+    for r in records:
+        stages[r['stage']].append(r)
+
+    summary = {}
+    for stage, rs in stages.items():
+        wall = np.array([r.get('wall_s', 0) for r in rs])
+        hits = [r['cache_hit'] for r in rs if r.get('cache_hit') is not None]
+        summary[stage] = {
+            'count': len(rs),
+            'failed': sum(not r.get('ok', True) for r in rs),
+            'uuids': len({r['uuid'] for r in rs if r.get('uuid') is not None}),
+            'wall_s': float(wall.sum()),
+            'wall_s_p50': float(np.percentile(wall, 50)),
+            'wall_s_p95': float(np.percentile(wall, 95)),
+            'cpu_s': float(sum(r.get('cpu_s', 0) for r in rs)),
+            'bytes_in': int(sum(r.get('bytes_in') or 0 for r in rs)),
+            'bytes_out': int(sum(r.get('bytes_out') or 0 for r in rs)),
+            'peak_rss_mb': float(max(r.get('peak_rss_mb', 0) for r in rs)),
+            'cache_hit_rate': sum(hits)/len(hits) if hits else None,
+        }
+    return dict(sorted(summary.items(), key=lambda x: -x[1]['wall_s']))
+
+
+def per_uuid(records):
+    # Wall time per stage for each UUID, e.g. to find the slow samples of a run:
+    table = collections.defaultdict(lambda: collections.defaultdict(float))
+    for r in records:
+        if r.get('uuid') is not None:
+            table[r['uuid']][r['stage']] += r.get('wall_s', 0)
+    return {uuid: dict(stages) for uuid, stages in table.items()}
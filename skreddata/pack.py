@@ -0,0 +1,165 @@
+import os
+import json
+import logging
+import functools
+import datetime as dt
+import numpy as np
+import h5py
+
+from skreddata import storage
+
+
+logger = logging.getLogger(__name__)
+
+
+NO_LABEL = -1
+LAYERS = ('crs', 'dem')
+
+
+def _unix_ns(time):
+    if time.tzinfo is not None:
+        time = time.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return np.datetime64(time, 'ns').astype(np.int64)
+
+
+def _bbox(geometry):
+    import shapely.wkt
+    return shapely.wkt.loads(geometry).bounds
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  PACK
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def _file_layers(item, folder):
+    files = {name: storage.find_sample_path(folder, item.uuid, name) for name in LAYERS}
+    if any(fn is None for fn in files.values()):
+        return None
+    return {name: (storage.read_shape(fn), functools.partial(storage.read_window, fn)) for name, fn in files.items()}
+
+
+def _stack_layers(item, folder, ref):
+
+    # Items of stack mode point to their dates in the stack of their AOI and orbit path (see
+    # generate._main_stacks). The pair is packed as a pair file would hold it, bands of date i
+    # followed by bands of date j:
+    stack = storage.stack_path(folder, ref['stack'])
+    dem = storage.find_sample_path(folder, ref['stack'], 'dem')
+    if not os.path.exists(stack) or dem is None:
+        return None
+    _, bands, height, width = storage.read_shape(stack)
+    return {
+        'crs': ((2*bands, height, width), functools.partial(storage.read_pair_view, stack, *ref['dates'])),
+        'dem': (storage.read_shape(dem), functools.partial(storage.read_window, dem)),
+    }
+
+
+def find_samples(items, folder):
+
+    # Database items with all layers on disk, as {name: (shape, read)} per item, and the shape of each
+    # layer:
+    samples = []
+    shapes = None
+    for item in items:
+        ref = json.loads(item.json) if item.json else None
+        if isinstance(ref, dict) and 'stack' in ref:
+            layers = _stack_layers(item, folder, ref)
+        else:
+            layers = _file_layers(item, folder)
+        if layers is None:
+            logger.info(f'Missing files, skipping UUID={item.uuid}')
+            continue
+        _shapes = {name: shape for name, (shape, _) in layers.items()}
+        if shapes is None:
+            shapes = _shapes
+        elif _shapes != shapes:
+            logger.warning(f'Shape {_shapes} differs from {shapes}, skipping UUID={item.uuid}')
+            continue
+        samples.append((item, layers))
+    return samples, shapes
+
+
+def pack(items, folder, fn, compression=None, dtype='float32'):
+
+    samples, shapes = find_samples(items, folder)
+    if not samples:
+        raise Exception(f'No samples found in {folder}')
+    n = len(samples)
+    logger.info(f'Packing {n} samples into {fn}')
+
+    with h5py.File(fn, 'w') as f:
+
+        # One chip per chunk when compressed, otherwise contiguous so that each chip is a single
+        # seek and the layers can be memory mapped:
+        for name, shape in shapes.items():
+            chunks = (1, *shape) if compression is not None else None
+            f.create_dataset(name, shape=(n, *shape), dtype=dtype, chunks=chunks, compression=compression)
+
+        index = f.create_group('index')
+        index.create_dataset('uuid', data=np.array([itm.uuid for itm, _ in samples], dtype=h5py.string_dtype()))
+        index.create_dataset('label', data=np.array([NO_LABEL if itm.label is None else itm.label for itm, _ in samples], dtype=np.int8))
+        index.create_dataset('t_0', data=np.array([_unix_ns(itm.t_0) for itm, _ in samples], dtype=np.int64))
+        index.create_dataset('t_1', data=np.array([_unix_ns(itm.t_1) for itm, _ in samples], dtype=np.int64))
+        index.create_dataset('bbox', data=np.array([_bbox(itm.geometry) for itm, _ in samples], dtype=np.float64))
+
+        for i, (itm, layers) in enumerate(samples):
+            for name, (_, read) in layers.items():
+                f[name][i] = read()
+
+    return fn
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  READ
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+class PackedDataset:
+
+    def __init__(self, fn, mmap=True):
+        self.fn = fn
+        self.file = h5py.File(fn, 'r')
+        index = self.file['index']
+        self.uuid = index['uuid'].asstr()[...]
+        self.label = index['label'][...]
+        self.t_0 = index['t_0'][...].astype('datetime64[ns]')
+        self.t_1 = index['t_1'][...].astype('datetime64[ns]')
+        self.bbox = index['bbox'][...]
+        self._position = {uuid: i for i, uuid in enumerate(self.uuid)}
+        self.layers = {name: self._layer(name, mmap) for name in LAYERS if name in self.file}
+
+    def _layer(self, name, mmap):
+
+        # Contiguous, uncompressed datasets are read through a memory map of the file:
+        ds = self.file[name]
+        offset = ds.id.get_offset()
+        if mmap and ds.chunks is None and ds.compression is None and offset is not None:
+            return np.memmap(self.fn, dtype=ds.dtype, mode='r', offset=offset, shape=ds.shape)
+        return ds
+
+    def __len__(self):
+        return len(self.uuid)
+
+    def index_of(self, uuid):
+        return self._position[uuid]
+
+    def read(self, i, window=None):
+        if window is None:
+            return {name: np.asarray(layer[i]) for name, layer in self.layers.items()}
+        (r0, r1), (c0, c1) = window
+        return {name: np.asarray(layer[i, :, r0:r1, c0:c1]) for name, layer in self.layers.items()}
+
+    def __getitem__(self, i):
+        sample = self.read(i)
+        sample.update(uuid=self.uuid[i], label=self.label[i], t_0=self.t_0[i], t_1=self.t_1[i], bbox=self.bbox[i])
+        return sample
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
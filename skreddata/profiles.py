@@ -0,0 +1,207 @@
+import os
+import contextlib
+import dataclasses
+import logging
+import numpy as np
+import dask
+
+
+logger = logging.getLogger(__name__)
+
+
+PROFILES = ('threads', 'processes', 'distributed')
+RESOURCES_ENV = 'SKREDDATA_RESOURCES'
+
+# Working set of a geocoding or mosaicking task, in arrays of float32 on the tile (or image) shape:
+# input windows, lookup tables, DEM and the output with its temporaries.
+ARRAYS_PER_GEOCODE = 12
+ARRAYS_PER_MOSAIC = 8
+
+# Share of a worker's memory held by its process-wide tile caches (gec and dem), and the size of a
+# cached tile in arrays on the tile shape (VV and VH):
+TILE_CACHE_FRACTION = 0.25
+TILE_CACHES = 2
+ARRAYS_PER_TILE = 2
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  TASK RESOURCES
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def task_memory(shape, arrays, itemsize=4):
+    return int(np.prod(shape))*arrays*itemsize
+
+
+@dataclasses.dataclass(frozen=True)
+class Resources:
+    geocode: int    # Bytes per geocoded tile
+    mosaic: int     # Bytes per mosaic (pair, date or DEM) on the sample or cluster grid
+
+    @classmethod
+    def for_shapes(cls, tile_shape, shape):
+        return cls(geocode=task_memory(tile_shape, ARRAYS_PER_GEOCODE), mosaic=task_memory(shape, ARRAYS_PER_MOSAIC))
+
+
+def tile_cache_items(tile_shape, memory_limit):
+    # Tiles per cache, so the caches of a process hold TILE_CACHE_FRACTION of <memory_limit>:
+    per_cache = memory_limit*TILE_CACHE_FRACTION/TILE_CACHES
+    return int(max(1, per_cache//task_memory(tile_shape, ARRAYS_PER_TILE)))
+
+
+def enabled():
+    return os.environ.get(RESOURCES_ENV) == '1'
+
+
+def annotate(kind, memory=None):
+
+    # Restricts delayed tasks created in the context to workers with the resource: 'network' for
+    # downloads, 'cpu' (and <memory> bytes) for geocoding and mosaicking. Without resources on the
+    # workers (threads profile) the tasks would never run, so nothing is annotated then:
+    if not enabled():
+        return contextlib.nullcontext()
+    if kind == 'network':
+        resources = {'network': 1}
+    elif kind == 'cpu':
+        resources = {'cpu': 1}
+        if memory:
+            resources['memory'] = int(memory)
+    else:
+        raise Exception(f'Unknown resource: {kind}')
+    return dask.annotate(resources=resources)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  LOCAL CLUSTER SIZING
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def total_memory():
+    return os.sysconf('SC_PAGE_SIZE')*os.sysconf('SC_PHYS_PAGES')
+
+
+@dataclasses.dataclass(frozen=True)
+class LocalPlan:
+    processes: int          # CPU workers, one process each
+    threads: int            # Threads per CPU worker
+    memory_limit: int       # Bytes per CPU worker
+    io_threads: int         # Threads of the I/O worker (downloads, writes, database)
+    io_memory_limit: int    # Bytes of the I/O worker
+
+
+def plan_local(tile_shape, shape, cores=None, memory=None, io_threads=32, io_memory=4*1024**3, threads=1,
+        reserve=0.1):
+
+    # Geocoding is GIL-bound, so CPU work gets one process per core, as many as fit in memory (less
+    # <reserve> and the I/O worker) when each thread holds its largest task. Dask pauses workers at
+    # 80% of their limit, and the tile caches (see tile_cache_items) hold TILE_CACHE_FRACTION of it,
+    # so the limit leaves that headroom over the tasks:
+    cores = os.cpu_count() if cores is None else cores
+    memory = total_memory() if memory is None else memory
+    resources = Resources.for_shapes(tile_shape, shape)
+    per_worker = int(threads*max(resources.geocode, resources.mosaic)/(0.8 - TILE_CACHE_FRACTION))
+    usable = memory*(1 - reserve) - io_memory
+    processes = int(max(1, min(cores//threads, usable//per_worker)))
+    if usable < per_worker*processes:
+        logger.warning(f'Tasks on {shape} images with {tile_shape} tiles may not fit in memory ({memory/1024**3:.1f} GB)')
+    return LocalPlan(
+        processes=processes,
+        threads=threads,
+        memory_limit=int(max(per_worker, usable//processes)),
+        io_threads=io_threads,
+        io_memory_limit=int(io_memory)
+    )
+
+
+def local_cluster(plan, dashboard_address=':8787'):
+
+    # One threaded I/O worker holding the network resource, and single-purpose CPU workers holding
+    # cpu and memory resources. Unannotated tasks (writes, manifests, database items) run anywhere:
+    from dask import distributed
+    workers = {
+        'io': {
+            'cls': distributed.Nanny,
+            'options': {
+                'nthreads': plan.io_threads,
+                'memory_limit': plan.io_memory_limit,
+                'resources': {'network': plan.io_threads}
+            }
+        }
+    }
+    for i in range(plan.processes):
+        workers[f'cpu-{i}'] = {
+            'cls': distributed.Nanny,
+            'options': {
+                'nthreads': plan.threads,
+                'memory_limit': plan.memory_limit,
+                'resources': {'cpu': plan.threads, 'memory': plan.memory_limit}
+            }
+        }
+    scheduler = {'cls': distributed.Scheduler, 'options': {'dashboard_address': dashboard_address}}
+    return distributed.SpecCluster(workers=workers, scheduler=scheduler)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  PROFILES
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def _has_resources(client):
+    # Annotated tasks can only run if some workers hold each resource:
+    workers = client.scheduler_info()['workers'].values()
+    held = set(r for w in workers for r in w.get('resources', {}))
+    return {'network', 'cpu'} <= held
+
+
+def start(profile, tile_shape, shape, address=None, **kws):
+
+    # threads: no cluster, the active client or dask's threaded scheduler (nothing annotated).
+    # processes: local cluster sized from the tile and image shape (see plan_local).
+    # distributed: connect to the scheduler at <address>, annotated if its workers were started with
+    # resources (e.g. dask-worker --resources "cpu=1,memory=8e9" / "network=32").
+    # Returns the client (None for threads), to be closed by the caller:
+    if profile not in PROFILES:
+        raise Exception(f'Unknown profile: {profile}, expected one of {PROFILES}')
+
+    if profile == 'threads':
+        os.environ.pop(RESOURCES_ENV, None)
+        return None
+
+    from dask import distributed
+    if profile == 'processes':
+        plan = plan_local(tile_shape, shape, **kws)
+        logger.info(f'Local cluster: {plan}')
+        client = distributed.Client(local_cluster(plan))
+    else:
+        if address is None:
+            raise Exception('The distributed profile needs a scheduler address')
+        client = distributed.Client(address)
+
+    if _has_resources(client):
+        os.environ[RESOURCES_ENV] = '1'
+    else:
+        logger.warning('Workers hold no network/cpu resources, tasks are not annotated')
+        os.environ.pop(RESOURCES_ENV, None)
+    return client
+
+
+def worker_memory(client=None):
+
+    # Memory limit of the smallest CPU worker of <client> (any worker if none hold the cpu resource),
+    # or physical memory when tasks run in this process:
+    if client is None:
+        return total_memory()
+    workers = list(client.scheduler_info()['workers'].values())
+    limits = [w['memory_limit'] for w in workers if 'cpu' in w.get('resources', {})] or [w['memory_limit'] for w in workers]
+    limits = [limit for limit in limits if limit]
+    return min(limits) if limits else total_memory()
+
+
+def stop(client):
+    # Closes the client, and the local cluster of the processes profile:
+    if client is None:
+        return
+    cluster = client.cluster
+    client.close()
+    if cluster is not None:
+        cluster.close()
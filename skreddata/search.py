@@ -0,0 +1,311 @@
+
+import numpy as np
+import datetime
+import shapely
+import shapely.ops
+import shapely.wkt
+import shapely.geometry
+from dateutil import parser
+import pandas as pd
+import geopandas as gpd
+import logging
+import concurrent.futures
+
+from skreddata import fetch, metrics
+from skreddata.cache import CacheMiss
+
+
+# Search of S1-pairs: ASF queries (single or merged over clusters of nearby AOIs) and pair finding on
+# product tables. Kept apart from generate, so that searching and pairing need neither gdar nor the
+# geocoding stack (gtile is imported for search footprints and asf_search only).
+
+
+logger = logging.getLogger(__name__)
+
+
+TIME_BUFFER = datetime.timedelta(days=12)
+ADJACENT_GAP = np.timedelta64(60, 's')    # Largest gap between acquisitions of one pass
+
+
+def _parse_toi(toi): 
+    if np.isscalar(toi): 
+        return toi, toi
+    elif len(toi) == 1: 
+        return toi[0], toi[0]
+    elif len(toi) == 2: 
+        return toi[0], toi[1]
+    else: 
+        raise Exception('<toi> must be scalar or list of length 1 or 2')
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  SEARCH S1-PAIRS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def _as_datetime(time):
+    return time if isinstance(time, datetime.datetime) else parser.parse(time)
+
+
+def _search_polygon(aoi, space_buffer):
+    from gtile.core import shapetools
+    poly = shapely.wkt.loads(shapetools.misc_to_wkt(aoi))
+    poly = shapetools.buffer_in_closest_utm(poly, space_buffer)
+    return shapely.geometry.polygon.orient(poly)
+
+
+def _search_query(poly, start, end):
+    return {
+        "processingLevel": "GRD_HD",
+        "intersectsWith": shapely.wkt.dumps(poly, rounding_precision=12),
+        "start": start,
+        "end": end
+        }
+
+
+def _remote_search(query, fetch_config=None): 
+    if fetch_config is not None: 
+        return fetch.get_background(fetch_config).search(query).result()
+    from gtile.sat import asf
+    return [{'properties': r.properties, 'geometry': getattr(r, 'geometry', None)} for r in asf.search(query)]
+
+
+def _asf_search(query, cache=None, fetch_config=None): 
+    
+    with metrics.measure('search', cache_hit=False) as record: 
+        
+        def search(query): 
+            record['cache_hit'] = False
+            return _remote_search(query, fetch_config)
+        
+        if cache is not None: 
+            record['cache_hit'] = True
+            res = cache.search(query, search)
+        else: 
+            res = search(query)
+        record['products'] = len(res)
+        return res
+
+
+def _datetime64(times): 
+    
+    # ISO-times (with or without zone) to naive UTC datetime64, parsed in one call: 
+    times = pd.to_datetime(pd.Series(times, dtype=object), utc=True, format='ISO8601')
+    return times.dt.tz_localize(None).to_numpy('datetime64[ns]')
+
+
+def _product_table(prods): 
+    
+    # Products converted once into columns, rows in the order of <prods>: 
+    return pd.DataFrame({
+        'path': pd.Series([p['pathNumber'] for p in prods], dtype=object), 
+        'start': _datetime64([p['startTime'] for p in prods]), 
+        'stop': _datetime64([p['stopTime'] for p in prods]), 
+    })
+
+
+def _pairs_from_table(table, members, times, exact_times=False): 
+    
+    # Pairs for several AOIs at once. <members> are the rows of <table> (products) found for each AOI, 
+    # <times> the (t_0, t_1) of each AOI. Products are grouped by (AOI, path), groups of adjacent 
+    # acquisitions (one pass) are split where a start is past all earlier stops, and consecutive 
+    # passes make the pairs: 
+    aoi = np.repeat(np.arange(len(members)), [len(m) for m in members])
+    rows = np.concatenate([np.asarray(m, dtype=np.int64) for m in members]) if len(members) else np.zeros(0, np.int64)
+    pairs = [[] for _ in members]
+    if len(rows) == 0: 
+        return pairs
+    
+    df = pd.DataFrame({
+        'aoi': aoi, 
+        'row': rows, 
+        'path': table['path'].to_numpy()[rows], 
+        'start': table['start'].to_numpy()[rows], 
+        'stop': table['stop'].to_numpy()[rows]
+    })
+    df = df.sort_values(['aoi', 'path', 'start'], kind='stable', ignore_index=True)
+    
+    start = df['start'].to_numpy()
+    reach = df.groupby(['aoi', 'path'], sort=False)['stop'].cummax().to_numpy()
+    same = (df['aoi'].to_numpy()[1:] == df['aoi'].to_numpy()[:-1]) & (df['path'].to_numpy()[1:] == df['path'].to_numpy()[:-1])
+    new = np.ones(len(df), dtype=bool)
+    new[1:] = ~same | (start[1:] > reach[:-1] + ADJACENT_GAP)
+    
+    # Groups as slices of the sorted table, timed by their first start: 
+    first = np.flatnonzero(new)
+    bounds = np.append(first, len(df))
+    g_aoi = df['aoi'].to_numpy()[first]
+    g_path = df['path'].to_numpy()[first]
+    g_time = start[first]
+    
+    # Consecutive groups on the same AOI and path, filtered against each AOI's time of interest: 
+    a = np.arange(len(first) - 1)
+    b = a + 1
+    t_0, t_1 = np.array([[_as_datetime64(t) for t in tt] for tt in times], dtype='datetime64[ns]').reshape(-1, 2).T
+    _t_0, _t_1 = t_0[g_aoi[a]], t_1[g_aoi[a]]
+    keep = (g_aoi[a] == g_aoi[b]) & (g_path[a] == g_path[b])
+    if exact_times: 
+        tol = np.timedelta64(10, 'm')
+        keep &= (np.abs(g_time[a] - _t_0) < tol) & (np.abs(g_time[b] - _t_1) < tol)
+    else: 
+        keep &= (g_time[b] >= _t_0) & (g_time[a] <= _t_1)
+    
+    sorted_rows = df['row'].to_numpy()
+    for i, j in zip(a[keep], b[keep]): 
+        pairs[g_aoi[i]].append([sorted_rows[bounds[i]:bounds[i + 1]], sorted_rows[bounds[j]:bounds[j + 1]]])
+    return pairs
+
+
+def _as_datetime64(time): 
+    time = pd.Timestamp(time)
+    if time.tzinfo is not None: 
+        time = time.tz_convert('UTC').tz_localize(None)
+    return time.to_datetime64()
+
+
+def _pairs_from_products(prods, t_0, t_1, exact_times=False):
+    pairs = _pairs_from_table(_product_table(prods), [np.arange(len(prods))], [(t_0, t_1)], exact_times=exact_times)[0]
+    return [[[prods[i] for i in a], [prods[i] for i in b]] for a, b in pairs]
+
+
+def _is_multi_aoi(aoi): 
+    if isinstance(aoi, (gpd.GeoSeries, gpd.GeoDataFrame)): 
+        return True
+    return isinstance(aoi, (list, tuple)) and len(aoi) > 0 and \
+        all(isinstance(a, (str, shapely.geometry.base.BaseGeometry)) for a in aoi)
+
+
+def search_grd_pairs(aoi, t_0, t_1, space_buffer=7_500, exact_times=False, time_buffer=TIME_BUFFER, cache=None, 
+        fetch_config=None): 
+    
+    # Several AOIs (a list of geometries/WKT or a GeoSeries) give a list of pairs per AOI. <t_0> and 
+    # <t_1> are then either shared or given per AOI: 
+    if _is_multi_aoi(aoi): 
+        aois = list(aoi.geometry if isinstance(aoi, gpd.GeoDataFrame) else aoi)
+        t_0s = t_0 if isinstance(t_0, (list, tuple, np.ndarray, pd.Series)) else [t_0]*len(aois)
+        t_1s = t_1 if isinstance(t_1, (list, tuple, np.ndarray, pd.Series)) else [t_1]*len(aois)
+        return search_grd_pairs_batch(aois, [[a, b] for a, b in zip(t_0s, t_1s)], space_buffer=space_buffer, 
+            exact_times=exact_times, time_buffer=time_buffer, cache=cache, fetch_config=fetch_config)
+
+    t_0 = _as_datetime(t_0)
+    t_1 = _as_datetime(t_1)
+
+    poly = _search_polygon(aoi, space_buffer)
+    query = _search_query(poly, t_0 - time_buffer, t_1 + time_buffer)
+
+    res = _asf_search(query, cache=cache, fetch_config=fetch_config)
+
+    return _pairs_from_products([r['properties'] for r in res], t_0, t_1, exact_times=exact_times)
+
+
+def _extent_in_meters(bounds):
+    # Rough extent of a lon/lat bounding box, sufficient for clustering. Its width is taken on the 
+    # parallel closest to the equator, where it is widest: 
+    minx, miny, maxx, maxy = bounds
+    lat = 0.0 if miny <= 0 <= maxy else min(abs(miny), abs(maxy))
+    return max((maxx - minx)*111_320*np.cos(np.deg2rad(min(lat, 89))), (maxy - miny)*110_574)
+
+
+def _cluster_searches(polys, windows, max_extent, max_span):
+    
+    # Greedy clustering of search footprints and time windows, in order of start time: 
+    clusters = []
+    for i in sorted(range(len(polys)), key=lambda i: windows[i][0]): 
+        minx, miny, maxx, maxy = polys[i].bounds
+        start, end = windows[i]
+        for cluster in clusters: 
+            bounds = (
+                min(minx, cluster['bounds'][0]), 
+                min(miny, cluster['bounds'][1]), 
+                max(maxx, cluster['bounds'][2]), 
+                max(maxy, cluster['bounds'][3])
+            )
+            window = (min(start, cluster['window'][0]), max(end, cluster['window'][1]))
+            if _extent_in_meters(bounds) <= max_extent and window[1] - window[0] <= max_span: 
+                cluster['bounds'] = bounds
+                cluster['window'] = window
+                cluster['members'].append(i)
+                break
+        else: 
+            clusters.append({'bounds': (minx, miny, maxx, maxy), 'window': (start, end), 'members': [i]})
+    
+    return clusters
+
+
+def _split(res, polys, windows): 
+    
+    # Results of a merged query, as each AOI's own query would return them: products with footprints 
+    # intersecting the AOI's search polygon (or without a footprint) that start in its time window: 
+    geoms = np.array([shapely.geometry.shape(r['geometry']) if r['geometry'] else None for r in res], dtype=object)
+    missing = np.array([g is None for g in geoms], dtype=bool)
+    start = _datetime64([r['properties']['startTime'] for r in res])
+    split = []
+    for poly, window in zip(polys, windows): 
+        t_0, t_1 = (_as_datetime64(t) for t in window)
+        hit = missing.copy()
+        hit[~missing] = shapely.intersects(geoms[~missing], poly)
+        hit &= (start >= t_0) & (start <= t_1)
+        split.append([res[k] for k in np.flatnonzero(hit)])
+    return split
+
+
+def _cached_search(query, cache): 
+    # Cache hits are recorded as searches, misses are searched (and recorded) with a merged query: 
+    res = cache.get(query)
+    if res is not None: 
+        metrics.emit({'stage': 'search', 'cache_hit': True, 'products': len(res)})
+    return res
+
+
+def _pairs_from_results(results, times, exact_times=False, chunk_size=1_000): 
+    
+    # Pairs per AOI from its search results, in chunks of AOIs sharing one product table: 
+    pairs = []
+    for n in range(0, len(results), chunk_size): 
+        chunk = results[n:n + chunk_size]
+        prods = [r['properties'] for res in chunk for r in res]
+        offsets = np.cumsum([0] + [len(res) for res in chunk])
+        members = [np.arange(a, b) for a, b in zip(offsets[:-1], offsets[1:])]
+        for _pairs in _pairs_from_table(_product_table(prods), members, times[n:n + chunk_size], exact_times=exact_times): 
+            pairs.append([[[prods[k] for k in a], [prods[k] for k in b]] for a, b in _pairs])
+    return pairs
+
+
+def search_grd_pairs_batch(aois, tois, space_buffer=7_500, exact_times=False, time_buffer=TIME_BUFFER, 
+        max_extent=200_000, max_span=datetime.timedelta(days=90), cache=None, workers=8, 
+        fetch_config=None): 
+    
+    # Search footprints and time windows per AOI: 
+    times = [tuple(_as_datetime(t) for t in _parse_toi(toi)) for toi in tois]
+    polys = [_search_polygon(aoi, space_buffer) for aoi in aois]
+    windows = [(t_0 - time_buffer, t_1 + time_buffer) for t_0, t_1 in times]
+    
+    # Results are cached under each AOI's own query (as searched by search_grd_pairs), not the merged 
+    # ones, so they are found again whatever other AOIs are in the batch (e.g. on a re-run without the 
+    # rows already in the database): 
+    queries = [_search_query(poly, *window) for poly, window in zip(polys, windows)]
+    results = [None]*len(aois) if cache is None else [_cached_search(query, cache) for query in queries]
+    todo = [i for i, res in enumerate(results) if res is None]
+    if todo and cache is not None and cache.offline: 
+        raise CacheMiss(f'Searches of {len(todo)} AOIs not in cache and running offline')
+    
+    # One merged query per cluster of the AOIs left: 
+    clusters = _cluster_searches([polys[i] for i in todo], [windows[i] for i in todo], max_extent, max_span)
+    for cluster in clusters: 
+        cluster['members'] = [todo[i] for i in cluster['members']]
+    logger.info(f'Searching {len(aois)} AOIs, {len(aois) - len(todo)} from cache and {len(todo)} with {len(clusters)} merged queries')
+    
+    def search(cluster): 
+        hull = shapely.geometry.polygon.orient(shapely.ops.unary_union([polys[i] for i in cluster['members']]).convex_hull)
+        return _asf_search(_search_query(hull, *cluster['window']), fetch_config=fetch_config)
+    
+    # Merged queries run concurrently, their results are split and cached per AOI: 
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool: 
+        for cluster, res in zip(clusters, pool.map(search, clusters)): 
+            members = cluster['members']
+            for i, _res in zip(members, _split(res, [polys[i] for i in members], [windows[i] for i in members])): 
+                results[i] = _res
+                if cache is not None: 
+                    cache.put(queries[i], _res)
+    
+    return _pairs_from_results(results, times, exact_times=exact_times)
@@ -0,0 +1,344 @@
+import os
+import fcntl
+import shutil
+import contextlib
+import logging
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+FORMATS = ('gtiff', 'cog', 'zarr')
+EXTENSIONS = {'gtiff': '.tif', 'cog': '.tif', 'zarr': '.zarr'}
+BLOCK_SIZE = 256
+
+
+def _check_format(format):
+    if format not in FORMATS:
+        raise Exception(f'<format> must be one of {FORMATS}, got {format}')
+
+
+def sample_path(folder, uuid, name, format='gtiff'):
+    _check_format(format)
+    return os.path.join(folder, uuid, f'{uuid}_{name}{EXTENSIONS[format]}')
+
+
+def find_sample_path(folder, uuid, name):
+    for format in FORMATS:
+        fn = sample_path(folder, uuid, name, format)
+        if os.path.exists(fn):
+            return fn
+
+
+def format_from_path(fn):
+    return 'zarr' if str(fn).rstrip('/').endswith('.zarr') else 'gtiff'
+
+
+def _windows(height, width, block_size):
+    for r in range(0, height, block_size):
+        for c in range(0, width, block_size):
+            yield r, min(r + block_size, height), c, min(c + block_size, width)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  WRITE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def write(write_gtiff, fn, format='gtiff', block_size=BLOCK_SIZE, compress='deflate'):
+
+    # <write_gtiff> writes a plain GeoTIFF to the path given to it (gdar's writers only write whole
+    # GeoTIFFs). It is always written to a temporary file, converted block by block for other formats,
+    # and moved in place once complete:
+    _check_format(format)
+    if format == 'gtiff':
+        tmp = f'{fn}.part.tif'
+        write_gtiff(tmp)
+        os.replace(tmp, fn)
+        return fn
+
+    tmp = f'{fn}.tmp.tif'
+    write_gtiff(tmp)
+    try:
+        convert(tmp, fn, format=format, block_size=block_size, compress=compress)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return fn
+
+
+def convert(src, dst, format='cog', block_size=BLOCK_SIZE, compress='deflate'):
+    _check_format(format)
+    part = f'{dst}.part'
+    if format == 'gtiff':
+        shutil.copy(src, part)
+    elif format == 'cog':
+        _to_cog(src, part, block_size, compress)
+    elif format == 'zarr':
+        _to_zarr(src, part, block_size, compress)
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    os.replace(part, dst)
+    return dst
+
+
+def _to_cog(src, dst, block_size, compress):
+    import rasterio
+    import rasterio.shutil
+    rasterio.shutil.copy(
+        src, dst, driver='COG',
+        BLOCKSIZE=block_size,
+        COMPRESS=(compress or 'NONE').upper(),
+        OVERVIEWS='AUTO',
+        BIGTIFF='IF_SAFER'
+    )
+
+
+# Zarr codecs by compression name (GDAL names as used for COGs, and the Blosc compressors). DEFLATE
+# streams are stored gzip-framed in Zarr v3, which has no zlib codec of its own:
+ZARR_CODECS = ('deflate', 'zlib', 'gzip', 'zstd', 'lz4', 'blosc', 'none')
+
+
+def _zarr_codec(compress):
+    import zarr
+    compress = (compress or 'none').lower()
+    if compress not in ZARR_CODECS:
+        raise Exception(f'<compress> must be one of {ZARR_CODECS} for zarr, got {compress}')
+    if compress == 'none':
+        return None
+    if int(zarr.__version__.split('.')[0]) >= 3:
+        from zarr import codecs
+        return {
+            'deflate': codecs.GzipCodec, 'zlib': codecs.GzipCodec, 'gzip': codecs.GzipCodec,
+            'zstd': codecs.ZstdCodec,
+            'lz4': lambda: codecs.BloscCodec(cname='lz4'),
+            'blosc': codecs.BloscCodec,
+        }[compress]()
+    import numcodecs
+    return {
+        'deflate': numcodecs.Zlib, 'zlib': numcodecs.Zlib, 'gzip': numcodecs.GZip,
+        'zstd': numcodecs.Zstd,
+        'lz4': numcodecs.LZ4,
+        'blosc': numcodecs.Blosc,
+    }[compress]()
+
+
+def _zarr_kws(compress):
+    # Keywords of zarr.open_array, which takes the whole codec pipeline in Zarr v3:
+    import zarr
+    codec = _zarr_codec(compress)
+    if int(zarr.__version__.split('.')[0]) >= 3:
+        from zarr import codecs
+        return {'codecs': [codecs.BytesCodec()] + ([codec] if codec is not None else [])}
+    return {'compressor': codec}
+
+
+def _raster_attrs(ds):
+    return {
+        'crs': ds.crs.to_wkt() if ds.crs is not None else None,
+        'transform': list(ds.transform)[:6],
+        'band_names': list(ds.descriptions),
+        'nodata': ds.nodata,
+    }
+
+
+def _to_zarr(src, dst, block_size, compress):
+    import rasterio
+    import zarr
+
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+
+    with rasterio.open(src) as ds:
+        arr = zarr.open_array(
+            store=dst, mode='w',
+            shape=(ds.count, ds.height, ds.width),
+            chunks=(ds.count, block_size, block_size),
+            dtype=ds.dtypes[0],
+            fill_value=ds.nodata,
+            **_zarr_kws(compress)
+        )
+        for r0, r1, c0, c1 in _windows(ds.height, ds.width, block_size):
+            window = rasterio.windows.Window(c0, r0, c1 - c0, r1 - r0)
+            arr[:, r0:r1, c0:c1] = ds.read(window=window)
+        arr.attrs.update(_raster_attrs(ds))
+
+
+def cut(src, dst, bounds, format='gtiff', block_size=BLOCK_SIZE, compress='deflate'):
+
+    # The window of <src> covering <bounds> (left, bottom, right, top in its CRS) as a file of its own.
+    # Only the blocks of <src> intersecting the window are read:
+    import rasterio
+    import rasterio.windows
+
+    def write_gtiff(fn):
+        with rasterio.open(src) as ds:
+            window = rasterio.windows.from_bounds(*bounds, transform=ds.transform).round_offsets().round_lengths()
+            data = ds.read(window=window)
+            profile = {k: v for k, v in ds.profile.items() if k not in ('tiled', 'blockxsize', 'blockysize')}
+            profile.update(width=data.shape[2], height=data.shape[1], transform=ds.window_transform(window))
+            with rasterio.open(fn, 'w', **profile) as out:
+                out.write(data)
+                out.descriptions = ds.descriptions
+
+    return write(write_gtiff, dst, format=format, block_size=block_size, compress=compress)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  TIME-SERIES STACKS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def stack_path(folder, uuid):
+    return os.path.join(folder, uuid, f'{uuid}_stack.zarr')
+
+
+def write_stack(srcs, dst, attrs=None, block_size=BLOCK_SIZE, compress='deflate'):
+
+    # Single-date GeoTIFFs on the same grid into one (date, band, row, col) Zarr cube, with one date
+    # and block per chunk. <attrs> (dates, products, pairs, ...) are stored with the raster attributes:
+    import rasterio
+    import zarr
+
+    part = f'{dst}.part'
+    if os.path.isdir(part):
+        shutil.rmtree(part)
+
+    with rasterio.open(srcs[0]) as ds:
+        arr = zarr.open_array(
+            store=part, mode='w',
+            shape=(len(srcs), ds.count, ds.height, ds.width),
+            chunks=(1, ds.count, block_size, block_size),
+            dtype=ds.dtypes[0],
+            fill_value=ds.nodata,
+            **_zarr_kws(compress)
+        )
+        arr.attrs.update(_raster_attrs(ds))
+
+    for t, src in enumerate(srcs):
+        with rasterio.open(src) as ds:
+            for r0, r1, c0, c1 in _windows(ds.height, ds.width, block_size):
+                window = rasterio.windows.Window(c0, r0, c1 - c0, r1 - r0)
+                arr[t, :, r0:r1, c0:c1] = ds.read(window=window)
+    arr.attrs.update(attrs or {})
+
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    os.replace(part, dst)
+    return dst
+
+
+@contextlib.contextmanager
+def _locked(fn):
+    with open(fn, 'w') as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def clear_stack(dst):
+    # Unfinished cube of an earlier run, dates are written again:
+    if os.path.isdir(f'{dst}.part'):
+        shutil.rmtree(f'{dst}.part')
+
+
+def write_stack_date(dst, t, dates, bands, band_names=None, block_size=BLOCK_SIZE, compress='deflate'):
+
+    # Date <t> of <dates> (a band, row, col array) into the unfinished cube <dst>.part, created by the
+    # first date written. Each date is in chunks of its own, so dates are written concurrently:
+    import zarr
+    part = f'{dst}.part'
+    shape = (dates,) + tuple(bands.shape)
+    with _locked(f'{part}.lock'):
+        if os.path.isdir(part):
+            arr = zarr.open_array(store=part, mode='r+')
+        else:
+            arr = zarr.open_array(
+                store=part, mode='w',
+                shape=shape,
+                chunks=(1, bands.shape[0], block_size, block_size),
+                dtype=bands.dtype,
+                **_zarr_kws(compress)
+            )
+            arr.attrs.update({'band_names': list(band_names) if band_names is not None else None})
+    if tuple(arr.shape) != shape:
+        raise Exception(f'Date {t} of shape {bands.shape} does not fit stack {dst} of shape {arr.shape}')
+    arr[t] = bands
+    return part
+
+
+def finish_stack(dst, attrs=None, like=None):
+
+    # Moves the cube written by write_stack_date in place, with the raster attributes (CRS, transform,
+    # nodata) of <like> (a file on the same grid) and <attrs>:
+    import zarr
+    part = f'{dst}.part'
+    arr = zarr.open_array(store=part, mode='r+')
+    if like is not None:
+        arr.attrs.update({k: v for k, v in read_raster_attrs(like).items() if k != 'band_names'})
+    arr.attrs.update(attrs or {})
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    os.replace(part, dst)
+    if os.path.exists(f'{part}.lock'):
+        os.remove(f'{part}.lock')
+    return dst
+
+
+def read_raster_attrs(fn):
+    if format_from_path(fn) == 'zarr':
+        import zarr
+        attrs = zarr.open_array(store=str(fn), mode='r').attrs
+        return {k: attrs.get(k) for k in ('crs', 'transform', 'band_names', 'nodata')}
+    import rasterio
+    with rasterio.open(fn) as ds:
+        return _raster_attrs(ds)
+
+
+def read_stack_attrs(fn):
+    import zarr
+    return dict(zarr.open_array(store=str(fn), mode='r').attrs)
+
+
+def read_pair_view(fn, i, j, window=None):
+
+    # Dates <i> and <j> of a stack, bands of date i followed by bands of date j as in a pair file. Only
+    # the chunks of the two dates intersecting the window are read:
+    import zarr
+    arr = zarr.open_array(store=str(fn), mode='r')
+    (r0, r1), (c0, c1) = window if window is not None else ((0, arr.shape[2]), (0, arr.shape[3]))
+    return np.concatenate([arr[i, :, r0:r1, c0:c1], arr[j, :, r0:r1, c0:c1]])
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  READ
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def read_shape(fn):
+    if format_from_path(fn) == 'zarr':
+        import zarr
+        return tuple(zarr.open_array(store=str(fn), mode='r').shape)
+    import rasterio
+    with rasterio.open(fn) as ds:
+        return ds.count, ds.height, ds.width
+
+
+def read_window(fn, window=None):
+
+    # <window> is ((row_start, row_stop), (col_start, col_stop)) or None for everything. Only the
+    # tiles/chunks intersecting the window are read and decoded:
+    if format_from_path(fn) == 'zarr':
+        import zarr
+        arr = zarr.open_array(store=str(fn), mode='r')
+        if window is None:
+            return arr[...]
+        (r0, r1), (c0, c1) = window
+        return arr[:, r0:r1, c0:c1]
+
+    import rasterio
+    with rasterio.open(fn) as ds:
+        return ds.read(window=window)
@@ -0,0 +1,69 @@
+import itertools
+import logging
+import dask
+
+
+logger = logging.getLogger(__name__)
+
+
+def _active_client():
+    try:
+        from dask import distributed
+        return distributed.default_client()
+    except (ImportError, ValueError):
+        return None
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  STREAMING COMPUTE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def compute_streaming(tasks, max_in_flight=32, client=None, threads=None):
+    # Tasks are (key, delayed)-tuples, pulled lazily from <tasks> as slots free up. Yields 
+    # (key, result, error)-tuples in order of completion. Without a client, graphs run on <threads> 
+    # threads (default: one per core) in this process: 
+    tasks = iter(tasks)
+    client = _active_client() if client is None else client
+    if client is not None:
+        yield from _stream_distributed(tasks, max_in_flight, client)
+    else:
+        yield from _stream_local(tasks, max_in_flight, threads)
+
+
+def _stream_distributed(tasks, max_in_flight, client):
+    from dask import distributed
+
+    keys = {}
+
+    def submit(n):
+        futures = []
+        for key, obj in itertools.islice(tasks, n):
+            future = client.compute(dask.delayed(obj))
+            keys[future.key] = key
+            futures.append(future)
+        return futures
+
+    completed = distributed.as_completed(submit(max_in_flight), loop=client.loop)
+    for future in completed:
+        key = keys.pop(future.key)
+        try:
+            yield key, future.result(), None
+        except Exception as e:
+            logger.exception(f'Failed processing {key}')
+            yield key, None, e
+        finally:
+            future.release()
+        completed.update(submit(1))
+
+
+def _stream_local(tasks, max_in_flight, threads=None):
+
+    # All graphs go to one in-process scheduler, so their tasks share one pool of threads and keys
+    # common to several graphs (downloads, shared tiles) are computed once while in flight:
+    import os
+    from dask import distributed
+    threads = os.cpu_count() if threads is None else threads
+    with distributed.Client(processes=False, n_workers=1, threads_per_worker=threads, dashboard_address=None,
+            set_as_default=False) as client:
+        yield from _stream_distributed(tasks, max_in_flight, client)
@@ -0,0 +1,206 @@
+import os
+import fcntl
+import pickle
+import hashlib
+import threading
+import collections
+import dataclasses
+import logging
+import dask
+
+from skreddata import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+@dataclasses.dataclass(frozen=True)
+class Config:
+    max_items: int = 256    # Tiles kept in memory per process (LRU)
+    folder: str = None      # Optional on-disk tier
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  PROCESS-WIDE TILE CACHE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+@dataclasses.dataclass(frozen=False)
+class TileCache:
+    max_items: int = 256
+    folder: str = None
+
+    def __post_init__(self):
+        self._tiles = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = collections.defaultdict(threading.Lock)
+        self.hits = 0
+        self.misses = 0
+        if self.folder is not None:
+            os.makedirs(self.folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.pkl')
+
+    def _load(self, key):
+        if self.folder is None or not os.path.exists(self._path(key)):
+            return None
+        with open(self._path(key), 'rb') as fp:
+            return pickle.load(fp)
+
+    def _dump(self, key, value):
+        if self.folder is None:
+            return
+        fn = self._path(key)
+        tmp = f'{fn}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as fp:
+            pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, fn)
+
+    def get_or_compute(self, key, compute):
+
+        # One producer per key, concurrent requests for the same tile wait for it:
+        with self._lock:
+            key_lock = self._key_locks[key]
+
+        with key_lock:
+            with self._lock:
+                if key in self._tiles:
+                    self._tiles.move_to_end(key)
+                    self.hits += 1
+                    return self._tiles[key]
+
+            value = self._load(key)
+            if value is None:
+                self.misses += 1
+                value = compute()
+                self._dump(key, value)
+            else:
+                self.hits += 1
+
+            with self._lock:
+                self._tiles[key] = value
+                while self.max_items is not None and len(self._tiles) > self.max_items:
+                    evicted, _ = self._tiles.popitem(last=False)
+                    self._key_locks.pop(evicted, None)
+
+        return value
+
+    def contains(self, key):
+        with self._lock:
+            if key in self._tiles:
+                return True
+        return self.folder is not None and os.path.exists(self._path(key))
+
+    def __len__(self):
+        return len(self._tiles)
+
+
+def get_cache(name, config):
+    with _CACHES_LOCK:
+        if name not in _CACHES:
+            _CACHES[name] = TileCache(
+                max_items=config.max_items,
+                folder=None if config.folder is None else os.path.join(config.folder, name)
+            )
+        return _CACHES[name]
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  GRAPH-LEVEL DEDUPLICATION
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+class _Unevaluated:
+    # Hides a delayed object from dask, so it is only computed on a cache miss:
+    def __init__(self, obj):
+        self.obj = obj
+
+
+def _compute(obj, inputs=None):
+    # Computes <obj> in this task, with values of <inputs> ({key: value}) in place of their tasks:
+    if not inputs:
+        return dask.compute(obj, scheduler='sync')[0]
+    from dask.local import get_sync
+    dsk = dict(obj.__dask_graph__())
+    dsk.update(inputs)
+    return get_sync(dsk, obj.key)
+
+
+def _produce(name, config, key, tile, inputs=None):
+    computed = []
+
+    # Inputs left out of the outer graph (e.g. downloads of tiles cached when planned) are computed in
+    # this task, if the tile has been evicted since:
+    def compute():
+        computed.append(True)
+        return _compute(tile.obj, inputs)
+
+    # Geocoding (gec) and DEM tiles are measured here, with hits on the process-wide cache:
+    with metrics.measure(f'{name}-tile', tile=key) as record:
+        value = get_cache(name, config).get_or_compute(key, compute)
+        record['cache_hit'] = not computed
+    return value
+
+
+def tile_key(name, namespace, index):
+    return f'{name}-tile-{dask.base.tokenize(namespace, index)}'
+
+
+def cached(name, namespace, tiles, config=None):
+
+    # Whether all (delayed) <tiles> are in the cache of this process or on the disk tier, when planning
+    # whether their inputs (e.g. downloads) are needed at all:
+    cache = get_cache(name, Config() if config is None else config)
+    keys = [tile_key(name, namespace, index) for index, tile in tiles.items() if dask.is_dask_collection(tile)]
+    return all(cache.contains(key) for key in keys)
+
+
+def shared_tiles(name, namespace, tiles, config=None, inputs=None):
+
+    # Tiles with equal (name, namespace, index) get the same task key, so each is a single task in
+    # any graph, and is produced once per process across graphs. <inputs> (e.g. downloads or other
+    # shared tiles) are kept in the outer graph, where dask computes each key once, before the tiles
+    # using them and where they are annotated to run:
+    config = Config() if config is None else config
+    inputs = {obj.key: obj for obj in inputs if dask.is_dask_collection(obj)} if inputs else {}
+    shared = {}
+    for index, tile in tiles.items():
+        if not dask.is_dask_collection(tile):
+            shared[index] = tile
+            continue
+        key = tile_key(name, namespace, index)
+        graph = tile.__dask_graph__()
+        _inputs = {k: v for k, v in inputs.items() if k in graph} or None
+        shared[index] = dask.delayed(_produce, pure=True)(name, config, key, _Unevaluated(tile), _inputs, dask_key_name=key)
+    return shared
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  FILES SHARED BETWEEN GRAPHS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def _produce_file(fn, write, *args, **kws):
+    # Written once over graphs and processes, later requests wait for the first and reuse the file:
+    os.makedirs(os.path.dirname(os.path.abspath(fn)), exist_ok=True)
+    with open(f'{fn}.lock', 'w') as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(fn):
+                write(*args, **kws)
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+    return fn
+
+
+def shared_file(name, fn, write, *args, **kws):
+
+    # One task per <fn> calling write(*args, **kws) to write it, unless it exists. <args> (e.g. shared
+    # tiles) stay in the outer graph, only the write itself holds the lock:
+    key = f'{name}-file-{dask.base.tokenize(fn)}'
+    return dask.delayed(_produce_file, pure=True)(fn, write, *args, dask_key_name=key, **kws)
@@ -0,0 +1,18 @@
+import numpy as np
+
+
+# Geocoding tile shapes, without gdar/gtile:
+TILE_SHAPE = (2048, 2048)
+MIN_CROP_TILE_SHAPE = (256, 256)
+
+
+def cropped_tile_shape(shape):
+
+    # A grid of shape C intersects at most (ceil(C/T) + 1)**2 tiles of shape T. With T = 2048 and C = 1024
+    # that is 4 full tiles (16x the chip) geocoded and mosaicked per sample, while power-of-two tiles of
+    # about C/2 cover at most 2.25x the chip:
+    tile_shape = []
+    for c, t_max, t_min in zip(shape, TILE_SHAPE, MIN_CROP_TILE_SHAPE):
+        t = 2**int(np.floor(np.log2(max(c//2, 1))))
+        tile_shape.append(int(np.clip(t, t_min, t_max)))
+    return tuple(tile_shape)
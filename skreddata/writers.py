@@ -0,0 +1,75 @@
+import logging
+import numpy as np
+
+from skreddata import storage, metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+# Mosaicking and writing of samples, the core of the generation graphs. gdar and gtile are imported where
+# used, so the writers can be run (e.g. benchmarked) with other raster functions in their place.
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  RASTER FUNCTIONS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def mosaic_tiles(tiles, mosaicing_kws=None):
+    from gtile.core.rastertools import mosaic_tiles
+    return mosaic_tiles(tiles, mosaicing_kws=mosaicing_kws)
+
+
+def merge_pair(mosaic_pair):
+
+    # Bands of both dates in one raster, as <band>_<date>:
+    from gdar import rastertools, raster
+    col = {}
+    for i, dr in enumerate(mosaic_pair):
+        for j, n in enumerate(dr.dtype.names):
+            col[f'{n}_{i}'] = rastertools.select(dr, j)
+    return rastertools.merge(raster.Collection(col))
+
+
+def to_bands(dr):
+    # (band, row, col) array of a raster:
+    from gdar import rastertools
+    return np.stack([np.asarray(rastertools.select(dr, j)) for j in range(len(dr.dtype.names))])
+
+
+def write_crs(dr, fn):
+    from gdar import fileformats
+    return fileformats.write_crs(dr, fn)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+#  WRITERS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
+
+
+def write_pair(tile_pair, fn, grid, output_format='gtiff', uuid=None):
+    with metrics.measure('crs-mosaic', uuid):
+        combined = merge_pair([mosaic_tiles(tiles, mosaicing_kws={'grid': grid}) for tiles in tile_pair])
+    with metrics.measure('crs-write', uuid, format=output_format) as record:
+        return metrics.output_bytes(record,
+            storage.write(lambda _fn: write_crs(combined, _fn), fn, format=output_format))
+
+
+def write_dem(tiles, fn, grid, output_format='gtiff', uuid=None):
+    with metrics.measure('dem-mosaic', uuid):
+        mosaic = mosaic_tiles(tiles, mosaicing_kws={'grid': grid})
+    with metrics.measure('dem-write', uuid, format=output_format) as record:
+        return metrics.output_bytes(record,
+            storage.write(lambda _fn: write_crs(mosaic, _fn), fn, format=output_format))
+
+
+def write_date(tiles, fn, t, dates, grid, uuid=None):
+
+    # Date <t> of the stack <fn> (see storage.write_stack_date), mosaicked straight into the cube:
+    with metrics.measure('date-mosaic', uuid, date=t):
+        mosaic = mosaic_tiles(tiles, mosaicing_kws={'grid': grid})
+        bands = to_bands(mosaic)
+    with metrics.measure('date-write', uuid, date=t) as record:
+        record['bytes_out'] = bands.nbytes
+        return storage.write_stack_date(fn, t, dates, bands, band_names=mosaic.dtype.names)
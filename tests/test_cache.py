@@ -0,0 +1,60 @@
+import unittest
+import tempfile
+import datetime
+import os
+
+import sys
+sys.path.append('../')
+
+from skreddata import cache
+
+
+class TestSearchCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.query = {
+            'processingLevel': 'GRD_HD', 
+            'intersectsWith': 'POLYGON ((0 0, 1 0, 1 1, 0 0))', 
+            'start': datetime.datetime(2020, 1, 1), 
+            'end': datetime.datetime(2020, 2, 1)
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_is_canonical(self):
+        reordered = dict(reversed(list(self.query.items())))
+        self.assertEqual(cache.query_key(self.query), cache.query_key(reordered))
+
+    def test_hit_and_miss(self):
+        calls = []
+        def search(query):
+            calls.append(query)
+            return [{'properties': {'fileID': 'a'}, 'geometry': None}]
+
+        c = cache.SearchCache.in_folder(self.tmp.name)
+        first = c.search(self.query, search)
+        second = c.search(self.query, search)
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+
+    def test_ttl(self):
+        c = cache.SearchCache.in_folder(self.tmp.name, ttl=-1)
+        c.put(self.query, [])
+        self.assertIsNone(c.get(self.query))
+
+    def test_offline(self):
+        c = cache.SearchCache.in_folder(self.tmp.name, offline=True)
+        with self.assertRaises(cache.CacheMiss):
+            c.search(self.query, lambda query: [])
+
+    def test_eviction(self):
+        c = cache.SearchCache(os.path.join(self.tmp.name, 'search.sqlite'), max_bytes=100)
+        for n in range(10):
+            c.put(dict(self.query, n=n), [{'properties': {'fileID': 'x'*20}}])
+        self.assertLess(len(c), 10)
+        self.assertIsNotNone(c.get(dict(self.query, n=9)))
+
+
+if __name__ == '__main__':
+    unittest.main()
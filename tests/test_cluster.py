@@ -0,0 +1,61 @@
+import unittest
+import tempfile
+import os
+import numpy as np
+import dask
+
+import sys
+sys.path.append('../')
+
+from skreddata import storage, tilecache
+from test_stack import write_tif
+
+
+class TestCluster(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data = np.arange(2*100*80, dtype=np.float32).reshape(2, 100, 80)
+        self.src = write_tif(os.path.join(self.tmp.name, 'mosaic.tif'), self.data)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cut(self):
+        # Mosaic origin (upper left) at (500000, 7600000) with 10 m pixels:
+        bounds = (500_200, 7_600_000 - 600, 500_500, 7_600_000 - 100)
+        os.makedirs(os.path.join(self.tmp.name, 'a'))
+        for format in ('gtiff', 'zarr'):
+            fn = storage.cut(self.src, storage.sample_path(self.tmp.name, 'a', 'crs', format), bounds, format=format)
+            np.testing.assert_array_equal(storage.read_window(fn), self.data[:, 10:60, 20:50])
+
+    def test_shared_file(self):
+        # Tiles are inputs in the outer graph, computed once, and the file is written once:
+        calls = []
+        tiles = []
+
+        @dask.delayed
+        def tile(i):
+            tiles.append(i)
+            return i
+
+        def write(tiles, fn):
+            calls.append(fn)
+            with open(fn, 'w') as fp:
+                fp.write(str(tiles))
+            return fn
+
+        fn = os.path.join(self.tmp.name, 'clusters', 'a_crs.tif')
+        inputs = [tile(0), tile(1)]
+        first = tilecache.shared_file('cluster-crs', fn, write, inputs, fn)
+        second = tilecache.shared_file('cluster-crs', fn, write, inputs, fn)
+        self.assertEqual(first.key, second.key)
+        self.assertTrue(all(t.key in dict(first.__dask_graph__()) for t in inputs))
+        self.assertEqual(dask.compute(first, second), (fn, fn))
+        self.assertEqual(tilecache.shared_file('cluster-crs', fn, write, inputs, fn).compute(), fn)
+        self.assertEqual(calls, [fn])
+        with open(fn) as fp:
+            self.assertEqual(fp.read(), '[0, 1]')
+
+
+if __name__ == '__main__':
+    unittest.main()
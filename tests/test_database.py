@@ -0,0 +1,126 @@
+import unittest
+import tempfile
+import datetime
+import os
+import numpy as np
+
+import sys
+sys.path.append('../')
+
+from skreddata import database
+
+
+def _item(uuid, lon, lat, t_0, t_1, label=None, comment=None):
+    return database.Item(
+        uuid=uuid, 
+        geometry=f'POLYGON (({lon} {lat}, {lon + 0.1} {lat}, {lon + 0.1} {lat + 0.1}, {lon} {lat + 0.1}, {lon} {lat}))', 
+        t_0=t_0, 
+        t_1=t_1, 
+        label=label, 
+        comment=comment
+    )
+
+
+class TestLocalDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = database.open_database(f'sqlite:///{os.path.join(self.tmp.name, "db.sqlite")}')
+        self.db.insert_many([
+            _item('a_00', 19.0, 69.0, '2020-01-01', '2020-01-05', label=1, comment='large slab'), 
+            _item('a_01', 19.0, 69.0, '2020-01-05', '2020-01-10', label=0), 
+            _item('b', 25.0, 70.0, '2020-02-01T00:00:00Z', '2020-02-03T00:00:00Z'), 
+        ])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_by_uuid(self):
+        item = self.db.get_by_uuid('a_00')
+        self.assertEqual(item.label, 1)
+        self.assertEqual(item.t_0, datetime.datetime(2020, 1, 1))
+        self.assertEqual(item.location['type'], 'Polygon')
+        self.assertIsNone(self.db.get_by_uuid('c'))
+
+    def test_lengths(self):
+        self.assertEqual(self.db.get_length(), 3)
+        self.assertEqual(self.db.get_length_labeled(), 2)
+        self.assertEqual(self.db.get_length_unlabeled(), 1)
+        self.assertEqual(self.db.get_length_with_label(0), 1)
+
+    def test_queries(self):
+        self.assertEqual({i.uuid for i in self.db.get_by_label(1)}, {'a_00'})
+        self.assertEqual({i.uuid for i in self.db.get_by_time('2020-01-05')}, {'a_00', 'a_01'})
+        self.assertEqual({i.uuid for i in self.db.get_by_time_range('2020-01-06', '2020-02-01')}, {'a_01', 'b'})
+        self.assertEqual({i.uuid for i in self.db.get_by_uuid_prefix('a_')}, {'a_00', 'a_01'})
+        self.assertEqual({i.uuid for i in self.db.get_by_comment_contains('slab')}, {'a_00'})
+
+    def test_region(self):
+        region = 'POLYGON ((18.9 68.9, 19.05 68.9, 19.05 69.05, 18.9 69.05, 18.9 68.9))'
+        self.assertEqual({i.uuid for i in self.db.get_by_region(region)}, {'a_00', 'a_01'})
+        self.assertEqual({i.uuid for i in self.db.get_by_region_and_time(region, '2020-01-07', '2020-01-08')}, {'a_01'})
+
+    def test_migrate_locations(self):
+        # Items written before locations were stored are missed by region queries, with a warning, until migrated:
+        region = 'POLYGON ((18.9 68.9, 19.05 68.9, 19.05 69.05, 18.9 69.05, 18.9 68.9))'
+        self.db._execute(f'INSERT INTO {self.db._table} (uuid, geometry, t_0, t_1) VALUES (?, ?, ?, ?)',
+            ('old', 'POINT (19.02 69.02)', '2020-01-01T00:00:00.000000', '2020-01-02T00:00:00.000000'))
+        with self.assertLogs('skreddata.database', 'WARNING') as logs:
+            self.assertEqual({i.uuid for i in self.db.get_by_region(region)}, {'a_00', 'a_01'})
+        self.assertIn('1 items have no location', logs.output[0])
+        self.assertEqual(self.db.migrate_locations(), 1)
+        self.assertEqual(self.db.check_locations(), 0)
+        self.assertEqual({i.uuid for i in self.db.get_by_region(region)}, {'a_00', 'a_01', 'old'})
+
+    def test_make_filter(self):
+        region = 'POLYGON ((18.9 68.9, 19.05 68.9, 19.05 69.05, 18.9 69.05, 18.9 68.9))'
+        self.assertEqual(self.db.count(database.make_filter()), 3)
+        self.assertEqual(self.db.count(database.make_filter(labeled=True, t_0='2020-01-06')), 1)
+        self.assertEqual(self.db.count(database.make_filter(labeled=False)), 1)
+        self.assertEqual(self.db.count(database.make_filter(t_1='2020-01-04', uuid_prefix='a_')), 1)
+        self.assertEqual(self.db.count(database.make_filter(label=0, region=region)), 1)
+
+    def test_upsert_and_remove(self):
+        self.db.upsert_many([_item('b', 25.0, 70.0, '2020-02-01', '2020-02-03', label=2), _item('c', 5.0, 60.0, '2020-03-01', '2020-03-02')])
+        self.assertEqual(self.db.get_length(), 4)
+        self.assertEqual(self.db.get_by_uuid('b').label, 2)
+        self.db.remove_by_uuid('b')
+        self.assertIsNone(self.db.get_by_uuid('b'))
+        self.assertEqual(len(self.db.get_by_region('POINT (25.05 70.05)')), 0)
+
+    def test_iterate(self):
+        docs = list(self.db.iter_labeled(projection={'uuid': 1, 'label': 1}))
+        self.assertEqual({(d['uuid'], d['label']) for d in docs}, {('a_00', 1), ('a_01', 0)})
+        batches = list(self.db.iter_batches(batch_size=2))
+        self.assertEqual([len(b) for b in batches], [2, 1])
+
+    def test_exclusion_projection(self):
+        docs = [d for batch in self.db.iter_batches({'uuid': 'a_00'}, projection={'json': 0, 'location': 0}) for d in batch]
+        self.assertEqual(len(docs), 1)
+        self.assertEqual(docs[0]['label'], 1)
+        self.assertNotIn('json', docs[0])
+        self.assertNotIn('location', docs[0])
+        docs = [d for batch in self.db.iter_batches({'uuid': 'a_00'}, projection={'_id': 0}) for d in batch]
+        self.assertNotIn('_id', docs[0])
+        self.assertEqual(docs[0]['geometry'], self.db.get_by_uuid('a_00').geometry)
+
+    def test_numpy_labels(self):
+        self.db.upsert(_item('n', 19.0, 69.0, '2020-01-01', '2020-01-02', label=np.int64(3)))
+        self.assertEqual(self.db.get_by_uuid('n').label, 3)
+        self.assertIsInstance(self.db.get_by_uuid('n').label, int)
+        self.assertEqual({i.uuid for i in self.db.get_by_label(np.int64(3))}, {'n'})
+
+    def test_memory_url_is_shared(self):
+        a, b = database.open_database('memory://'), database.open_database('memory://')
+        a.upsert(_item('m', 0.0, 0.0, '2020-01-01', '2020-01-02'))
+        self.assertEqual(b.get_by_uuid('m').uuid, 'm')
+        a.remove_by_uuid('m')
+
+    def test_dummy_database_is_not_shared(self):
+        a, b = database.DummyDatabase(), database.DummyDatabase()
+        a.insert(_item('x', 0.0, 0.0, '2020-01-01', '2020-01-02'))
+        self.assertEqual(a.get_length(), 1)
+        self.assertEqual(b.get_length(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
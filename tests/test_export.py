@@ -0,0 +1,82 @@
+import unittest
+import tempfile
+import json
+import csv
+import os
+
+import sys
+sys.path.append('../')
+
+from skreddata import database, export
+from test_database import _item
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = database.DummyDatabase()
+        self.db.insert_many([
+            _item('a_00', 19.0, 69.0, '2020-01-01', '2020-01-05', label=1, comment='large slab'),
+            _item('a_01', 19.0, 69.0, '2020-01-05', '2020-01-10', label=0),
+            _item('b', 25.0, 70.0, '2020-02-01', '2020-02-03'),
+        ])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_geojson(self):
+        fn = os.path.join(self.tmp.name, 'items.geojson')
+        self.assertEqual(export.export(self.db, fn, filter=database.LABELED, batch_size=1), 2)
+        with open(fn) as fp:
+            features = json.load(fp)['features']
+        self.assertEqual({f['properties']['uuid'] for f in features}, {'a_00', 'a_01'})
+        self.assertEqual(features[0]['geometry']['type'], 'Polygon')
+        self.assertEqual(features[0]['properties']['t_0'], '2020-01-01T00:00:00')
+
+    def test_jsonl_and_csv(self):
+        fn = os.path.join(self.tmp.name, 'items.jsonl')
+        self.assertEqual(export.export(self.db, fn), 3)
+        with open(fn) as fp:
+            docs = [json.loads(line) for line in fp]
+        self.assertEqual([d['uuid'] for d in docs], ['a_00', 'a_01', 'b'])
+        self.assertTrue(docs[0]['geometry'].startswith('POLYGON'))
+
+        fn = os.path.join(self.tmp.name, 'items.csv')
+        export.export(self.db, fn, filter={'uuid': 'b'})
+        with open(fn) as fp:
+            rows = list(csv.DictReader(fp))
+        self.assertEqual([(r['uuid'], r['label']) for r in rows], [('b', '')])
+
+    def test_geoparquet(self):
+        fn = os.path.join(self.tmp.name, 'items.parquet')
+        self.assertEqual(export.export(self.db, fn), 3)
+        df = export.read_frame(fn)
+        self.assertEqual(sorted(df['uuid']), ['a_00', 'a_01', 'b'])
+        self.assertEqual(set(df['utm_zone']), {'34N', '35N'})
+        self.assertEqual(df.crs.to_epsg(), 4326)
+
+    def test_partitioned_geoparquet_and_ingest(self):
+        fn = os.path.join(self.tmp.name, 'items.parquet')
+        for partition_by in [('label', 'year'), ('label', 'utm_zone')]:
+            self.assertEqual(export.to_geoparquet(self.db, fn, partition_by=partition_by), 3)
+        self.assertEqual(sorted(os.listdir(fn)), ['label=0', 'label=1', 'label=__HIVE_DEFAULT_PARTITION__'])
+        self.assertEqual(os.listdir(os.path.join(fn, 'label=1')), ['utm_zone=34N'])
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['items.parquet'])
+
+        db = database.DummyDatabase()
+        self.assertEqual(export.ingest(db, fn), 3)
+        for uuid in ('a_00', 'a_01', 'b'):
+            a, b = self.db.get_by_uuid(uuid), db.get_by_uuid(uuid)
+            self.assertEqual((a.label, a.t_0, a.t_1, a.comment), (b.label, b.t_0, b.t_1, b.comment))
+            self.assertTrue(a.shape().equals(b.shape()))
+        self.assertEqual(db.get_length_unlabeled(), 1)
+        self.assertEqual(len(db.get_by_region('POINT (19.05 69.05)')), 2)
+
+    def test_unknown_format(self):
+        with self.assertRaises(Exception):
+            export.export(self.db, os.path.join(self.tmp.name, 'items.txt'))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+import tempfile
+import threading
+import datetime
+import json
+import os
+import http.server
+
+import sys
+sys.path.append('../')
+
+from skreddata import fetch, downloads
+
+
+DATA = bytes(range(256))*4096
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    # Stand-in for the ASF search API and the download hosts:
+    protocol_version = 'HTTP/1.1'
+    requests = []
+    failures = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _fail(self):
+        n = Handler.failures.get(self.path.split('?')[0], 0)
+        if n:
+            Handler.failures[self.path.split('?')[0]] = n - 1
+        return n
+
+    def do_GET(self):
+        Handler.requests.append((self.path, self.headers.get('Range')))
+        if self.path.startswith('/search'):
+            if self._fail():
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = json.dumps({'features': [{'properties': {'fileID': 'a', 'path': self.path}, 'geometry': None}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        offset = 0
+        if self.headers.get('Range'):
+            offset = int(self.headers['Range'].split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {offset}-{len(DATA) - 1}/{len(DATA)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(DATA) - offset))
+        self.end_headers()
+
+        # Interrupted responses send half of what is left before closing the connection:
+        if self._fail():
+            self.wfile.write(DATA[offset:offset + (len(DATA) - offset)//2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(DATA[offset:])
+
+
+class TestFetch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.config = fetch.Config(backoff=0.01, retries=3, search_url=f'{self.url}/search')
+        Handler.requests = []
+        Handler.failures = {}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_search(self):
+        query = {'processingLevel': 'GRD_HD', 'start': datetime.datetime(2020, 1, 1)}
+        res = fetch.search_many([query], self.config)[0]
+        self.assertEqual(res[0]['properties']['fileID'], 'a')
+        self.assertIn('output=geojson', res[0]['properties']['path'])
+        self.assertIn('start=2020-01-01T00:00:00', res[0]['properties']['path'])
+
+    def test_search_retries(self):
+        Handler.failures['/search'] = 2
+        res = fetch.search_many([{'processingLevel': 'GRD_HD'}], self.config)[0]
+        self.assertEqual(len(res), 1)
+        self.assertEqual(len(Handler.requests), 3)
+
+    def test_download_many(self):
+        downloads = [(f'{self.url}/file{i}', os.path.join(self.tmp.name, f'file{i}.zip')) for i in range(8)]
+        for fn in fetch.download_many(downloads, self.config):
+            with open(fn, 'rb') as fp:
+                self.assertEqual(fp.read(), DATA)
+            self.assertFalse(os.path.exists(f'{fn}.part'))
+
+    def test_download_resumes(self):
+        Handler.failures['/file'] = 1
+        fn = os.path.join(self.tmp.name, 'file.zip')
+        fetch.download_many([(f'{self.url}/file', fn)], self.config)
+        with open(fn, 'rb') as fp:
+            self.assertEqual(fp.read(), DATA)
+        self.assertEqual([r for _, r in Handler.requests], [None, f'bytes={len(DATA)//2}-'])
+
+    def test_download_resets_retries_on_progress(self):
+        # More interruptions than retries, but each resumed request adds to the file:
+        Handler.failures['/file'] = 2*self.config.retries
+        fn = os.path.join(self.tmp.name, 'file.zip')
+        fetch.download_many([(f'{self.url}/file', fn)], self.config)
+        with open(fn, 'rb') as fp:
+            self.assertEqual(fp.read(), DATA)
+        self.assertEqual(len(Handler.requests), 2*self.config.retries + 1)
+
+    def test_background(self):
+        fn = os.path.join(self.tmp.name, 'file.zip')
+        background = fetch.Background(self.config)
+        try:
+            futures = [background.download(f'{self.url}/file', fn) for _ in range(4)]
+            self.assertEqual({f.result() for f in futures}, {fn})
+        finally:
+            background.close()
+        self.assertEqual(len(Handler.requests), 1)
+
+    def test_prefetch_products(self):
+        # Products on disk are skipped, failures are logged and left to the download tasks:
+        with open(os.path.join(self.tmp.name, 'c.zip'), 'wb') as fp:
+            fp.write(DATA)
+        prods = [
+            {'fileID': 'a', 'fileName': 'a.zip', 'url': f'{self.url}/a'},
+            {'fileID': 'a', 'fileName': 'a.zip', 'url': f'{self.url}/a'},
+            {'fileID': 'b', 'fileName': 'b.zip', 'url': 'http://127.0.0.1:1/b'},
+            {'fileID': 'c', 'fileName': 'c.zip', 'url': f'{self.url}/c'},
+        ]
+        with self.assertLogs('skreddata.downloads', 'ERROR') as logs:
+            futures = downloads.prefetch_products(prods, self.tmp.name, self.config)
+            self.assertEqual(len(futures), 2)
+            self.assertEqual(futures[0].result(), os.path.join(self.tmp.name, 'a.zip'))
+            self.assertIsNotNone(futures[1].exception())
+
+            # Callbacks run in order, so the failure is logged once this one has run:
+            logged = threading.Event()
+            futures[1].add_done_callback(lambda _: logged.set())
+            logged.wait(10)
+        self.assertIn('product b', logs.output[0])
+        self.assertEqual([p for p, _ in Handler.requests], ['/a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
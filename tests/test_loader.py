@@ -0,0 +1,145 @@
+import unittest
+import tempfile
+import threading
+import time
+import os
+import numpy as np
+
+import sys
+sys.path.append('../')
+
+from skreddata import loader, database, pack, storage
+from test_stack import write_tif
+from test_pack import write_sample
+
+
+class SlowSample:
+
+    # Reads a constant array after a random delay, and records when reads start:
+    def __init__(self, uuid, delay, started):
+        self.uuid = uuid
+        self.label = None
+        self.delay = delay
+        self.started = started
+
+    def shape(self):
+        return (8, 8)
+
+    def read(self, window=None):
+        self.started.append(self.uuid)
+        time.sleep(self.delay)
+        return {'crs': np.full((1, 8, 8), self.uuid, dtype=np.float32)}
+
+
+class TestLoader(unittest.TestCase):
+    def slow_samples(self, n, seed=0):
+        rng = np.random.default_rng(seed)
+        started = []
+        return [SlowSample(i, float(rng.uniform(0, 0.02)), started) for i in range(n)], started
+
+    def test_order(self):
+        # Batches come in sample order (or the seeded shuffle), however reads complete:
+        samples, _ = self.slow_samples(37)
+        batches = list(loader.Loader(samples, batch_size=4, workers=8, prefetch=3))
+        self.assertEqual([u for b in batches for u in b['uuid']], list(range(37)))
+        self.assertEqual([int(b['crs'][0, 0, 0, 0]) for b in batches], list(range(0, 37, 4)))
+
+        shuffled = [u for b in loader.Loader(samples, batch_size=4, shuffle=True, seed=1) for u in b['uuid']]
+        self.assertEqual(sorted(shuffled), list(range(37)))
+        self.assertNotEqual(shuffled, list(range(37)))
+        self.assertEqual([u for b in loader.Loader(samples, batch_size=4, shuffle=True, seed=1) for u in b['uuid']], shuffled)
+        self.assertEqual(len(list(loader.Loader(samples, batch_size=4, drop_last=True))), 9)
+
+    def test_prefetch(self):
+        # No more than <prefetch> batches are read ahead of the consumer:
+        samples, started = self.slow_samples(40)
+        for k, batch in enumerate(loader.Loader(samples, batch_size=4, workers=16, prefetch=2)):
+            self.assertLessEqual(len(started), (k + 1 + 2)*4)
+            time.sleep(0.01)
+        self.assertEqual(sorted(started), list(range(40)))
+
+    def test_early_exit(self):
+        # Breaking out stops reading, and the reader threads exit:
+        samples, started = self.slow_samples(200)
+        for s in samples:
+            s.delay = 0.05
+        threads = threading.active_count()
+        batches = iter(loader.Loader(samples, batch_size=4, workers=2, prefetch=8))
+        next(batches)
+        batches.close()
+        n = len(started)
+        self.assertLess(n, 4*8)
+        time.sleep(0.2)
+        self.assertEqual(len(started), n)
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_crop(self):
+        # Crops are windows inside the sample, crops larger than it are an error:
+        samples, _ = self.slow_samples(4)
+        window = loader.Loader(samples, crop=(8, 4))._window(samples[0], 0)
+        self.assertEqual(window[0], (0, 8))
+        self.assertEqual(window[1][1] - window[1][0], 4)
+        self.assertLessEqual(window[1][1], 8)
+        with self.assertRaisesRegex(Exception, 'larger than sample'):
+            list(loader.Loader(samples, batch_size=4, crop=16))
+
+
+class TestSampleTypes(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+        rng = np.random.default_rng(0)
+        items = []
+
+        # Pair files, and a stack of three dates with two pairs, on the same grid:
+        for n, format in enumerate(['gtiff', 'zarr', 'gtiff']):
+            write_sample(self.folder, f's_{n:02d}', rng.random((4, 64, 48), dtype=np.float32), rng.random((1, 64, 48), dtype=np.float32), format)
+            items.append(database.Item(uuid=f's_{n:02d}', geometry='POINT (18 69)', t_0='2020-01-01', t_1='2020-01-13', label=n % 2))
+        srcs = [write_tif(os.path.join(self.folder, f'date{t}.tif'), rng.random((2, 64, 48), dtype=np.float32)) for t in range(3)]
+        os.makedirs(os.path.join(self.folder, 'a_p029'))
+        storage.write_stack(srcs, storage.stack_path(self.folder, 'a_p029'), block_size=32)
+        write_tif(storage.sample_path(self.folder, 'a_p029', 'dem'), rng.random((1, 64, 48), dtype=np.float32))
+        for n, dates in enumerate([[0, 1], [1, 2]]):
+            items.append(database.Item(uuid=f'a_{n:02d}', geometry='POINT (18 69)', t_0='2020-01-01', t_1='2020-01-25', label=1,
+                json={'stack': 'a_p029', 'dates': dates}))
+
+        self.db = database.DummyDatabase()
+        self.db.upsert_many(items)
+        self.pack = pack.pack(items, self.folder, os.path.join(self.folder, 'packed.h5'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sample_types(self):
+        samples = sorted(loader.samples_from_database(self.db, self.folder, labeled=False), key=lambda s: s.uuid)
+        self.assertEqual([type(s).__name__ for s in samples], ['StackSample']*2 + ['FileSample']*3)
+        with pack.PackedDataset(self.pack) as ds:
+            packed = sorted(loader.samples_from_pack(ds, labeled=False), key=lambda s: s.uuid)
+            self.assertEqual([s.uuid for s in packed], [s.uuid for s in samples])
+
+            # Each sample reads as its files do, whole and in windows:
+            window = ((8, 40), (16, 32))
+            for sample, _packed in zip(samples, packed):
+                if isinstance(sample, loader.StackSample):
+                    expected = {'crs': storage.read_pair_view(sample.stack, *sample.dates), 'dem': storage.read_window(sample.dem)}
+                else:
+                    expected = {name: storage.read_window(fn) for name, fn in sample.files.items()}
+                for s in (sample, _packed):
+                    self.assertEqual(tuple(s.shape()), (64, 48))
+                    for name in pack.LAYERS:
+                        np.testing.assert_array_equal(s.read()[name], expected[name])
+                        np.testing.assert_array_equal(s.read(window)[name], expected[name][:, 8:40, 16:32])
+
+            # Loaders over either give the same batches, crops included:
+            a = list(loader.Loader(samples, batch_size=2, crop=16, seed=3))
+            b = list(loader.Loader(packed, batch_size=2, crop=16, seed=3))
+            self.assertEqual(len(a), 3)
+            for x, y in zip(a, b):
+                self.assertEqual(x['uuid'], y['uuid'])
+                np.testing.assert_array_equal(x['label'], y['label'])
+                for name in pack.LAYERS:
+                    np.testing.assert_array_equal(x[name], y[name])
+
+
+if __name__ == '__main__':
+    unittest.main()
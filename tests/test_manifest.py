@@ -0,0 +1,54 @@
+import unittest
+import tempfile
+import os
+
+import sys
+sys.path.append('../')
+
+from skreddata import manifest
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+        os.makedirs(os.path.join(self.folder, 'u'))
+        self.files = {}
+        for stage in ('products', 'crs'):
+            fn = os.path.join(self.folder, 'u', f'u_{stage}.txt')
+            with open(fn, 'w') as fp:
+                fp.write(stage)
+            self.files[stage] = manifest.record(self.folder, 'u', stage, fn)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_completed(self):
+        self.assertEqual(manifest.completed_stages(self.folder, 'u'), self.files)
+        self.assertEqual(manifest.completed_stages(self.folder, 'other'), {})
+
+    def test_missing_output(self):
+        os.remove(self.files['crs'])
+        self.assertEqual(list(manifest.completed_stages(self.folder, 'u')), ['products'])
+
+    def test_changed_output(self):
+        with open(self.files['crs'], 'w') as fp:
+            fp.write('CRS')
+        self.assertIn('crs', manifest.completed_stages(self.folder, 'u', verify='size'))
+        self.assertNotIn('crs', manifest.completed_stages(self.folder, 'u', verify='checksum'))
+
+    def test_complete(self):
+        # Samples with stages left are resumed, samples without a manifest predate them and are done:
+        self.assertTrue(manifest.complete(self.folder, 'u', stages=('products', 'crs')))
+        self.assertFalse(manifest.complete(self.folder, 'u'))
+        self.assertTrue(manifest.complete(self.folder, 'other'))
+        os.remove(self.files['crs'])
+        self.assertFalse(manifest.complete(self.folder, 'u', stages=('products', 'crs')))
+
+    def test_clear(self):
+        manifest.clear(self.folder, 'u')
+        self.assertEqual(manifest.completed_stages(self.folder, 'u'), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import tempfile
+import os
+
+import sys
+sys.path.append('../')
+
+from skreddata import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fn = os.path.join(self.tmp.name, 'metrics.jsonl')
+        self.run = metrics.configure(self.fn)
+
+    def tearDown(self):
+        metrics.configure(None)
+        self.tmp.cleanup()
+
+    def test_measure(self):
+        out = os.path.join(self.tmp.name, 'out.bin')
+        with open(out, 'wb') as fp:
+            fp.write(b'0'*1000)
+        with metrics.measure('crs-write', 'a') as record:
+            metrics.output_bytes(record, out)
+        records = metrics.load(self.fn, self.run)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['uuid'], 'a')
+        self.assertEqual(records[0]['bytes_out'], 1000)
+        self.assertTrue(records[0]['ok'])
+        self.assertGreaterEqual(records[0]['wall_s'], 0)
+
+    def test_failed_stage_is_recorded(self):
+        with self.assertRaises(ValueError):
+            with metrics.measure('search'):
+                raise ValueError()
+        self.assertFalse(metrics.load(self.fn, self.run)[0]['ok'])
+
+    def test_summary(self):
+        for hit in (True, True, False, True):
+            with metrics.measure('gec-tile', cache_hit=hit):
+                pass
+        with metrics.measure('dem-mosaic', 'a'):
+            pass
+        metrics.configure(self.fn)
+        with metrics.measure('dem-mosaic', 'b'):
+            pass
+        summary = metrics.summarize(metrics.load(self.fn, self.run))
+        self.assertEqual(summary['gec-tile']['count'], 4)
+        self.assertEqual(summary['gec-tile']['cache_hit_rate'], 0.75)
+        self.assertEqual(summary['dem-mosaic']['uuids'], 1)
+
+    def test_disabled(self):
+        metrics.configure(None)
+        with metrics.measure('search') as record:
+            record['products'] = 1
+        self.assertFalse(os.path.exists(self.fn))
+
+
+if __name__ == '__main__':
+    unittest.main()
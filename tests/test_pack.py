@@ -0,0 +1,106 @@
+import unittest
+import tempfile
+import os
+import numpy as np
+import h5py
+
+import sys
+sys.path.append('../')
+
+from skreddata import storage, database, pack
+from test_stack import write_tif
+
+
+def write_sample(folder, uuid, crs, dem, format='gtiff'):
+    os.makedirs(os.path.join(folder, uuid), exist_ok=True)
+    for name, data in (('crs', crs), ('dem', dem)):
+        fn = write_tif(os.path.join(folder, f'{uuid}_{name}.tif'), data)
+        if format == 'gtiff':
+            os.replace(fn, storage.sample_path(folder, uuid, name))
+        else:
+            storage.convert(fn, storage.sample_path(folder, uuid, name, format), format=format, block_size=32)
+
+
+class TestPack(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+        rng = np.random.default_rng(0)
+        self.items = []
+        self.expected = {}
+
+        # Pair files (GeoTIFF and Zarr), with and without labels:
+        for n, (format, label) in enumerate([('gtiff', 1), ('gtiff', None), ('zarr', 0)]):
+            uuid = f's_{n:02d}'
+            crs = rng.random((4, 64, 48), dtype=np.float32)
+            dem = rng.random((1, 64, 48), dtype=np.float32)
+            write_sample(self.folder, uuid, crs, dem, format)
+            self.items.append(database.Item(uuid=uuid, geometry=f'POINT ({18 + n} 69)', t_0='2020-01-01', t_1='2020-01-13', label=label))
+            self.expected[uuid] = {'crs': crs, 'dem': dem}
+
+        # A stack of three dates, with two pairs as items:
+        dates = [rng.random((2, 64, 48), dtype=np.float32) for _ in range(3)]
+        srcs = [write_tif(os.path.join(self.folder, f'date{t}.tif'), d) for t, d in enumerate(dates)]
+        os.makedirs(os.path.join(self.folder, 'a_p029'))
+        storage.write_stack(srcs, storage.stack_path(self.folder, 'a_p029'), block_size=32)
+        dem = rng.random((1, 64, 48), dtype=np.float32)
+        write_tif(storage.sample_path(self.folder, 'a_p029', 'dem'), dem)
+        for n, (i, j) in enumerate([(0, 1), (1, 2)]):
+            uuid = f'a_{n:02d}'
+            self.items.append(database.Item(uuid=uuid, geometry='POLYGON ((18 69, 18.1 69, 18.1 69.1, 18 69))', t_0='2020-01-01',
+                t_1='2020-01-25', label=1, json={'stack': 'a_p029', 'dates': [i, j]}))
+            self.expected[uuid] = {'crs': np.concatenate([dates[i], dates[j]]), 'dem': dem}
+
+        # Missing files, and a sample of another shape, are left out:
+        self.items.append(database.Item(uuid='missing', geometry='POINT (18 69)', t_0='2020-01-01', t_1='2020-01-13'))
+        write_sample(self.folder, 'other', np.zeros((4, 32, 32), np.float32), np.zeros((1, 32, 32), np.float32))
+        self.items.append(database.Item(uuid='other', geometry='POINT (18 69)', t_0='2020-01-01', t_1='2020-01-13'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        fn = pack.pack(self.items, self.folder, os.path.join(self.folder, 'packed.h5'))
+        with pack.PackedDataset(fn) as ds:
+            self.assertEqual(list(ds.uuid), list(self.expected))
+            self.assertEqual(list(ds.label), [1, pack.NO_LABEL, 0, 1, 1])
+            self.assertEqual(ds.t_0[0], np.datetime64('2020-01-01T00:00', 'ns'))
+            self.assertEqual(ds.t_1[3], np.datetime64('2020-01-25T00:00', 'ns'))
+            np.testing.assert_allclose(ds.bbox[1], [19, 69, 19, 69])
+            np.testing.assert_allclose(ds.bbox[3], [18, 69, 18.1, 69.1])
+            for uuid, expected in self.expected.items():
+                sample = ds[ds.index_of(uuid)]
+                self.assertEqual(sample['uuid'], uuid)
+                for name in pack.LAYERS:
+                    np.testing.assert_array_equal(sample[name], expected[name])
+                window = ds.read(ds.index_of(uuid), window=((8, 40), (16, 32)))
+                np.testing.assert_array_equal(window['crs'], expected['crs'][:, 8:40, 16:32])
+
+    def test_stack_only(self):
+        # Stack samples alone are packed too, instead of failing to find any sample:
+        fn = pack.pack(self.items[3:5], self.folder, os.path.join(self.folder, 'stack.h5'))
+        with pack.PackedDataset(fn) as ds:
+            self.assertEqual(list(ds.uuid), ['a_00', 'a_01'])
+            np.testing.assert_array_equal(ds.read(1)['crs'], self.expected['a_01']['crs'])
+
+    def test_no_samples(self):
+        with self.assertRaises(Exception):
+            pack.pack(self.items[5:6], self.folder, os.path.join(self.folder, 'empty.h5'))
+
+    def test_memmap(self):
+        # Uncompressed layers are contiguous and memory mapped, compressed layers are chunked per chip:
+        fn = pack.pack(self.items, self.folder, os.path.join(self.folder, 'packed.h5'))
+        gz = pack.pack(self.items, self.folder, os.path.join(self.folder, 'packed_gz.h5'), compression='gzip')
+        with pack.PackedDataset(fn) as ds, pack.PackedDataset(gz) as ds_gz, pack.PackedDataset(fn, mmap=False) as ds_h5:
+            self.assertTrue(all(isinstance(layer, np.memmap) for layer in ds.layers.values()))
+            self.assertTrue(all(isinstance(layer, h5py.Dataset) for layer in ds_gz.layers.values()))
+            self.assertTrue(all(isinstance(layer, h5py.Dataset) for layer in ds_h5.layers.values()))
+            self.assertEqual(ds_gz.layers['crs'].chunks, (1, 4, 64, 48))
+            for i in range(len(ds)):
+                for name in pack.LAYERS:
+                    np.testing.assert_array_equal(ds.read(i)[name], ds_gz.read(i)[name])
+                    np.testing.assert_array_equal(ds.read(i)[name], ds_h5.read(i)[name])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import os
+import dask
+
+import sys
+sys.path.append('../')
+
+from skreddata import profiles
+
+
+class TestProfiles(unittest.TestCase):
+    def tearDown(self):
+        os.environ.pop(profiles.RESOURCES_ENV, None)
+
+    def test_plan_local(self):
+        # 64 cores, 256 GB: 1024x1024 mosaics fit on every core, 16384x16384 mosaics do not:
+        plan = profiles.plan_local((1024, 1024), (1024, 1024), cores=64, memory=256*1024**3)
+        self.assertEqual(plan.processes, 64)
+        plan = profiles.plan_local((2048, 2048), (16384, 16384), cores=64, memory=256*1024**3)
+        self.assertLess(plan.processes, 64)
+        resources = profiles.Resources.for_shapes((2048, 2048), (16384, 16384))
+        self.assertGreaterEqual(plan.memory_limit*(0.8 - profiles.TILE_CACHE_FRACTION), resources.mosaic)
+        self.assertLessEqual(plan.processes*plan.memory_limit + plan.io_memory_limit, 256*1024**3)
+
+    def test_tile_cache_items(self):
+        # 2048x2048 tiles of two float32 bands are 32 MB, caches of a 4 GB worker hold a quarter of it:
+        items = profiles.tile_cache_items((2048, 2048), 4*1024**3)
+        self.assertEqual(items, 16)
+        self.assertLessEqual(profiles.TILE_CACHES*items*32*1024**2, 4*1024**3*profiles.TILE_CACHE_FRACTION)
+        self.assertEqual(profiles.tile_cache_items((2048, 2048), 1024**2), 1)
+
+    def test_annotate(self):
+        f = dask.delayed(lambda x: x)
+        with profiles.annotate('cpu', 1000):
+            a = f(1)
+        self.assertFalse(any(layer.annotations for layer in a.__dask_graph__().layers.values()))
+        os.environ[profiles.RESOURCES_ENV] = '1'
+        with profiles.annotate('cpu', 1000):
+            b = f(1)
+        annotations = [layer.annotations for layer in b.__dask_graph__().layers.values()]
+        self.assertEqual(annotations, [{'resources': {'cpu': 1, 'memory': 1000}}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,240 @@
+import unittest
+import tempfile
+import datetime
+import itertools
+from unittest import mock
+import numpy as np
+import shapely.wkt
+import shapely.geometry
+
+import sys
+sys.path.append('../')
+
+from skreddata import search, cache
+
+
+START = datetime.datetime(2020, 1, 1, 5, 0)
+
+
+def _footprint(lon, lat, size=1.0):
+    return {
+        'type': 'Polygon',
+        'coordinates': [[[lon, lat], [lon + size, lat], [lon + size, lat + size], [lon, lat + size], [lon, lat]]]
+    }
+
+
+def _time(t):
+    return t.isoformat(timespec='milliseconds') + 'Z'
+
+
+def fake_products(n, seed=0, paths=(29, 58, 102), lons=(16.0, 17.5, 19.0, 20.5)):
+
+    # Search results in random order: passes every 6 days per path, of one to three frames with gaps
+    # between frames right around ADJACENT_GAP (60 s), and footprints at a few longitudes:
+    rng = np.random.default_rng(seed)
+    prods = []
+    while len(prods) < n:
+        path = int(rng.choice(paths))
+        t = START + datetime.timedelta(days=6*int(rng.integers(0, 60)), minutes=int(path) % 13)
+        lon = float(rng.choice(lons))
+        for f in range(int(rng.integers(1, 4))):
+            duration = datetime.timedelta(seconds=int(rng.integers(20, 30)))
+            prods.append({
+                'properties': {
+                    'pathNumber': path,
+                    'startTime': _time(t),
+                    'stopTime': _time(t + duration),
+                    'fileID': f'S1_{len(prods):06d}',
+                },
+                'geometry': _footprint(lon, 68.0 + f*0.5) if rng.random() > 0.05 else None,
+            })
+            t = t + duration + datetime.timedelta(seconds=int(rng.choice([0, 30, 59, 60, 61, 90])))
+    return [prods[i] for i in rng.permutation(n)]
+
+
+def _search_polygon(aoi, space_buffer):
+    # Buffered in degrees, standing in for gtile's buffer in the closest UTM zone:
+    return shapely.geometry.polygon.orient(shapely.wkt.loads(aoi).buffer(space_buffer/111_000))
+
+
+class FakeASF:
+
+    # Returns the products intersecting the query polygon that start in its time window:
+    def __init__(self, products):
+        self.products = products
+        self.queries = []
+
+    def __call__(self, query, fetch_config=None):
+        self.queries.append(query)
+        poly = shapely.wkt.loads(query['intersectsWith'])
+        return [
+            p for p in self.products
+            if (p['geometry'] is None or shapely.geometry.shape(p['geometry']).intersects(poly)) and
+            query['start'] <= datetime.datetime.fromisoformat(p['properties']['startTime'][:-1]) <= query['end']
+        ]
+
+
+def fake_aois(lons, lats, size=0.02):
+    return [f'POLYGON (({x} {y}, {x + size} {y}, {x + size} {y + size}, {x} {y + size}, {x} {y}))' for x, y in zip(lons, lats)]
+
+
+def _start(prod):
+    return datetime.datetime.fromisoformat(prod['startTime'][:-1])
+
+
+def _stop(prod):
+    return datetime.datetime.fromisoformat(prod['stopTime'][:-1])
+
+
+def loop_pairs(prods, t_0, t_1, exact_times=False):
+
+    # Pair finding as it was before vectorization, one path and pass at a time. Passes are split as
+    # rastertools.group_adjacent does, on gaps over ADJACENT_GAP after the latest stop so far:
+    gap = datetime.timedelta(seconds=int(search.ADJACENT_GAP/np.timedelta64(1, 's')))
+    prods = sorted(prods, key=lambda x: x['pathNumber'])
+    pairs = []
+    for _, _prods in itertools.groupby(prods, lambda x: x['pathNumber']):
+        groups = []
+        for p in sorted(_prods, key=lambda x: x['startTime']):
+            if groups and _start(p) <= max(_stop(q) for q in groups[-1]) + gap:
+                groups[-1].append(p)
+            else:
+                groups.append([p])
+        for a, b in zip(groups[:-1], groups[1:]):
+            _t0 = min(_start(p) for p in a)
+            _t1 = min(_start(p) for p in b)
+            if exact_times:
+                if abs(_t0 - t_0) < datetime.timedelta(minutes=10) and abs(_t1 - t_1) < datetime.timedelta(minutes=10):
+                    pairs.append([a, b])
+            elif not (_t1 < t_0 or _t0 > t_1):
+                pairs.append([a, b])
+    return pairs
+
+
+class TestPairs(unittest.TestCase):
+    def test_adjacent_gap(self):
+        # Frames 60 s apart are one pass, 61 s apart are two:
+        def frame(path, start, seconds=25):
+            return {'pathNumber': path, 'startTime': _time(start), 'stopTime': _time(start + datetime.timedelta(seconds=seconds))}
+
+        t = START
+        prods = [
+            frame(1, t), frame(1, t + datetime.timedelta(seconds=85)),
+            frame(1, t + datetime.timedelta(days=6)), frame(1, t + datetime.timedelta(days=6, seconds=86)),
+        ]
+        pairs = search._pairs_from_products(prods, t, t + datetime.timedelta(days=12))
+        self.assertEqual(pairs, [[prods[:2], prods[2:3]], [prods[2:3], prods[3:]]])
+        self.assertEqual(pairs, loop_pairs(prods, t, t + datetime.timedelta(days=12)))
+
+    def test_matches_loop(self):
+        for seed in range(10):
+            rng = np.random.default_rng(seed)
+            prods = [p['properties'] for p in fake_products(int(rng.integers(1, 400)), seed=seed)]
+            for _ in range(10):
+                t_0 = START + datetime.timedelta(days=int(rng.integers(-10, 380)))
+                t_1 = t_0 + datetime.timedelta(days=int(rng.integers(0, 60)))
+                self.assertEqual(search._pairs_from_products(prods, t_0, t_1), loop_pairs(prods, t_0, t_1))
+
+    def test_matches_loop_exact_times(self):
+        # Times of interest on, and just within or beyond 10 minutes of, acquisition starts:
+        offsets = [datetime.timedelta(seconds=s) for s in (0, 300, 599, 600, 601, -599, -600)]
+        for seed in range(10):
+            rng = np.random.default_rng(seed)
+            prods = [p['properties'] for p in fake_products(300, seed=seed)]
+            starts = sorted({_start(p) for p in prods})
+            n = 0
+            for _ in range(40):
+                i = int(rng.integers(0, len(starts) - 1))
+                t_0 = starts[i] + offsets[int(rng.integers(0, len(offsets)))]
+                t_1 = starts[min(i + int(rng.integers(1, 6)), len(starts) - 1)] + offsets[int(rng.integers(0, len(offsets)))]
+                expected = loop_pairs(prods, t_0, t_1, exact_times=True)
+                self.assertEqual(search._pairs_from_products(prods, t_0, t_1, exact_times=True), expected)
+                n += len(expected)
+            self.assertGreater(n, 0)
+
+    def test_several_aois_in_one_table(self):
+        # Rows shared between AOIs, and AOIs without products:
+        prods = [p['properties'] for p in fake_products(500)]
+        table = search._product_table(prods)
+        rng = np.random.default_rng(0)
+        members = [np.sort(rng.choice(len(prods), int(rng.integers(0, 300)), replace=False)) for _ in range(8)] + [np.zeros(0, int)]
+        times = [(START + datetime.timedelta(days=30*i), START + datetime.timedelta(days=30*i + 45)) for i in range(9)]
+        for m, (t_0, t_1), pairs in zip(members, times, search._pairs_from_table(table, members, times)):
+            expected = loop_pairs([prods[k] for k in m], t_0, t_1)
+            self.assertEqual([[[prods[k] for k in a], [prods[k] for k in b]] for a, b in pairs], expected)
+
+
+class TestSearchEquivalence(unittest.TestCase):
+    def setUp(self):
+        self.asf = FakeASF(fake_products(3_000, seed=2))
+        self.patch = mock.patch.multiple(search, _remote_search=self.asf, _search_polygon=_search_polygon)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_batched_single_and_multi(self):
+        # AOIs near and far from each other, with overlapping and separate times of interest:
+        rng = np.random.default_rng(3)
+        n = 24
+        aois = fake_aois(rng.uniform(16, 21, n), rng.uniform(68, 69.5, n))
+        t_0s = [START + datetime.timedelta(days=int(d)) for d in rng.integers(0, 330, n)]
+        t_1s = [t + datetime.timedelta(days=int(d)) for t, d in zip(t_0s, rng.integers(0, 40, n))]
+
+        single = [search.search_grd_pairs(aoi, t_0, t_1) for aoi, t_0, t_1 in zip(aois, t_0s, t_1s)]
+        self.assertGreater(sum(len(p) for p in single), 0)
+        self.assertEqual(search.search_grd_pairs_batch(aois, [[a, b] for a, b in zip(t_0s, t_1s)]), single)
+        self.assertEqual(search.search_grd_pairs(aois, t_0s, t_1s), single)
+        self.assertEqual(
+            search.search_grd_pairs_batch(aois, [[a, b] for a, b in zip(t_0s, t_1s)], max_extent=0),
+            single
+        )
+
+
+class TestSearchCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.asf = FakeASF(fake_products(2_000))
+        self.patch = mock.patch.multiple(search, _remote_search=self.asf, _search_polygon=_search_polygon)
+        self.patch.start()
+
+        # Four groups of four nearby AOIs, far apart:
+        rng = np.random.default_rng(1)
+        lons = np.repeat([16.2, 17.7, 19.2, 20.7], 4) + rng.uniform(0, 0.1, 16)
+        lats = np.repeat([68.2, 68.7, 68.2, 68.7], 4) + rng.uniform(0, 0.1, 16)
+        self.aois = fake_aois(lons, lats)
+        self.tois = [[START + datetime.timedelta(days=30*i), START + datetime.timedelta(days=30*i + 20)] for i in range(16)]
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+    def test_rerun_on_subset_hits_cache(self):
+        # A re-run without the rows already done (as from_geojson does) clusters differently, but finds
+        # each AOI's results under its own query:
+        c = cache.SearchCache.in_folder(self.tmp.name)
+        first = search.search_grd_pairs_batch(self.aois, self.tois, cache=c)
+        n_queries = len(self.asf.queries)
+        self.assertGreater(n_queries, 0)
+        self.assertEqual(len(c), 16)
+
+        keep = [i for i in range(16) if i % 3]
+        second = search.search_grd_pairs_batch([self.aois[i] for i in keep], [self.tois[i] for i in keep], cache=c)
+        self.assertEqual(len(self.asf.queries), n_queries)
+        self.assertEqual(second, [first[i] for i in keep])
+
+        offline = cache.SearchCache.in_folder(self.tmp.name, offline=True)
+        self.assertEqual(search.search_grd_pairs_batch(self.aois, self.tois, cache=offline), first)
+        with self.assertRaises(cache.CacheMiss):
+            search.search_grd_pairs_batch(fake_aois([5.0], [60.0]), self.tois[:1], cache=offline)
+
+    def test_single_search_shares_cache(self):
+        c = cache.SearchCache.in_folder(self.tmp.name)
+        single = search.search_grd_pairs(self.aois[0], *self.tois[0], cache=c)
+        n_queries = len(self.asf.queries)
+        self.assertEqual(search.search_grd_pairs_batch(self.aois[:1], self.tois[:1], cache=c), [single])
+        self.assertEqual(len(self.asf.queries), n_queries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import datetime
+import itertools
+from unittest import mock
+import numpy as np
+import shapely.wkt
+
+import sys
+sys.path.append('../')
+
+from skreddata import search
+from test_search import START, FakeASF, fake_products, fake_aois, _search_polygon
+
+
+DAY = datetime.timedelta(days=1)
+
+
+def boxes(lons, lats, size=0.01):
+    return [shapely.wkt.loads(aoi) for aoi in fake_aois(lons, lats, size)]
+
+
+def members(clusters):
+    return sorted(sorted(c['members']) for c in clusters)
+
+
+class TestClusterSearches(unittest.TestCase):
+    def test_max_extent(self):
+        # AOIs 1.5 degrees (about 167 km) apart north-south merge within 200 km, 2 degrees do not:
+        windows = [(START, START + DAY)]*2
+        self.assertEqual(members(search._cluster_searches(boxes([10.0, 10.0], [60.0, 61.5]), windows, 200_000, 90*DAY)), [[0, 1]])
+        self.assertEqual(members(search._cluster_searches(boxes([10.0, 10.0], [60.0, 62.0]), windows, 200_000, 90*DAY)), [[0], [1]])
+
+    def test_max_span(self):
+        # Time windows spanning 90 days together merge, 91 days do not:
+        polys = boxes([10.0, 10.01], [60.0, 60.0])
+        for days, expected in ((90, [[0, 1]]), (91, [[0], [1]])):
+            windows = [(START, START + DAY), (START + (days - 1)*DAY, START + days*DAY)]
+            self.assertEqual(members(search._cluster_searches(polys, windows, 200_000, 90*DAY)), expected)
+
+    def test_greedy_limits(self):
+        # No cluster exceeds the limits, however many AOIs are merged:
+        rng = np.random.default_rng(0)
+        n = 300
+        polys = boxes(rng.uniform(5, 30, n), rng.uniform(58, 71, n))
+        t_0 = [START + int(d)*DAY for d in rng.integers(0, 365, n)]
+        windows = [(t, t + int(d)*DAY) for t, d in zip(t_0, rng.integers(0, 30, n))]
+        clusters = search._cluster_searches(polys, windows, 200_000, 90*DAY)
+        self.assertEqual(sorted(i for c in clusters for i in c['members']), list(range(n)))
+        self.assertLess(len(clusters), n)
+        for c in clusters:
+            self.assertLessEqual(search._extent_in_meters(c['bounds']), 200_000)
+            self.assertLessEqual(c['window'][1] - c['window'][0], 90*DAY)
+            for i in c['members']:
+                minx, miny, maxx, maxy = polys[i].bounds
+                self.assertTrue(c['bounds'][0] <= minx and c['bounds'][1] <= miny and maxx <= c['bounds'][2] and maxy <= c['bounds'][3])
+                self.assertTrue(c['window'][0] <= windows[i][0] and windows[i][1] <= c['window'][1])
+
+    def test_antimeridian(self):
+        # AOIs on each side of the antimeridian are not merged into a box around the globe:
+        windows = [(START, START + DAY)]*2
+        clusters = search._cluster_searches(boxes([179.98, -179.99], [65.0, 65.0]), windows, 200_000, 90*DAY)
+        self.assertEqual(members(clusters), [[0], [1]])
+
+    def test_high_latitude(self):
+        # 5 degrees of longitude are about 116 km at 78N, but 557 km at the equator:
+        windows = [(START, START + DAY)]*2
+        self.assertEqual(members(search._cluster_searches(boxes([10.0, 15.0], [78.0, 78.0]), windows, 200_000, 90*DAY)), [[0, 1]])
+        self.assertEqual(members(search._cluster_searches(boxes([10.0, 15.0], [0.0, 0.0]), windows, 200_000, 90*DAY)), [[0], [1]])
+        self.assertEqual(members(search._cluster_searches(boxes([10.0, 15.0], [-78.0, -78.0]), windows, 200_000, 90*DAY)), [[0, 1]])
+
+    def test_extent_at_widest_parallel(self):
+        # A box from 60N to 62N is as wide as on 60N, and one across the equator as on the equator:
+        self.assertAlmostEqual(search._extent_in_meters((10.0, 60.0, 14.0, 62.0)), 4*111_320*np.cos(np.deg2rad(60)))
+        self.assertAlmostEqual(search._extent_in_meters((10.0, -0.5, 14.0, 0.5)), 4*111_320)
+        self.assertAlmostEqual(search._extent_in_meters((10.0, -62.0, 14.0, -60.0)), 4*111_320*np.cos(np.deg2rad(60)))
+        self.assertAlmostEqual(search._extent_in_meters((10.0, 89.5, 10.1, 90.0)), 0.5*110_574)
+
+
+class TestMergedQueries(unittest.TestCase):
+    def setUp(self):
+        self.asf = FakeASF(fake_products(2_000, seed=4))
+        self.patch = mock.patch.multiple(search, _remote_search=self.asf, _search_polygon=_search_polygon)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_products_assigned_to_aois(self):
+        # Three AOIs merged into one query (under footprints at different longitudes, with different
+        # times), get the products of their own queries only:
+        aois = fake_aois([16.5, 18.0, 19.5], [68.2, 68.2, 68.2])
+        tois = [[START + 10*DAY, START + 30*DAY], [START + 40*DAY, START + 60*DAY], [START + 20*DAY, START + 50*DAY]]
+        batch = search.search_grd_pairs_batch(aois, tois, max_extent=500_000)
+        self.assertEqual(len(self.asf.queries), 1)
+        merged = self.asf.queries[0]
+
+        for aoi, (t_0, t_1), pairs in zip(aois, tois, batch):
+            self.assertGreater(len(pairs), 0)
+            single = search.search_grd_pairs(aoi, t_0, t_1)
+            self.assertEqual(pairs, single)
+
+            # Every product found is under the AOI and was returned by the merged query:
+            query = self.asf.queries[-1]
+            own = {p['properties']['fileID'] for p in self.asf(query)}
+            found = {p['fileID'] for pair in pairs for group in pair for p in group}
+            self.assertLessEqual(found, own)
+            self.assertLessEqual(found, {p['properties']['fileID'] for p in self.asf(merged)})
+
+        # Products with footprints under one AOI only are not shared out to the others (those without
+        # a footprint match every AOI, as in single searches):
+        footprints = {p['properties']['fileID'] for p in self.asf.products if p['geometry'] is not None}
+        found = [{p['fileID'] for pair in pairs for group in pair for p in group} & footprints for pairs in batch]
+        for a, b in itertools.combinations(found, 2):
+            self.assertFalse(a & b)
+
+
+if __name__ == '__main__':
+    unittest.main()
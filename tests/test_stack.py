@@ -0,0 +1,79 @@
+import unittest
+import tempfile
+import os
+import numpy as np
+
+import sys
+sys.path.append('../')
+
+from skreddata import storage, loader, database
+
+
+def write_tif(fn, data):
+    import rasterio
+    import rasterio.transform
+    with rasterio.open(
+            fn, 'w', driver='GTiff', width=data.shape[2], height=data.shape[1], count=data.shape[0],
+            dtype=data.dtype, crs='EPSG:32633', transform=rasterio.transform.from_origin(500_000, 7_600_000, 10, 10)) as ds:
+        ds.write(data)
+    return fn
+
+
+class TestStack(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+        self.dates = [np.full((2, 64, 48), t, dtype=np.float32) + np.arange(48, dtype=np.float32) for t in range(3)]
+        os.makedirs(os.path.join(self.folder, 'a_p029'))
+        srcs = [write_tif(os.path.join(self.folder, f'{t}.tif'), d) for t, d in enumerate(self.dates)]
+        self.fn = storage.write_stack(srcs, storage.stack_path(self.folder, 'a_p029'), attrs={'pairs': [[0, 1], [1, 2]]}, block_size=32)
+        write_tif(storage.sample_path(self.folder, 'a_p029', 'dem'), np.zeros((1, 64, 48), dtype=np.float32))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_write_stack(self):
+        self.assertEqual(storage.read_shape(self.fn), (3, 2, 64, 48))
+        attrs = storage.read_stack_attrs(self.fn)
+        self.assertEqual(attrs['pairs'], [[0, 1], [1, 2]])
+        self.assertIsNotNone(attrs['crs'])
+
+    def test_codecs(self):
+        # Compression names map to the matching zarr codec, and the data reads back the same:
+        import zarr
+        srcs = [os.path.join(self.folder, f'{t}.tif') for t in range(3)]
+        codecs = {}
+        for compress in ('deflate', 'zstd', 'lz4', None):
+            fn = storage.write_stack(srcs, os.path.join(self.folder, f'{compress}.zarr'), block_size=32, compress=compress)
+            codecs[compress] = [type(c).__name__ for c in zarr.open_array(store=fn, mode='r').metadata.codecs]
+            np.testing.assert_array_equal(storage.read_pair_view(fn, 0, 2), np.concatenate([self.dates[0], self.dates[2]]))
+        self.assertEqual(codecs, {
+            'deflate': ['BytesCodec', 'GzipCodec'],
+            'zstd': ['BytesCodec', 'ZstdCodec'],
+            'lz4': ['BytesCodec', 'BloscCodec'],
+            None: ['BytesCodec'],
+        })
+        with self.assertRaises(Exception):
+            storage.write_stack(srcs, os.path.join(self.folder, 'lzw.zarr'), compress='lzw')
+
+    def test_pair_view(self):
+        view = storage.read_pair_view(self.fn, 1, 2, window=((8, 40), (0, 16)))
+        expected = np.concatenate([self.dates[1], self.dates[2]])[:, 8:40, 0:16]
+        np.testing.assert_array_equal(view, expected)
+
+    def test_samples_from_database(self):
+        db = database.DummyDatabase()
+        db.upsert_many([
+            database.Item(uuid=f'a_{n:02d}', geometry='POINT (18 69)', t_0='2020-01-01', t_1='2020-01-13', label=1,
+                json={'stack': 'a_p029', 'dates': dates})
+            for n, dates in enumerate([[0, 1], [1, 2]])
+        ])
+        samples = loader.samples_from_database(db, self.folder)
+        self.assertEqual(sorted(s.dates for s in samples), [(0, 1), (1, 2)])
+        batch = next(iter(loader.Loader(samples, batch_size=2, crop=16, seed=0)))
+        self.assertEqual(batch['crs'].shape, (2, 4, 16, 16))
+        self.assertEqual(batch['dem'].shape, (2, 1, 16, 16))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import time
+import dask
+
+import sys
+sys.path.append('../')
+
+from skreddata import stream
+
+
+@dask.delayed
+def wait(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+@dask.delayed
+def fail(message):
+    raise ValueError(message)
+
+
+CALLS = []
+
+
+def download(name):
+    CALLS.append(name)
+    time.sleep(0.5)
+    return name
+
+
+def suffix(fn, i):
+    return f'{fn}-{i}'
+
+
+class TestStream(unittest.TestCase):
+    def test_completion_order(self):
+        tasks = [('slow', wait(1.0, 'slow')), ('fast', wait(0.1, 'fast'))]
+        res = list(stream.compute_streaming(tasks, max_in_flight=2, threads=2))
+        self.assertEqual([(key, value) for key, value, _ in res], [('fast', 'fast'), ('slow', 'slow')])
+        self.assertTrue(all(error is None for _, _, error in res))
+
+    def test_errors(self):
+        # A failing graph is reported, and the others still complete:
+        tasks = [('a', wait(0.0, 1)), ('b', fail('b failed')), ('c', wait(0.0, 3))]
+        res = {key: (value, error) for key, value, error in stream.compute_streaming(tasks, max_in_flight=2, threads=2)}
+        self.assertEqual(res['a'], (1, None))
+        self.assertEqual(res['c'], (3, None))
+        self.assertIsNone(res['b'][0])
+        self.assertIsInstance(res['b'][1], ValueError)
+
+    def test_in_flight(self):
+        # Tasks are pulled lazily, never more than <max_in_flight> ahead of the results:
+        pulled = []
+
+        def tasks():
+            for i in range(20):
+                pulled.append(i)
+                yield i, wait(0.01*(i % 3), {'i': i})
+
+        yielded = 0
+        for key, res, error in stream.compute_streaming(tasks(), max_in_flight=4, threads=4):
+            self.assertLessEqual(len(pulled) - yielded, 4)
+            self.assertEqual(res, {'i': key})
+            yielded += 1
+        self.assertEqual(yielded, 20)
+
+    def test_shared_keys(self):
+        # Graphs in flight together compute their common keys once:
+        del CALLS[:]
+
+        def graph(i):
+            shared = dask.delayed(download, pure=True)('scene', dask_key_name='download-scene')
+            return i, dask.delayed(suffix)(shared, i)
+
+        tasks = [graph(i) for i in range(4)]
+        res = {key: value for key, value, _ in stream.compute_streaming(tasks, max_in_flight=4, threads=4)}
+        self.assertEqual(res, {i: f'scene-{i}' for i in range(4)})
+        self.assertEqual(CALLS, ['scene'])
+
+
+if __name__ == '__main__':
+    unittest.main()
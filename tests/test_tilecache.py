@@ -0,0 +1,125 @@
+import unittest
+import tempfile
+import os
+from unittest import mock
+import dask
+
+import sys
+sys.path.append('../')
+
+from skreddata import tilecache, downloads
+
+
+class TestTileCache(unittest.TestCase):
+    def test_lru(self):
+        cache = tilecache.TileCache(max_items=2)
+        for key in ('a', 'b', 'a', 'c'):
+            cache.get_or_compute(key, lambda: key.upper())
+        self.assertEqual(list(cache._tiles), ['a', 'c'])
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertTrue(cache.contains('a'))
+        self.assertFalse(cache.contains('b'))
+
+    def test_disk_tier(self):
+        with tempfile.TemporaryDirectory() as folder:
+            tilecache.TileCache(folder=folder).get_or_compute('a', lambda: [1, 2])
+            cache = tilecache.TileCache(folder=folder)
+            self.assertTrue(cache.contains('a'))
+            self.assertEqual(cache.get_or_compute('a', lambda: None), [1, 2])
+            self.assertEqual(cache.hits, 1)
+
+
+class TestSharedTiles(unittest.TestCase):
+    def test_shared_tiles_inputs(self):
+        # Inputs of shared tiles are computed in the outer graph, and used as they are by the tile:
+        calls = []
+
+        @dask.delayed
+        def download(name):
+            calls.append(name)
+            return f'{name}.zip'
+
+        files = [download('a'), download('b')]
+        tiles = {(0, 0): dask.delayed(lambda fns: '+'.join(fns))(files)}
+        shared = tilecache.shared_tiles('test-inputs', 'ns', tiles, inputs=files)
+        self.assertEqual(shared[(0, 0)].compute(), 'a.zip+b.zip')
+        self.assertEqual(sorted(calls), ['a', 'b'])
+
+    def test_shared_tiles_from_shared_tiles(self):
+        # DEM tiles used by several geocoded tiles are outer-graph inputs, computed once:
+        calls = []
+
+        @dask.delayed
+        def dem(index):
+            calls.append(index)
+            return index
+
+        dem_tiles = tilecache.shared_tiles('test-dem', 'ns', {(0, 0): dem((0, 0)), (0, 1): dem((0, 1))})
+        tiles = {
+            (0, 0): dask.delayed(lambda a: ('gec', a))(dem_tiles[(0, 0)]),
+            (0, 1): dask.delayed(lambda a, b: ('gec', a, b))(dem_tiles[(0, 0)], dem_tiles[(0, 1)]),
+        }
+        shared = tilecache.shared_tiles('test-gec', 'ns', tiles, inputs=list(dem_tiles.values()))
+        graph = dict(dask.delayed(list)(list(shared.values())).__dask_graph__())
+        self.assertTrue(all(key in graph for key in (d.key for d in dem_tiles.values())))
+        self.assertEqual(dask.compute(shared)[0], {(0, 0): ('gec', (0, 0)), (0, 1): ('gec', (0, 0), (0, 1))})
+        self.assertEqual(sorted(calls), [(0, 0), (0, 1)])
+
+    def test_cached_inputs(self):
+        # Downloads are outer-graph inputs, one task per key, unless all tiles were cached when planned:
+        calls = []
+
+        @dask.delayed
+        def download(name):
+            calls.append(name)
+            return f'{name}.zip'
+
+        def graph(namespace):
+            files = [download(name, dask_key_name=f'download-{name}') for name in ('a', 'b')]
+            tiles = {(0, 0): dask.delayed(lambda fns: '+'.join(fns))(files), (0, 1): dask.delayed(lambda fns: fns[0])(files)}
+            inputs = [] if tilecache.cached('test-cached', namespace, tiles) else files
+            return tilecache.shared_tiles('test-cached', namespace, tiles, inputs=inputs), inputs
+
+        expected = {(0, 0): 'a.zip+b.zip', (0, 1): 'a.zip'}
+        shared, inputs = graph('ns')
+        self.assertEqual(len(inputs), 2)
+        self.assertEqual(dask.compute(shared)[0], expected)
+        self.assertEqual(sorted(calls), ['a', 'b'])
+        shared, inputs = graph('ns')
+        self.assertEqual(inputs, [])
+        self.assertEqual(dask.compute(shared)[0], expected)
+        self.assertEqual(sorted(calls), ['a', 'b'])
+
+        # Tiles evicted after planning are computed with their downloads in the tile task:
+        del calls[:]
+        with mock.patch.object(tilecache.TileCache, 'contains', return_value=True):
+            shared, inputs = graph('other')
+        self.assertEqual(dask.compute(shared)[0], expected)
+        self.assertEqual(sorted(calls), ['a', 'a', 'b', 'b'])
+
+    def test_groups_sharing_a_product(self):
+        # Acquisitions sharing a product (e.g. of pairs and stacks differing otherwise) download it in one
+        # download-{pid} task:
+        calls = []
+
+        def download(prod, download_folder, fetch_config=None):
+            calls.append(prod['fileID'])
+            return os.path.join(download_folder, prod['fileName'])
+
+        prods = {pid: {'fileID': pid, 'fileName': f'{pid}.zip'} for pid in ('p1', 'p2', 'p3')}
+        groups = [[prods['p1'], prods['p2']], [prods['p2'], prods['p3']]]
+        with mock.patch.object(downloads, '_download', download):
+            files = [downloads._downloads(group, download_folder='/data') for group in groups]
+            tiles = [
+                tilecache.shared_tiles('test-groups', [p['fileID'] for p in group], {(0, 0): dask.delayed(list)(fns)}, inputs=fns)
+                for group, fns in zip(groups, files)
+            ]
+            graph = dict(dask.delayed(list)(tiles).__dask_graph__())
+            self.assertEqual(sorted(k for k in graph if str(k).startswith('download-')), ['download-p1', 'download-p2', 'download-p3'])
+            res = dask.compute(tiles)[0]
+        self.assertEqual([r[(0, 0)] for r in res], [['/data/p1.zip', '/data/p2.zip'], ['/data/p2.zip', '/data/p3.zip']])
+        self.assertEqual(sorted(calls), ['p1', 'p2', 'p3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
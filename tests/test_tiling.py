@@ -0,0 +1,27 @@
+import unittest
+
+import sys
+sys.path.append('../')
+
+from skreddata import tiling
+
+
+class TestTiling(unittest.TestCase):
+    def test_cropped_tile_shape(self):
+        # Power-of-two tiles of about half the image shape, between 256 and 2048:
+        self.assertEqual(tiling.cropped_tile_shape((1024, 1024)), (512, 512))
+        self.assertEqual(tiling.cropped_tile_shape((1023, 1025)), (256, 512))
+        self.assertEqual(tiling.cropped_tile_shape((4096, 4095)), (2048, 1024))
+        self.assertEqual(tiling.cropped_tile_shape((1024, 300)), (512, 256))
+
+    def test_cropped_tile_shape_limits(self):
+        # Small (and empty) images get the smallest tiles, large ones full tiles:
+        for c in (0, 1, 2, 100, 511, 512, 513, 1023):
+            self.assertEqual(tiling.cropped_tile_shape((c, c)), tiling.MIN_CROP_TILE_SHAPE)
+        for c in (4096, 8192, 100_000):
+            self.assertEqual(tiling.cropped_tile_shape((c, c)), tiling.TILE_SHAPE)
+        self.assertEqual(tiling.cropped_tile_shape((1024, 1024)), tuple(t//4 for t in tiling.TILE_SHAPE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+import tempfile
+import os
+from unittest import mock
+import numpy as np
+
+import sys
+sys.path.append('../')
+
+from skreddata import writers, storage
+from test_stack import write_tif
+
+
+def mosaic_tiles(tiles, mosaicing_kws=None):
+    # Tiles side by side in one row, in place of gtile's mosaic onto the grid:
+    return np.concatenate([tiles[k] for k in sorted(tiles)], axis=1)
+
+
+def merge_pair(mosaic_pair):
+    dtype = np.dtype([(f'{n}_{i}', dr.dtype[n]) for i, dr in enumerate(mosaic_pair) for n in dr.dtype.names])
+    out = np.empty(mosaic_pair[0].shape, dtype=dtype)
+    for i, dr in enumerate(mosaic_pair):
+        for n in dr.dtype.names:
+            out[f'{n}_{i}'] = dr[n]
+    return out
+
+
+def to_bands(dr):
+    return np.stack([dr[n] for n in dr.dtype.names])
+
+
+def write_crs(dr, fn):
+    return write_tif(fn, np.stack([dr[n] for n in dr.dtype.names]))
+
+
+def tiles(value):
+    tile = np.empty((16, 8), dtype=[('VV', np.float32), ('VH', np.float32)])
+    tile['VV'], tile['VH'] = value, -value
+    return {(0, 0): tile, (0, 1): tile.copy()}
+
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp.name, 'a'))
+        self.patch = mock.patch.multiple(writers, mosaic_tiles=mosaic_tiles, merge_pair=merge_pair, to_bands=to_bands,
+            write_crs=write_crs)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+    def test_write_pair(self):
+        import rasterio
+        for output_format in ('gtiff', 'zarr'):
+            fn = writers.write_pair([tiles(1), tiles(2)], storage.sample_path(self.tmp.name, 'a', 'crs', output_format),
+                grid=None, output_format=output_format)
+            self.assertEqual(storage.read_shape(fn), (4, 16, 16))
+            if output_format == 'gtiff':
+                with rasterio.open(fn) as ds:
+                    self.assertEqual(ds.read()[:, 0, 0].tolist(), [1, -1, 2, -2])
+
+    def test_write_dem(self):
+        fn = writers.write_dem(tiles(1), storage.sample_path(self.tmp.name, 'a', 'dem'), grid=None)
+        self.assertEqual(storage.read_shape(fn), (2, 16, 16))
+
+    def test_write_date(self):
+        # Dates written in any order into one cube, with the raster attributes of the DEM:
+        dem = writers.write_dem(tiles(0), storage.sample_path(self.tmp.name, 'a', 'dem'), grid=None)
+        fn = storage.stack_path(self.tmp.name, 'a')
+        for t in (2, 0, 1):
+            writers.write_date(tiles(t), fn, t, 3, grid=None)
+        self.assertFalse(os.path.exists(fn))
+        storage.finish_stack(fn, attrs={'pairs': [[0, 1]]}, like=dem)
+        self.assertEqual(storage.read_shape(fn), (3, 2, 16, 16))
+        np.testing.assert_array_equal(storage.read_pair_view(fn, 0, 2)[:, 0, 0], [0, 0, 2, -2])
+        attrs = storage.read_stack_attrs(fn)
+        self.assertEqual(attrs['band_names'], ['VV', 'VH'])
+        self.assertEqual(attrs['pairs'], [[0, 1]])
+        self.assertIsNotNone(attrs['crs'])
+        # No temporary files are left (single-date GeoTIFFs, the unfinished cube or its lock):
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp.name, 'a'))), ['a_dem.tif', 'a_stack.zarr'])
+
+    def test_write_date_shape(self):
+        fn = storage.stack_path(self.tmp.name, 'a')
+        writers.write_date(tiles(0), fn, 0, 3, grid=None)
+        with self.assertRaises(Exception):
+            writers.write_date({(0, 0): tiles(1)[(0, 0)]}, fn, 1, 3, grid=None)
+
+
+if __name__ == '__main__':
+    unittest.main()